@@ -0,0 +1,479 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from state import atomic_write, root_path
+
+# =====================================================
+# CONFIGURATION
+# =====================================================
+
+# ALERT_SINKS is a comma-separated list of sinks:
+#   jsonl:alert_outbox/alerts.jsonl        rotating JSON lines
+#   cef:alert_outbox/alerts.cef            rotating CEF lines
+#   syslog:127.0.0.1:514 | syslog:/dev/log CEF over syslog (UDP / unix socket)
+#   webhook:http://127.0.0.1:8099/alerts   JSON POST, {"alerts": [...]}
+# Each sink gets a bounded queue and a worker thread. publish() never
+# blocks: records that do not fit are dropped and counted. Workers send in
+# batches and retry with exponential backoff; batches that still fail go
+# to DEAD_LETTER. Relative file targets resolve against the data root
+# passed to parse_sinks (the working directory by default).
+
+OUTBOX_DIR = "alert_outbox"
+DEAD_LETTER = os.path.join(OUTBOX_DIR, "dead_letter.jsonl")
+METRICS_FILE = os.path.join(OUTBOX_DIR, "sink_metrics.json")
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0            # seconds a partial batch waits
+MAX_RETRIES = 5
+BACKOFF = 0.5                   # first retry delay, doubled each attempt
+MAX_BACKOFF = 30.0
+
+MAX_BYTES = 10 * 1024 * 1024    # rotate files at 10 MB
+BACKUPS = 5
+
+CEF_SEVERITY = {"escalated": 9, "new": 8}
+SYSLOG_FACILITY = 20            # local4
+
+# =====================================================
+# RECORDS
+# =====================================================
+
+def alert_records(final_df, rows, thresholds, month, day, version, shap_matrix=None, feature_columns=None, top=5):
+    # One dict per row of final_df (positional index, as in the dashboards);
+    # the first len(shap_matrix) rows are the explained ones and carry
+    # their top drivers
+    date = datetime.strptime(month, "%b_%Y").replace(day=day).date().isoformat()
+    rows = np.asarray(rows)
+    subset = final_df.loc[rows]
+    peer_groups = subset["peer_group"].tolist() if "peer_group" in subset else [None] * len(rows)
+
+    records = []
+    for i, (user, score, threshold, status, hits, group) in enumerate(zip(
+        subset["user"], subset["anomaly_score"], np.asarray(thresholds)[rows],
+        subset["alert_status"], subset["rule_hits"], peer_groups
+    )):
+        record = {
+            "user": str(user),
+            "date": date,
+            "anomaly_score": float(score),
+            "threshold": float(threshold),
+            "alert_status": status,
+            "rule_hits": hits,
+            "peer_group": group,
+            "model_version": version,
+        }
+        if shap_matrix is not None and i < len(shap_matrix):
+            order = np.argsort(-np.abs(shap_matrix[i]))[:top]
+            record["drivers"] = [feature_columns[j] for j in order]
+        records.append(record)
+    return records
+
+
+def cef_escape(value, header=False):
+    value = str(value).replace("\\", "\\\\")
+    if header:
+        return value.replace("|", "\\|")
+    return value.replace("=", "\\=").replace("\n", " ")
+
+
+def cef_line(record):
+    header = [
+        "CEF:0", "InsiderThreat", "AnomalyMonitor", record.get("model_version") or "none",
+        record["alert_status"], "Anomalous user activity",
+        str(CEF_SEVERITY.get(record["alert_status"], 5))
+    ]
+    extension = {
+        "suser": record["user"],
+        "rt": record["date"],
+        "cfp1": f"{record['anomaly_score']:.6f}",
+        "cfp1Label": "anomalyScore",
+        "cs1": record["rule_hits"],
+        "cs1Label": "ruleHits",
+        "cs2": ",".join(record.get("drivers", [])),
+        "cs2Label": "topDrivers",
+    }
+    if record.get("peer_group") is not None:
+        extension.update({"cs3": record["peer_group"], "cs3Label": "peerGroup"})
+    return (
+        "|".join(cef_escape(h, header=True) for h in header) + "|"
+        + " ".join(f"{k}={cef_escape(v)}" for k, v in extension.items())
+    )
+
+# =====================================================
+# SINKS
+# =====================================================
+
+class RotatingFile:
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def write(self, lines):
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            self.rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class JsonlSink:
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.name = f"jsonl:{path}"
+        self.file = RotatingFile(path, max_bytes, backups)
+
+    def send(self, batch):
+        self.file.write([json.dumps(record, default=str) for record in batch])
+
+
+class CefSink:
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.name = f"cef:{path}"
+        self.file = RotatingFile(path, max_bytes, backups)
+
+    def send(self, batch):
+        self.file.write([cef_line(record) for record in batch])
+
+
+class SyslogSink:
+
+    def __init__(self, address):
+        # "host:port" (UDP) or a unix socket path such as /dev/log
+        self.name = f"syslog:{address}"
+        if address.startswith("/"):
+            self.address = address
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        else:
+            host, _, port = address.rpartition(":")
+            self.address = (host or "127.0.0.1", int(port or 514))
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.hostname = socket.gethostname()
+
+    def send(self, batch):
+        stamp = datetime.now().strftime("%b %d %H:%M:%S")
+        for record in batch:
+            level = 2 if record["alert_status"] == "escalated" else 3     # crit / err
+            message = f"<{SYSLOG_FACILITY * 8 + level}>{stamp} {self.hostname} anomaly_monitor: {cef_line(record)}"
+            self.sock.sendto(message.encode("utf-8"), self.address)
+
+
+class WebhookSink:
+
+    def __init__(self, url, timeout=5.0):
+        self.name = f"webhook:{url}"
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, batch):
+        body = json.dumps({"alerts": batch}, default=str).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        # urlopen raises on 4xx / 5xx, which counts as a failed attempt
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+SINK_TYPES = {"jsonl": JsonlSink, "cef": CefSink, "syslog": SyslogSink, "webhook": WebhookSink}
+
+
+FILE_SINKS = {"jsonl", "cef"}
+
+
+def parse_sinks(spec, root=None):
+    sinks = []
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        kind, _, target = item.partition(":")
+        if kind not in SINK_TYPES or not target:
+            raise ValueError(f"Unknown alert sink: {item}")
+        sinks.append(SINK_TYPES[kind](root_path(root, target) if kind in FILE_SINKS else target))
+    return sinks
+
+# =====================================================
+# DELIVERY (ONE WORKER THREAD PER SINK)
+# =====================================================
+
+class SinkWorker(threading.Thread):
+
+    def __init__(self, sink, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_retries=MAX_RETRIES, backoff=BACKOFF,
+                 dead_letter_path=DEAD_LETTER):
+        super().__init__(name=f"sink-{sink.name}", daemon=True)
+        self.sink = sink
+        self.dead_letter_path = dead_letter_path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.closing = threading.Event()
+
+        self.lock = threading.Lock()
+        self.counts = {"queued": 0, "delivered": 0, "dropped": 0, "failed": 0, "retries": 0, "batches": 0}
+        self.latencies = deque(maxlen=1000)
+        self.last_error = None
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def offer(self, records):
+        # Called on the scoring thread: never waits on the sink
+        accepted = 0
+        for record in records:
+            try:
+                self.queue.put_nowait(record)
+                accepted += 1
+            except queue.Full:
+                break
+        self.count("queued", accepted)
+        self.count("dropped", len(records) - accepted)
+        return accepted
+
+    def next_batch(self):
+        # Wait for a first record, then fill the batch until it is full or
+        # the flush interval has passed
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get_nowait() if self.closing.is_set() or remaining <= 0
+                             else self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def deliver(self, batch):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.sink.send(batch)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if attempt == self.max_retries:
+                    break
+                self.count("retries")
+                # Full jitter keeps several workers from retrying in step;
+                # a shutdown cuts the wait short
+                delay = min(self.backoff * 2 ** attempt, MAX_BACKOFF)
+                self.closing.wait(random.uniform(0, delay))
+                continue
+            self.latencies.append(time.perf_counter() - start)
+            self.count("delivered", len(batch))
+            self.count("batches")
+            return True
+
+        self.count("failed", len(batch))
+        dead_letter(self.sink.name, batch, self.last_error, self.dead_letter_path)
+        return False
+
+    def run(self):
+        while not (self.closing.is_set() and self.queue.empty()):
+            batch = self.next_batch()
+            if batch:
+                self.deliver(batch)
+
+    def metrics(self):
+        with self.lock:
+            report = {"sink": self.sink.name, **self.counts}
+        report["pending"] = self.queue.qsize()
+        report["last_error"] = self.last_error
+        latencies = np.asarray(self.latencies) * 1000
+        if len(latencies) > 0:
+            report["batch_ms_mean"] = float(latencies.mean())
+            report["batch_ms_p95"] = float(np.percentile(latencies, 95))
+        return report
+
+
+SINK_COUNTERS = ["queued", "delivered", "dropped", "failed", "retries"]
+
+_dead_letter_lock = threading.Lock()
+
+
+def dead_letter(sink_name, batch, error, path=DEAD_LETTER):
+    with _dead_letter_lock:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for record in batch:
+                f.write(json.dumps({"sink": sink_name, "error": error, "record": record}, default=str) + "\n")
+
+
+class AlertDispatcher:
+
+    def __init__(self, sinks, metrics_path=METRICS_FILE, dead_letter_path=DEAD_LETTER, **options):
+        self.metrics_path = metrics_path
+        self.workers = [SinkWorker(sink, dead_letter_path=dead_letter_path, **options) for sink in sinks]
+        self.recorded = {}      # sink -> counts already added to the registry
+        self.recorded_lock = threading.Lock()
+        for worker in self.workers:
+            worker.start()
+        # Flush what is queued when the process exits (engine runs)
+        atexit.register(self.close)
+
+    def __bool__(self):
+        return bool(self.workers)
+
+    def publish(self, records):
+        for worker in self.workers:
+            worker.offer(records)
+
+    def metrics(self):
+        return [worker.metrics() for worker in self.workers]
+
+    def write_metrics(self, path=None):
+        with atomic_write(path or self.metrics_path, "w") as f:
+            json.dump({"updated": time.time(), "sinks": self.metrics()}, f, indent=2)
+
+    def record_metrics(self, telemetry):
+        # insider_sink_* in a metrics.py registry: counters grow by what
+        # each sink did since the last call, pending is a gauge
+        with self.recorded_lock:
+            for report in self.metrics():
+                sink = report["sink"]
+                last = self.recorded.get(sink, {})
+                for key in SINK_COUNTERS:
+                    telemetry.inc(f"insider_sink_{key}_total", report[key] - last.get(key, 0), sink=sink)
+                telemetry.set("insider_sink_pending", report["pending"], sink=sink)
+                self.recorded[sink] = {key: report[key] for key in SINK_COUNTERS}
+
+    def close(self, timeout=10.0):
+        for worker in self.workers:
+            worker.closing.set()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        if self.workers:
+            self.write_metrics()
+
+
+def from_environment():
+    return AlertDispatcher(parse_sinks(os.environ.get("ALERT_SINKS", "")))
+
+
+def read_metrics(path=METRICS_FILE):
+    # Last snapshot written by a dispatcher, or None
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+# =====================================================
+# LOCAL WEBHOOK STUB
+# =====================================================
+
+def stub_server(host, port, out_path, delay=0.0, fail_rate=0.0):
+    # Stand-in for a SIEM collector: appends each batch to out_path, can be
+    # slowed down or made to fail to exercise backoff and backpressure
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            if random.random() < fail_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            alerts = json.loads(body)["alerts"]
+            with lock, open(out_path, "a", encoding="utf-8") as f:
+                for record in alerts:
+                    f.write(json.dumps(record) + "\n")
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def bench(spec, alerts, days, interval, **options):
+    dispatcher = AlertDispatcher(parse_sinks(spec), **options)
+    per_day = max(alerts // days, 1)
+    publish_times = []
+
+    for day in range(days):
+        records = [
+            {"user": f"U{day}_{i}", "date": f"day_{day}", "anomaly_score": -0.1, "threshold": -0.05,
+             "alert_status": "new", "rule_hits": "", "peer_group": None, "model_version": "bench"}
+            for i in range(per_day)
+        ]
+        start = time.perf_counter()
+        dispatcher.publish(records)
+        publish_times.append(time.perf_counter() - start)
+        time.sleep(interval)
+
+    print(f"📤 publish: {np.mean(publish_times) * 1000:.2f} ms mean per {per_day}-alert day "
+          f"(max {np.max(publish_times) * 1000:.2f} ms)")
+    start = time.perf_counter()
+    dispatcher.close()
+    print(f"⏳ drained in {time.perf_counter() - start:.2f} s")
+    for report in dispatcher.metrics():
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alert delivery to SIEM stand-ins")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stub_cmd = sub.add_parser("stub", help="local webhook collector")
+    stub_cmd.add_argument("--host", default="127.0.0.1")
+    stub_cmd.add_argument("--port", type=int, default=8099)
+    stub_cmd.add_argument("--out", default=os.path.join(OUTBOX_DIR, "webhook_received.jsonl"))
+    stub_cmd.add_argument("--delay", type=float, default=0.0, help="seconds per request")
+    stub_cmd.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered 503")
+
+    bench_cmd = sub.add_parser("bench", help="push synthetic alerts through sinks")
+    bench_cmd.add_argument("--sinks", default=os.environ.get("ALERT_SINKS", ""))
+    bench_cmd.add_argument("--alerts", type=int, default=20000)
+    bench_cmd.add_argument("--days", type=int, default=20)
+    bench_cmd.add_argument("--interval", type=float, default=0.1, help="seconds between days")
+    bench_cmd.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    bench_cmd.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    sub.add_parser("metrics", help="last metrics written by a dispatcher")
+
+    args = parser.parse_args()
+
+    if args.command == "stub":
+        server = stub_server(args.host, args.port, args.out, args.delay, args.fail_rate)
+        print(f"🛰️ Webhook stub on http://{args.host}:{args.port}/ → {args.out}")
+        server.serve_forever()
+    elif args.command == "bench":
+        bench(args.sinks, args.alerts, args.days, args.interval, queue_size=args.queue_size, batch_size=args.batch_size)
+    else:
+        snapshot = read_metrics()
+        if snapshot is None:
+            print("⚠️ No delivery metrics yet")
+        else:
+            print(json.dumps(snapshot, indent=2))
@@ -0,0 +1,187 @@
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from state import Workspace, atomic_write, file_lock
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# <workspace>/alert_state.npz, one slot per user code (row of `users`):
+#   first_seen, last_seen, notified_on   day numbers (date ordinal, 0 = never)
+#   peak_score                           lowest score while alerting
+#   active, acknowledged, suppressed     bool masks
+# A day's alerts are reconciled against it with vectorized mask operations;
+# only new and escalated alerts are passed on for SHAP and logging.
+
+STATE_FILE = "alert_state.npz"
+ESCALATION_MARGIN = 0.02        # decision_function drop below the peak
+
+STATUS_NEW = "new"
+STATUS_ESCALATED = "escalated"
+STATUS_ONGOING = "ongoing"
+STATUS_ACKNOWLEDGED = "acknowledged"
+STATUS_SUPPRESSED = "suppressed"
+
+
+def day_number(month, day):
+    # month: "mar_2026"
+    return datetime.strptime(month, "%b_%Y").replace(day=day).toordinal()
+
+
+class AlertState:
+
+    INT_FIELDS = ["first_seen", "last_seen", "notified_on"]
+    BOOL_FIELDS = ["active", "acknowledged", "suppressed"]
+
+    def __init__(self):
+        self.users = pd.Index([], dtype=object)
+        for name in self.INT_FIELDS:
+            setattr(self, name, np.zeros(0, dtype=np.int32))
+        for name in self.BOOL_FIELDS:
+            setattr(self, name, np.zeros(0, dtype=bool))
+        self.peak_score = np.zeros(0)
+        self.last_day = 0
+
+    def codes(self, users):
+        # User codes, allocating slots for unseen users
+        new = pd.Index(users).difference(self.users)
+        if len(new) > 0:
+            self.users = self.users.append(new)
+            for name in self.INT_FIELDS:
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(len(new), dtype=np.int32)]))
+            for name in self.BOOL_FIELDS:
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(len(new), dtype=bool)]))
+            self.peak_score = np.concatenate([self.peak_score, np.full(len(new), np.inf)])
+        return self.users.get_indexer(users)
+
+    def reconcile(self, users, scores, flagged, day, margin=ESCALATION_MARGIN):
+        # Returns (status per row, notify mask). Re-running a day already
+        # reconciled returns the same notifications without changing state.
+        codes = self.codes(users)
+        scores = np.asarray(scores, dtype=np.float64)
+        flagged = np.asarray(flagged, dtype=bool)
+
+        if day <= self.last_day:
+            notify = flagged & (self.notified_on[codes] == day)
+            return self._status(codes, flagged, notify), notify
+
+        was_active = self.active[codes]
+        new = flagged & ~was_active
+        escalated = flagged & was_active & (scores < self.peak_score[codes] - margin)
+        # Acknowledged alerts stop escalating until they close; suppressed
+        # users stay quiet until unsuppressed
+        notify = (new | (escalated & ~self.acknowledged[codes])) & ~self.suppressed[codes]
+
+        hit = codes[flagged]
+        self.first_seen[hit[self.first_seen[hit] == 0]] = day
+        self.last_seen[hit] = day
+        self.peak_score[codes[new]] = np.inf
+        self.peak_score[hit] = np.minimum(self.peak_score[hit], scores[flagged])
+        self.notified_on[codes[notify]] = day
+
+        # Users that stop alerting (or are absent today) close their alert,
+        # and an acknowledgement only covers the alert it was given for
+        self.active[:] = False
+        self.active[hit] = True
+        self.acknowledged &= self.active
+
+        self.last_day = day
+        return self._status(codes, flagged, notify, new, escalated), notify
+
+    def _status(self, codes, flagged, notify, new=None, escalated=None):
+        status = np.full(len(codes), "", dtype=object)
+        status[flagged] = STATUS_ONGOING
+        status[flagged & self.acknowledged[codes]] = STATUS_ACKNOWLEDGED
+        status[flagged & self.suppressed[codes]] = STATUS_SUPPRESSED
+        if new is None:
+            # Replayed day: only the notified rows can be told apart
+            status[notify] = STATUS_NEW
+        else:
+            status[notify & new] = STATUS_NEW
+            status[notify & escalated] = STATUS_ESCALATED
+        return status
+
+    def set_flag(self, users, name, value=True):
+        # codes() first: allocating slots for unseen users replaces the arrays
+        codes = self.codes(users)
+        getattr(self, name)[codes] = value
+
+    def frame(self):
+        seen = self.first_seen > 0
+        df = pd.DataFrame({
+            "user": self.users[seen],
+            "first_seen": [datetime.fromordinal(d).date() for d in self.first_seen[seen]],
+            "last_seen": [datetime.fromordinal(d).date() for d in self.last_seen[seen]],
+            "peak_score": self.peak_score[seen],
+            "active": self.active[seen],
+            "acknowledged": self.acknowledged[seen],
+            "suppressed": self.suppressed[seen],
+        })
+        return df.sort_values("peak_score")
+
+    # -------------------------------------------------
+    # PERSISTENCE
+    # -------------------------------------------------
+
+    def save(self, path):
+        with atomic_write(path) as f:
+            np.savez(
+                f,
+                users=self.users.to_numpy().astype(str),
+                peak_score=self.peak_score,
+                last_day=self.last_day,
+                **{name: getattr(self, name) for name in self.INT_FIELDS + self.BOOL_FIELDS}
+            )
+
+    @classmethod
+    def load(cls, path):
+        state = cls()
+        try:
+            data = np.load(path)
+        except FileNotFoundError:
+            return state
+        with data:
+            state.users = pd.Index(data["users"].astype(object))
+            state.peak_score = data["peak_score"]
+            state.last_day = int(data["last_day"])
+            for name in cls.INT_FIELDS + cls.BOOL_FIELDS:
+                setattr(state, name, data[name])
+        return state
+
+# =====================================================
+# WORKSPACE STATE
+# =====================================================
+
+def reconcile_alerts(workspace, users, scores, flagged, month, day):
+    path = workspace.path(STATE_FILE)
+    with file_lock(path):
+        state = AlertState.load(path)
+        status, notify = state.reconcile(users, scores, flagged, day_number(month, day))
+        state.save(path)
+    return status, notify
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and manage alert state")
+    parser.add_argument("--workspace", default=None)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="every user that has alerted")
+    for command in ["ack", "suppress", "unsuppress"]:
+        sub.add_parser(command).add_argument("users", nargs="+")
+    args = parser.parse_args()
+
+    path = Workspace(args.workspace).path(STATE_FILE)
+
+    if args.command == "list":
+        print(AlertState.load(path).frame().to_string(index=False))
+    else:
+        with file_lock(path):
+            state = AlertState.load(path)
+            if args.command == "ack":
+                state.set_flag(args.users, "acknowledged")
+            else:
+                state.set_flag(args.users, "suppressed", args.command == "suppress")
+            state.save(path)
+        print(f"✅ {args.command}: {', '.join(args.users)}")
@@ -1,11 +1,10 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import joblib
 import os
-from glob import glob
-from datetime import datetime
-import shap
+from alert_sinks import METRICS_FILE, read_metrics
+from scoring import ScoringBackend, day_files, month_folders, month_label
+from state import root_path
+from tenants import load_tenants
 
 st.set_page_config(page_title="Insider Threat Dashboard", page_icon="🔐", layout="wide")
 st.markdown("""
@@ -27,77 +26,76 @@ h1,h2,h3,h4,h5,p,span{color:var(--text)!important}
 """, unsafe_allow_html=True)
 
 # =====================================================
-# AUTO-DETECT MONTHS
+# ORGANISATION (tenants.json, see tenants.py)
 # =====================================================
 
-def parse_month(folder):
-    name = folder.replace("_email", "")
-    return datetime.strptime(name, "%b_%Y")
+def reset_selection():
+    for key in ["month_index", "day", "baseline_exists", "scored_day"]:
+        st.session_state.pop(key, None)
+
+tenants = load_tenants()
+tenant = None
+if tenants:
+    tenant = tenants[st.sidebar.selectbox("Organisation", list(tenants), key="tenant", on_change=reset_selection)]
+root = tenant.root if tenant else None
+
+# =====================================================
+# AUTO-DETECT MONTHS
+# =====================================================
 
-email_months = sorted(glob("*_email"), key=parse_month)
+email_months = month_folders(root)
 
 if not email_months:
     st.error("No month folders detected.")
     st.stop()
 
 # =====================================================
-# SESSION STATE INIT
+# SESSION STATE INIT (UI SELECTIONS ONLY)
 # =====================================================
 
-for key in ["month_index", "day", "baseline_exists",
-            "final_df", "alerts", "X_scaled"]:
+for key in ["month_index", "day", "baseline_exists", "scored_day"]:
     if key not in st.session_state:
         st.session_state[key] = 0 if key in ["month_index", "day"] else None
 
 if st.session_state.day == 0:
     st.session_state.day = 1
 
+# =====================================================
+# SHARED SCORING BACKEND (ONE PER PROCESS AND TENANT)
+# =====================================================
+
+@st.cache_resource
+def load_backend(root=None, job="dashboard"):
+    return ScoringBackend(root=root, job=job)
+
+backend = load_backend(root, f"dashboard_{tenant.name}" if tenant else "dashboard")
+
 # =====================================================
 # CURRENT MONTH
 # =====================================================
 
+if st.session_state.month_index >= len(email_months):
+    st.success("🎉 All Months Processed")
+    if st.button("🔄 Reset Engine"):
+        st.session_state.clear()
+        st.rerun()
+    st.stop()
+
 current_month_folder = email_months[st.session_state.month_index]
-current_month = current_month_folder.replace("_email", "")
-usb_folder = f"{current_month}_usbfiles"
+current_month = month_label(current_month_folder)
 
 st.sidebar.title("Controls")
-month_labels = [f.replace("_email", "") for f in email_months]
+month_labels = [month_label(f) for f in email_months]
 selected_month = st.sidebar.selectbox("Month", month_labels, index=st.session_state.month_index)
 if selected_month != current_month:
     new_index = month_labels.index(selected_month)
     st.session_state.month_index = new_index
     st.session_state.day = 1
-    st.session_state.final_df = None
-    st.session_state.alerts = None
-    st.session_state.X_scaled = None
-    if os.path.exists("email_cumulative.csv"):
-        os.remove("email_cumulative.csv")
-    if os.path.exists("usb_cumulative.csv"):
-        os.remove("usb_cumulative.csv")
-    st.experimental_rerun()
-
-st.markdown(f"<div class='header'><div class='title'>Insider Risk Dashboard</div><div class='badge'>Month: {current_month} • Day {st.session_state.day}</div></div>", unsafe_allow_html=True)
-
-# =====================================================
-# SAFE LOADER
-# =====================================================
-
-def safe_read(path, cols):
-    if not os.path.exists(path):
-        return pd.DataFrame(columns=cols)
-    if os.path.getsize(path) <= 2:
-        return pd.DataFrame(columns=cols)
-    return pd.read_csv(path)
-
-EMAIL_COLUMNS = [
-    "user","total_emails","external_emails",
-    "attachments_sent","bcc_in_email","avg_email_size"
-]
+    st.session_state.scored_day = None
+    st.rerun()
 
-USB_COLUMNS = [
-    "user","usb_insertions",
-    "files_accessed","sensitive_files_accessed"
-]
+organisation = f"{tenant.name} • " if tenant else ""
+st.markdown(f"<div class='header'><div class='title'>Insider Risk Dashboard</div><div class='badge'>{organisation}Month: {current_month} • Day {st.session_state.day}</div></div>", unsafe_allow_html=True)
 
 # =====================================================
 # NEXT DAY BUTTON
@@ -111,112 +109,52 @@ if next_day:
 
     day = st.session_state.day
 
-    email_file = os.path.join(current_month_folder, f"email_{day}.csv")
-    usb_file = os.path.join(usb_folder, f"usbfile_{day}.csv")
+    email_file, usb_file = day_files(current_month_folder, day)
 
     if not os.path.exists(email_file):
 
         st.info("📅 Month Completed — retraining if data exists")
 
-        if os.path.exists("email_cumulative.csv"):
-            os.system("python make_model_repeated.py")
+        # Shared: the first session to finish the month retrains for all
+        if day > 1:
+            backend.retrain(current_month_folder)
             st.session_state.baseline_exists = True
 
         st.session_state.month_index += 1
         st.session_state.day = 1
-
-        if os.path.exists("email_cumulative.csv"):
-            os.remove("email_cumulative.csv")
-        if os.path.exists("usb_cumulative.csv"):
-            os.remove("usb_cumulative.csv")
+        st.session_state.scored_day = None
 
         st.rerun()
 
-    email_daily = pd.read_csv(email_file)
-    usb_daily = pd.read_csv(usb_file)
-
-    email_cum = safe_read("email_cumulative.csv", EMAIL_COLUMNS)
-    usb_cum = safe_read("usb_cumulative.csv", USB_COLUMNS)
-
-    email_cum = pd.concat([email_cum, email_daily])
-    usb_cum = pd.concat([usb_cum, usb_daily])
-
-    email_cum.to_csv("email_cumulative.csv", index=False)
-    usb_cum.to_csv("usb_cumulative.csv", index=False)
-
     if not st.session_state.baseline_exists:
         st.session_state.day += 1
         st.warning("⏳ Baseline Month — Accumulating Data Only")
         st.rerun()
 
-    model = joblib.load("baseline_model.pkl")
-    scaler = joblib.load("baseline_scaler.pkl")
-    feature_columns = joblib.load("baseline_features.pkl")
-    threshold = np.load("relative_threshold.npy")
-
-    usb_agg = usb_cum.groupby("user").sum().reset_index()
-    email_agg = email_cum.groupby("user").sum().reset_index()
-
-    final_df = usb_agg.merge(email_agg, on="user", how="outer")
-    final_df.fillna(0, inplace=True)
-
-    for col in feature_columns:
-        if col not in final_df.columns:
-            final_df[col] = 0
-
-    X = final_df[feature_columns]
-    X_scaled = scaler.transform(X)
-
-    scores = model.decision_function(X_scaled)
-    final_df["anomaly_score"] = scores
-
-    final_df["FLAG"] = np.where(
-        final_df["anomaly_score"] <= threshold,
-        "🚨 ALERT",
-        "✅ SAFE"
-    )
-
-    alerts = final_df[final_df["anomaly_score"] <= threshold]
-
-    st.session_state.final_df = final_df
-    st.session_state.alerts = alerts
-    st.session_state.X_scaled = X_scaled
+    # Scored once per process; every session on this day reads the same result
+    backend.score_day(current_month_folder, day)
 
+    st.session_state.scored_day = (current_month_folder, day)
     st.session_state.day += 1
 
 # =====================================================
 # DISPLAY RESULTS
 # =====================================================
 
-if st.session_state.final_df is not None:
-
-    final_df = st.session_state.final_df
-    alerts = st.session_state.alerts
-    X_scaled = st.session_state.X_scaled
-    threshold = np.load("relative_threshold.npy")
-    if len(final_df) > 0:
-        q25 = float(final_df["anomaly_score"].quantile(0.25))
-        q10 = float(final_df["anomaly_score"].quantile(0.10))
-        def _sev(s):
-            if s <= float(threshold):
-                return "Critical"
-            elif s <= q10:
-                return "High"
-            elif s <= q25:
-                return "Elevated"
-            else:
-                return "Normal"
-        final_df["severity"] = final_df["anomaly_score"].apply(_sev)
-    else:
-        final_df["severity"] = "Normal"
+if st.session_state.scored_day is not None:
+
+    result = backend.score_day(*st.session_state.scored_day)
+    final_df = result.final_df
+    alerts = result.alerts
 
     st.success("Day processed")
 
-    col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4, col5 = st.columns(5)
     col1.metric("Total Users", len(final_df))
     col2.metric("Critical Alerts", int((final_df["severity"]=="Critical").sum()))
     col3.metric("At Risk (High+Elevated)", int((final_df["severity"].isin(["High","Elevated"])).sum()))
-    col4.metric("Min Score", float(final_df["anomaly_score"].min()))
+    col4.metric("Policy Hits", int((final_df["rule_hit_count"] > 0).sum()))
+    col5.metric("Min Score", float(final_df["anomaly_score"].min()))
 
     tabs = st.tabs(["Overview", "Flagged", "All Users"])
 
@@ -245,15 +183,13 @@ if st.session_state.final_df is not None:
                 alerts_sorted["user"].values
             )
 
-            model = joblib.load("baseline_model.pkl")
-            feature_columns = joblib.load("baseline_features.pkl")
+            feature_columns = result.feature_columns
 
             user_index = final_df.index[
                 final_df["user"] == selected_user
             ][0]
 
-            explainer = shap.TreeExplainer(model)
-            shap_values = explainer.shap_values(X_scaled[user_index].reshape(1, -1))[0]
+            shap_values = backend.explain(result, user_index)
 
             shap_df = pd.DataFrame({
                 "Feature": feature_columns,
@@ -294,6 +230,17 @@ if st.session_state.final_df is not None:
         else:
             st.info("No alerts today.")
 
+        policy_hits = final_df[final_df["rule_hit_count"] > 0]
+        st.subheader("Policy Rule Hits (today)")
+        if len(policy_hits) > 0:
+            st.dataframe(
+                policy_hits.sort_values(["rule_hit_count", "anomaly_score"], ascending=[False, True])[
+                    ["user", "rule_hits", "rule_hit_count", "anomaly_score", "FLAG"]
+                ]
+            )
+        else:
+            st.info("No policy rules triggered today.")
+
     with tabs[2]:
         st.subheader("All Users")
         query = st.text_input("Filter by user ID contains")
@@ -305,6 +252,14 @@ if st.session_state.final_df is not None:
             display_df = display_df[display_df["severity"].isin(sev_filter)]
         st.dataframe(display_df, use_container_width=True)
 
+    # The dashboard does not deliver alerts itself; this is the snapshot the
+    # last engine.py / monitor.py / tenants.py run wrote for this root
+    delivery = read_metrics(root_path(root, METRICS_FILE))
+    if delivery:
+        with st.expander("📤 Alert Delivery"):
+            st.caption(f"Last written {pd.Timestamp(delivery['updated'], unit='s'):%Y-%m-%d %H:%M:%S} UTC")
+            st.dataframe(pd.DataFrame(delivery["sinks"]))
+
 else:
     st.info("Click Next Day to process data")
 
@@ -316,9 +271,4 @@ if reset_engine_sidebar:
 
     st.session_state.clear()
 
-    if os.path.exists("email_cumulative.csv"):
-        os.remove("email_cumulative.csv")
-    if os.path.exists("usb_cumulative.csv"):
-        os.remove("usb_cumulative.csv")
-
     st.success("Simulation Reset")
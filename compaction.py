@@ -0,0 +1,348 @@
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+from glob import glob
+from importlib.util import find_spec
+import pandas as pd
+from schemas import EMAIL_SCHEMA, USB_SCHEMA, read_table
+from shap_store import LOG_DIR, ShapStore
+from state import atomic_write, file_lock, remove
+
+# pandas' to_parquet / read_parquet need pyarrow; gzip-compressed CSV
+# without it
+ARCHIVE_FORMAT = "parquet" if find_spec("pyarrow") is not None else "csv.gz"
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# archived_cumulatives/<month>_<kind>_cumulative.csv  as engine.py archives them
+#                     /<month>_<kind>.parquet         compacted (zstd; .csv.gz without pyarrow)
+#                     /manifest.json                  what was compacted / expired
+# daily_shap_logs/shap_log_<month>_Day<d>.txt         as pipeline.py writes them
+#                /shap_log_<month>.txt.gz             one gzip member per day, in day order
+#                /manifest.json                       day -> (offset, length) of its member
+# The newest KEEP_RAW months are left as they are; RETAIN_MONTHS /
+# RETAIN_LOG_MONTHS (unset = forever) delete whole months older than that.
+
+ARCHIVE_DIR = "archived_cumulatives"
+MANIFEST = "manifest.json"
+KEEP_RAW = 1
+SCHEMAS = {"email": EMAIL_SCHEMA, "usb": USB_SCHEMA}
+
+DAY_LOG = re.compile(r"shap_log_(.+)_Day(\d+)\.txt$")
+
+
+def retention(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+RETAIN_MONTHS = retention("RETAIN_MONTHS")
+RETAIN_LOG_MONTHS = retention("RETAIN_LOG_MONTHS")
+
+
+def month_index(label):
+    month = datetime.strptime(label, "%b_%Y")
+    return month.year * 12 + month.month
+
+
+def by_month(labels):
+    # Labels that are not months (stray files) are ignored
+    known = []
+    for label in set(labels):
+        try:
+            known.append((month_index(label), label))
+        except ValueError:
+            continue
+    return [label for _, label in sorted(known)]
+
+
+def split(labels, keep_raw, retain):
+    # (months to compact, months to expire), both oldest first
+    labels = by_month(labels)
+    if not labels:
+        return [], []
+    newest = month_index(labels[-1])
+    expired = [m for m in labels if retain is not None and newest - month_index(m) >= retain]
+    old = [m for m in labels if newest - month_index(m) >= keep_raw and m not in expired]
+    return old, expired
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"months": {}, "expired": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(directory, manifest):
+    with atomic_write(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def now():
+    return datetime.now().isoformat(timespec="seconds")
+
+# =====================================================
+# ARCHIVED CUMULATIVES
+# =====================================================
+
+def raw_path(directory, label, kind):
+    return os.path.join(directory, f"{label}_{kind}_cumulative.csv")
+
+
+def write_archive(df, path):
+    with atomic_write(path) as f:
+        if ARCHIVE_FORMAT == "parquet":
+            df.to_parquet(f, index=False, compression="zstd")
+        else:
+            with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+                gz.write(df.to_csv(index=False).encode())
+
+
+def archived_months(directory=ARCHIVE_DIR):
+    raw = [
+        os.path.basename(path)[:-len("_email_cumulative.csv")]
+        for path in glob(os.path.join(directory, "*_email_cumulative.csv"))
+    ]
+    return by_month(raw + list(load_manifest(directory)["months"]))
+
+
+def read_archive(label, kind, directory=ARCHIVE_DIR):
+    # Typed month-end cumulative, from the CSV if it is still there, else
+    # from the compacted file; df.attrs["source"] is the file read
+    schema = SCHEMAS[kind]
+    path = raw_path(directory, label, kind)
+    if os.path.exists(path):
+        df = read_table(path, schema, validate=False)
+    else:
+        entry = load_manifest(directory)["months"].get(label)
+        if entry is None:
+            raise FileNotFoundError(f"{label} is not archived in {directory}")
+        path = os.path.join(directory, entry[kind]["file"])
+        if entry["format"] == "parquet":
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path, dtype={col: "str" for col, k in schema.items() if k == "str"})
+        df = df[list(schema)]
+    df.attrs["source"] = path
+    return df
+
+
+def compact_archives(directory=ARCHIVE_DIR, keep_raw=KEEP_RAW, retain=RETAIN_MONTHS):
+    # Returns (compacted, expired) month labels
+    if not os.path.isdir(directory):
+        return [], []
+
+    with file_lock(os.path.join(directory, MANIFEST)):
+        manifest = load_manifest(directory)
+        old, expired = split(archived_months(directory), keep_raw, retain)
+
+        compacted = []
+        for label in old:
+            sources = [raw_path(directory, label, kind) for kind in SCHEMAS]
+            if not all(os.path.exists(path) for path in sources):
+                continue
+            entry = {"format": ARCHIVE_FORMAT, "compacted_at": now()}
+            for kind, source in zip(SCHEMAS, sources):
+                df = read_table(source, SCHEMAS[kind], validate=False)
+                name = f"{label}_{kind}.{ARCHIVE_FORMAT}"
+                write_archive(df, os.path.join(directory, name))
+                entry[kind] = {
+                    "file": name,
+                    "rows": len(df),
+                    "bytes": os.path.getsize(os.path.join(directory, name)),
+                    "source_bytes": os.path.getsize(source),
+                }
+            manifest["months"][label] = entry
+            compacted.append(label)
+
+        # The manifest names the compacted files before the CSVs go
+        for label in expired:
+            manifest["months"].pop(label, None)
+            manifest["expired"][label] = now()
+        save_manifest(directory, manifest)
+
+        for label in compacted + expired:
+            for kind in SCHEMAS:
+                remove(raw_path(directory, label, kind))
+        for label in expired:
+            for path in glob(os.path.join(directory, f"{label}_*.*")):
+                remove(path)
+
+    return compacted, expired
+
+# =====================================================
+# SHAP LOGS
+# =====================================================
+
+def day_logs(log_dir):
+    # month -> {day: path}
+    logs = {}
+    for path in glob(os.path.join(log_dir, "shap_log_*_Day*.txt")):
+        match = DAY_LOG.search(os.path.basename(path))
+        if match:
+            logs.setdefault(match.group(1), {})[int(match.group(2))] = path
+    return logs
+
+
+def segment_path(log_dir, month):
+    return os.path.join(log_dir, f"shap_log_{month}.txt.gz")
+
+
+def read_day_log(month, day, log_dir=LOG_DIR):
+    # The day's text log, from its own file or its member of the month
+    # segment (only that member is read)
+    path = os.path.join(log_dir, f"shap_log_{month}_Day{day}.txt")
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read()
+    entry = load_manifest(log_dir)["months"].get(month, {})
+    if str(day) not in entry.get("days", {}):
+        raise FileNotFoundError(f"no SHAP log for {month} day {day} in {log_dir}")
+    offset, length = entry["days"][str(day)]
+    with open(segment_path(log_dir, month), "rb") as f:
+        f.seek(offset)
+        return gzip.decompress(f.read(length)).decode()
+
+
+def compact_logs(log_dir=LOG_DIR, keep_raw=KEEP_RAW, retain=RETAIN_LOG_MONTHS):
+    # Returns (compacted, expired) month labels. Expiry also drops the
+    # month's JSONL segment and its rows in the SHAP index.
+    if not os.path.isdir(log_dir):
+        return [], []
+
+    with file_lock(os.path.join(log_dir, MANIFEST)):
+        manifest = load_manifest(log_dir)
+        logs = day_logs(log_dir)
+        segments = [
+            os.path.basename(path)[len("shap_"):-len(".jsonl")]
+            for path in glob(os.path.join(log_dir, "shap_*.jsonl"))
+        ]
+        old, expired = split(list(logs) + list(manifest["months"]) + segments, keep_raw, retain)
+
+        compacted = []
+        for month in old:
+            if month not in logs:
+                continue
+            # Members already in the segment are copied as they are; a day
+            # logged again replaces its member
+            entry = manifest["months"].get(month, {"days": {}, "source_bytes": 0})
+            members = {}
+            if entry["days"]:
+                with open(segment_path(log_dir, month), "rb") as f:
+                    for day, (offset, length) in entry["days"].items():
+                        f.seek(offset)
+                        members[int(day)] = f.read(length)
+            for day, path in logs[month].items():
+                with open(path, "rb") as f:
+                    members[int(day)] = gzip.compress(f.read(), mtime=0)
+                entry["source_bytes"] += os.path.getsize(path)
+
+            days, offset = {}, 0
+            with atomic_write(segment_path(log_dir, month)) as f:
+                for day in sorted(members):
+                    f.write(members[day])
+                    days[str(day)] = [offset, len(members[day])]
+                    offset += len(members[day])
+
+            entry.update({
+                "file": os.path.basename(segment_path(log_dir, month)),
+                "days": days,
+                "bytes": offset,
+                "compacted_at": now(),
+            })
+            manifest["months"][month] = entry
+            compacted.append(month)
+
+        for month in expired:
+            manifest["months"].pop(month, None)
+            manifest["expired"][month] = now()
+        save_manifest(log_dir, manifest)
+
+        for month in compacted + expired:
+            for path in logs.get(month, {}).values():
+                remove(path)
+        if expired:
+            store = ShapStore(log_dir)
+            for month in expired:
+                store.drop_month(month)
+                remove(segment_path(log_dir, month))
+            store.close()
+
+    return compacted, expired
+
+
+def compact(archive_dir=ARCHIVE_DIR, log_dir=LOG_DIR, keep_raw=KEEP_RAW,
+            retain=RETAIN_MONTHS, retain_logs=RETAIN_LOG_MONTHS):
+    archives = compact_archives(archive_dir, keep_raw, retain)
+    logs = compact_logs(log_dir, keep_raw, retain_logs)
+    return archives, logs
+
+# =====================================================
+# CLI
+# =====================================================
+
+def status(directory):
+    manifest = load_manifest(directory)
+    rows = []
+    for label, entry in manifest["months"].items():
+        parts = [entry[kind] for kind in SCHEMAS if kind in entry] or [entry]
+        rows.append({
+            "month": label,
+            "file(s)": ", ".join(part["file"] for part in parts),
+            "rows / days": sum(part.get("rows", 0) for part in parts) or len(entry.get("days", {})),
+            "bytes": sum(part["bytes"] for part in parts),
+            "source_bytes": sum(part["source_bytes"] for part in parts),
+            "compacted_at": entry["compacted_at"],
+        })
+    print(f"\n📦 {directory}")
+    if rows:
+        report = pd.DataFrame(rows).set_index("month").loc[by_month(manifest["months"])]
+        print(report.reset_index().to_string(index=False))
+    else:
+        print("   nothing compacted")
+    if manifest["expired"]:
+        print("   expired: " + ", ".join(by_month(manifest["expired"])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact and expire archived cumulatives and SHAP logs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = sub.add_parser("run", help="compact old months and apply retention")
+    run_cmd.add_argument("--archive", default=ARCHIVE_DIR)
+    run_cmd.add_argument("--logs", default=LOG_DIR)
+    run_cmd.add_argument("--keep-raw", type=int, default=KEEP_RAW, help="newest months left uncompacted")
+    run_cmd.add_argument("--retain-months", type=int, default=RETAIN_MONTHS,
+                         help="months of archives kept (default: RETAIN_MONTHS, else all)")
+    run_cmd.add_argument("--retain-log-months", type=int, default=RETAIN_LOG_MONTHS,
+                         help="months of SHAP logs and records kept (default: RETAIN_LOG_MONTHS, else all)")
+
+    status_cmd = sub.add_parser("status", help="show both manifests")
+    status_cmd.add_argument("--archive", default=ARCHIVE_DIR)
+    status_cmd.add_argument("--logs", default=LOG_DIR)
+
+    log_cmd = sub.add_parser("log", help="print one day's SHAP log")
+    log_cmd.add_argument("month")
+    log_cmd.add_argument("day", type=int)
+    log_cmd.add_argument("--logs", default=LOG_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        (archived, dropped), (merged, expired) = compact(
+            args.archive, args.logs, args.keep_raw, args.retain_months, args.retain_log_months
+        )
+        print(f"✅ Archives: {len(archived)} compacted {archived}, {len(dropped)} expired {dropped}")
+        print(f"✅ SHAP logs: {len(merged)} merged {merged}, {len(expired)} expired {expired}")
+    elif args.command == "status":
+        status(args.archive)
+        status(args.logs)
+    else:
+        print(read_day_log(args.month, args.day, args.logs))
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+from glob import glob
+import numpy as np
+from sampling import chunked_scores
+from shap_store import model_version
+from state import atomic_write, file_lock, load_bundle, BUNDLE_LOCK
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# model_summaries/<version>.json   per-feature mean/std + quantile histogram,
+#                                   threshold, users; a few KB per model
+# drift_reports/<old>_<new>.json    comparison written at each retrain
+# drift_reports/latest.json         copy of the newest report
+
+SUMMARY_DIR = "model_summaries"
+REPORT_DIR = "drift_reports"
+N_BINS = 10
+
+# Below these the month counts as negligible drift
+PSI_NEGLIGIBLE = 0.1
+SHIFT_NEGLIGIBLE = 0.25         # |mean shift| in old standard deviations
+ALERT_JACCARD_NEGLIGIBLE = 0.8
+THRESHOLD_SHIFT_NEGLIGIBLE = 0.01
+
+# =====================================================
+# SUMMARIES (KEPT WITH EACH MODEL VERSION)
+# =====================================================
+
+def summarize(X, feature_columns, threshold=None):
+    # X: raw (unscaled) users × features; threshold can be filled in later
+    features = {}
+    for j, col in enumerate(feature_columns):
+        values = X[:, j]
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, N_BINS + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+        features[col] = {
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            "edges": edges.tolist(),
+            "fractions": (counts / max(len(values), 1)).tolist(),
+        }
+    return {
+        "users": int(len(X)),
+        "threshold": None if threshold is None else float(threshold),
+        "features": features
+    }
+
+
+def save_summary(version, summary, summary_dir=SUMMARY_DIR):
+    with atomic_write(os.path.join(summary_dir, f"{version}.json"), "w") as f:
+        json.dump({"version": version, **summary}, f)
+
+
+def load_summary(version, summary_dir=SUMMARY_DIR):
+    path = os.path.join(summary_dir, f"{version}.json")
+    if version is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+# =====================================================
+# COMPARISON
+# =====================================================
+
+def psi(old_feature, values):
+    # Population stability index of values against the old histogram
+    edges = np.asarray(old_feature["edges"])
+    expected = np.asarray(old_feature["fractions"])
+    actual = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+    actual = actual / max(len(values), 1)
+    expected, actual = np.clip(expected, 1e-4, None), np.clip(actual, 1e-4, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def previous_baseline():
+    # The model about to be replaced; call before saving the new one
+    if not os.path.exists("baseline_model.pkl"):
+        return None
+    with file_lock(BUNDLE_LOCK, shared=True):
+        version = model_version()
+        model, scaler, feature_columns, threshold = load_bundle(lock=False)
+    return {
+        "version": version,
+        "model": model,
+        "scaler": scaler,
+        "feature_columns": feature_columns,
+        "threshold": float(threshold),
+    }
+
+
+def score_with(previous, X, feature_columns, chunk_size=65536):
+    # Old model on today's snapshot: align columns, scale with the old scaler
+    X_old = np.zeros((len(X), len(previous["feature_columns"])))
+    for j, col in enumerate(previous["feature_columns"]):
+        if col in feature_columns:
+            X_old[:, j] = X[:, feature_columns.index(col)]
+    X_old -= previous["scaler"].mean_
+    X_old /= previous["scaler"].scale_
+    return chunked_scores(previous["model"], X_old, chunk_size)
+
+
+def compare_snapshot(previous, X, feature_columns, chunk_size=65536):
+    # Everything that needs the raw snapshot (call before scaling X): feature
+    # shifts against the old scaler and histogram, and the old model's scores
+    old_summary = load_summary(previous["version"])
+    old_scaler = previous["scaler"]
+    old_columns = previous["feature_columns"]
+
+    features = {}
+    for j, col in enumerate(feature_columns):
+        entry = {"new_mean": float(X[:, j].mean())}
+        if col in old_columns:
+            k = old_columns.index(col)
+            entry["old_mean"] = float(old_scaler.mean_[k])
+            # Shift in units of the old standard deviation
+            entry["mean_shift_sd"] = float((entry["new_mean"] - old_scaler.mean_[k]) / old_scaler.scale_[k])
+            entry["std_ratio"] = float(X[:, j].std() / old_scaler.scale_[k])
+        if old_summary is not None and col in old_summary["features"]:
+            entry["psi"] = psi(old_summary["features"][col], X[:, j])
+        features[col] = entry
+
+    return {
+        "features": features,
+        "added_features": [c for c in feature_columns if c not in old_columns],
+        "removed_features": [c for c in old_columns if c not in feature_columns],
+        "old_scores": score_with(previous, X, feature_columns, chunk_size),
+    }
+
+
+def is_stable(snapshot, max_psi=PSI_NEGLIGIBLE, max_shift_sd=SHIFT_NEGLIGIBLE):
+    # Feature-level check, decided before any refit
+    if snapshot["added_features"] or snapshot["removed_features"]:
+        return False
+    features = list(snapshot["features"].values())
+    if not features or any("psi" not in f for f in features):
+        return False
+    return (
+        max(f["psi"] for f in features) < max_psi
+        and max(abs(f["mean_shift_sd"]) for f in features) < max_shift_sd
+    )
+
+
+def drift_report(previous, snapshot, new_scores, new_threshold, new_version, retrained=True):
+    old_alerts = snapshot["old_scores"] <= previous["threshold"]
+    new_alerts = new_scores <= new_threshold
+    union = np.logical_or(old_alerts, new_alerts).sum()
+    jaccard = float(np.logical_and(old_alerts, new_alerts).sum() / union) if union else 1.0
+
+    features = snapshot["features"]
+    psis = [f["psi"] for f in features.values() if "psi" in f]
+    max_psi = max(psis) if psis else None
+    threshold_shift = float(new_threshold - previous["threshold"])
+
+    return {
+        "old_version": previous["version"],
+        "new_version": new_version,
+        "retrained": retrained,
+        "users": int(len(new_scores)),
+        "features": features,
+        "added_features": snapshot["added_features"],
+        "removed_features": snapshot["removed_features"],
+        "max_psi": max_psi,
+        "max_abs_mean_shift_sd": max(
+            (abs(f["mean_shift_sd"]) for f in features.values() if "mean_shift_sd" in f), default=None
+        ),
+        "threshold_old": previous["threshold"],
+        "threshold_new": float(new_threshold),
+        "threshold_shift": threshold_shift,
+        "alerts_old_model": int(old_alerts.sum()),
+        "alerts_new_model": int(new_alerts.sum()),
+        "alert_jaccard": jaccard,
+        "negligible": bool(
+            max_psi is not None and max_psi < PSI_NEGLIGIBLE
+            and jaccard >= ALERT_JACCARD_NEGLIGIBLE
+            and abs(threshold_shift) < THRESHOLD_SHIFT_NEGLIGIBLE
+        ),
+    }
+
+
+def save_report(report, report_dir=REPORT_DIR):
+    name = f"{report['old_version']}_{report['new_version']}.json"
+    for path in [os.path.join(report_dir, name), os.path.join(report_dir, "latest.json")]:
+        with atomic_write(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def print_report(report):
+    print("\n==============================")
+    print(f"Drift {report['old_version']} → {report['new_version']} ({report['users']} users)")
+    for label, key, unit in [("Max PSI", "max_psi", ""), ("Max |mean shift|", "max_abs_mean_shift_sd", " sd")]:
+        value = report[key]
+        print(f"{label}: {'n/a' if value is None else f'{value:.3f}'}{unit}")
+    print(f"Threshold: {report['threshold_old']:.4g} → {report['threshold_new']:.4g}")
+    print(f"Alerts old / new model: {report['alerts_old_model']} / {report['alerts_new_model']} "
+          f"(Jaccard {report['alert_jaccard']:.2f})")
+    for col, f in report["features"].items():
+        if "psi" in f:
+            print(f"   {col}: PSI {f['psi']:.3f}, shift {f['mean_shift_sd']:+.2f} sd")
+    print(f"Negligible drift: {report['negligible']}")
+    if not report.get("retrained", True):
+        print("Refit skipped: model kept, threshold recomputed")
+    print("==============================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show drift reports between baselines")
+    parser.add_argument("--all", action="store_true", help="one line per stored report")
+    args = parser.parse_args()
+
+    if args.all:
+        for path in sorted(glob(os.path.join(REPORT_DIR, "*_*.json")), key=os.path.getmtime):
+            with open(path) as f:
+                r = json.load(f)
+            max_psi = "n/a" if r["max_psi"] is None else f"{r['max_psi']:.3f}"
+            print(f"{r['old_version']} → {r['new_version']}: max PSI {max_psi}, "
+                  f"Jaccard {r['alert_jaccard']:.2f}, negligible {r['negligible']}")
+    elif os.path.exists(os.path.join(REPORT_DIR, "latest.json")):
+        with open(os.path.join(REPORT_DIR, "latest.json")) as f:
+            print_report(json.load(f))
+    else:
+        print("⚠️ No drift report yet — run make_model_repeated.py twice")
@@ -1,38 +1,72 @@
 import os
-import shutil
+import sys
 import subprocess
-import numpy as np
-import pandas as pd
+import time
+from functools import partial
 from glob import glob
 from datetime import datetime
+import pandas as pd
+from state import Workspace, load_bundle, remove
+from rolling import STATE_FILE, advance_rolling
+from incremental_model import STATE_FILE as INCREMENTAL_STATE
+from rules import RuleEngine
+from peer_groups import load_peers
+from alert_state import reconcile_alerts
+from alert_sinks import from_environment
+from pipeline import (EXPLAIN_MODE, PREFETCH_DAYS, READ_WORKERS, WRITE_QUEUE, DayReader, OutputWriter,
+                      explain, log_explanations, persist_day, score_frame)
+from scoring import day_files, days_in_month
+from shap_store import model_version
+from history import write_month
+from compaction import ARCHIVE_DIR, compact
+from metrics import registry
 
 print("\n🚀 MASTER MULTI-MONTH SIMULATION STARTED\n")
 
-EMAIL_COLUMNS = [
-    "user",
-    "total_emails",
-    "external_emails",
-    "attachments_sent",
-    "bcc_in_email",
-    "avg_email_size"
-]
-
-USB_COLUMNS = [
-    "user",
-    "usb_insertions",
-    "files_accessed",
-    "sensitive_files_accessed"
-]
-
-def initialize_cumulatives():
-    pd.DataFrame(columns=EMAIL_COLUMNS).to_csv(
-        "email_cumulative.csv", index=False
-    )
-    pd.DataFrame(columns=USB_COLUMNS).to_csv(
-        "usb_cumulative.csv", index=False
-    )
-
-initialize_cumulatives()
+# --incremental: slide the forest daily and refresh it at month end
+# instead of a full retrain (see incremental_model.py)
+INCREMENTAL = "--incremental" in sys.argv
+
+# --force-retrain: refit at every month end even when drift is negligible
+# (see drift.py); by default a stable month only refreshes the threshold
+RETRAIN_ARGS = ["--force"] if "--force-retrain" in sys.argv else []
+
+# --rolling: keep 7/30-day ring buffers across months and train on them
+ROLLING = "--rolling" in sys.argv
+if ROLLING:
+    RETRAIN_ARGS.append("--rolling")
+
+# --fast-explain: explain every alert with path attributions
+EXPLAIN = "fast" if "--fast-explain" in sys.argv else EXPLAIN_MODE
+
+# --sinks SPEC: deliver new / escalated alerts to ALERT_SINKS (see alert_sinks.py)
+if "--sinks" in sys.argv:
+    os.environ["ALERT_SINKS"] = sys.argv[sys.argv.index("--sinks") + 1]
+
+# --workspace DIR: keep this run's cumulatives in DIR so several runs can
+# share one model directory; child scripts inherit it through WORKSPACE
+if "--workspace" in sys.argv:
+    os.environ["WORKSPACE"] = sys.argv[sys.argv.index("--workspace") + 1]
+
+# --prefetch N: days parsed ahead of the one being scored (reader threads);
+# --write-queue N: output tasks queued for the writer thread;
+# --sequential: no reader or writer threads, one stage at a time
+PREFETCH = int(sys.argv[sys.argv.index("--prefetch") + 1]) if "--prefetch" in sys.argv else PREFETCH_DAYS
+WRITES = int(sys.argv[sys.argv.index("--write-queue") + 1]) if "--write-queue" in sys.argv else WRITE_QUEUE
+if "--sequential" in sys.argv:
+    PREFETCH = WRITES = 0
+
+# --compact: after each month's archive, compact older archives and SHAP
+# logs and apply RETAIN_MONTHS / RETAIN_LOG_MONTHS (see compaction.py)
+COMPACT = "--compact" in sys.argv
+
+telemetry = registry("engine")
+dispatcher = from_environment()
+
+workspace = Workspace()
+workspace.initialize()
+remove(workspace.path(STATE_FILE))
+remove(workspace.path(INCREMENTAL_STATE))
 
 # =====================================================
 # SORT MONTHS CHRONOLOGICALLY
@@ -57,72 +91,175 @@ for folder in email_month_folders:
 
 os.makedirs("threshold_logs", exist_ok=True)
 os.makedirs("cumulative_logs", exist_ok=True)
-os.makedirs("archived_cumulatives", exist_ok=True)
 
 baseline_exists = False
+month_model = None      # (bundle, peers, rules, version) once a baseline exists
+
+# =====================================================
+# PIPELINE
+# =====================================================
+
+# Reader threads parse the next days while the main thread scores the
+# current one; the writer thread persists each day's outputs (scratch
+# copies, cumulative rows, SHAP records and logs, alert delivery, metrics)
+# in day order. Memory stays bounded by PREFETCH parsed days and WRITES
+# queued tasks. The writer is drained before anything that reads the
+# workspace from another process (retrain, incremental updates).
+
+month_days = [(folder, days_in_month(folder)) for folder in email_month_folders]
+reader = DayReader(
+    [(f"{folder.replace('_email', '')}:{day}", *day_files(folder, day))
+     for folder, n_days in month_days for day in range(1, n_days + 1)],
+    depth=PREFETCH, workers=READ_WORKERS
+)
+writer = OutputWriter(WRITES, on_task=lambda seconds: telemetry.observe("insider_stage_seconds", seconds, stage="write"))
+days = iter(reader)
+stage_seconds = {"read_wait": 0.0, "score": 0.0}
+run_start = time.perf_counter()
+
+
+def load_month_model():
+    # Bundle, peers and rule limits change only at retrains (and
+    # incremental updates)
+    return load_bundle(), load_peers(), RuleEngine(), model_version()
 
 # =====================================================
 # PROCESS MONTHS
 # =====================================================
 
-for month_index, email_folder in enumerate(email_month_folders):
+try:
+    for email_folder, n_days in month_days:
 
-    month_label = email_folder.replace("_email", "")
-    usb_folder = f"{month_label}_usbfiles"
+        month_label = email_folder.replace("_email", "")
 
-    print(f"\n📆 PROCESSING MONTH: {month_label.upper()}")
+        print(f"\n📆 PROCESSING MONTH: {month_label.upper()}")
 
-    day = 1
+        email_cum = usb_cum = None
 
-    while True:
+        for _ in range(n_days):
 
-        email_file = os.path.join(email_folder, f"email_{day}.csv")
-        usb_file = os.path.join(usb_folder, f"usbfile_{day}.csv")
+            wait_start = time.perf_counter()
+            (key, email_file, usb_file), (email_daily, usb_daily) = next(days)
+            day_start = time.perf_counter()
+            waited = writer.waited
+            stage_seconds["read_wait"] += day_start - wait_start
+            telemetry.observe("insider_stage_seconds", day_start - wait_start, stage="read_wait")
+            day = int(key.split(":")[1])
 
-        if not os.path.exists(email_file) or not os.path.exists(usb_file):
-            print(f"📅 Month {month_label} complete ({day-1} days)")
-            break
+            print(f"   📆 Simulating Day {day}")
 
-        print(f"   📆 Simulating Day {day}")
+            for source, df in [("email", email_daily), ("usb", usb_daily)]:
+                telemetry.inc("insider_ingest_rows_total", len(df), source=source)
+                telemetry.inc("insider_quarantined_rows_total", df.attrs["quarantined"], source=source)
 
-        shutil.copy(email_file, "daily_email_activity.csv")
-        shutil.copy(usb_file, "daily_usb_activity.csv")
+            # Month-to-date frames stay in memory; the writer appends the
+            # day's rows to the workspace files
+            email_cum = email_daily if email_cum is None else pd.concat([email_cum, email_daily], ignore_index=True)
+            usb_cum = usb_daily if usb_cum is None else pd.concat([usb_cum, usb_daily], ignore_index=True)
+            writer.submit(persist_day, workspace, email_file, usb_file, email_daily, usb_daily)
 
-        # 🔹 Only run monitor if baseline exists (from previous month)
-        if baseline_exists:
-            subprocess.run(["python", "monitor.py"])
+            rolling = advance_rolling(workspace, email_daily, usb_daily, key) if ROLLING else None
+
+            # 🔹 Only score if baseline exists (from previous month)
+            if baseline_exists:
+                bundle, peers, rules, version = month_model
+                model, scaler, feature_columns, threshold = bundle
+
+                final_df, X_scaled, scores, thresholds = score_frame(
+                    bundle, peers, rules, email_cum, usb_cum, email_daily, usb_daily, rolling
+                )
+                flagged = scores <= thresholds
+                status, notify = reconcile_alerts(workspace, final_df["user"].to_numpy(), scores, flagged, month_label, day)
+                final_df["alert_status"] = status
+                changed = final_df.index[notify]
+
+                telemetry.observe("insider_score_seconds", time.perf_counter() - day_start)
+                telemetry.inc("insider_scored_users_total", len(final_df))
+                telemetry.set("insider_alerts", flagged.sum())
+                for alert_status, count in final_df.loc[flagged, "alert_status"].value_counts().items():
+                    telemetry.inc("insider_alerts_total", count, status=alert_status)
+                telemetry.set("insider_threshold", threshold)
+
+                if len(changed) > 0:
+                    shap_start = time.perf_counter()
+                    explained, shap_matrix = explain(model, X_scaled, changed, EXPLAIN)
+                    telemetry.observe("insider_shap_seconds", time.perf_counter() - shap_start, method=EXPLAIN)
+                    telemetry.inc("insider_shap_explained_total", len(explained), method=EXPLAIN)
+
+                    writer.submit(
+                        partial(log_explanations, X_scaled=X_scaled),
+                        month_label, day, final_df, int(flagged.sum()), changed, explained,
+                        shap_matrix, feature_columns, thresholds, version, EXPLAIN, dispatcher
+                    )
+
+                print(f"      {len(final_df)} users, {int(flagged.sum())} alerts, {len(changed)} new / escalated")
+
+                if INCREMENTAL:
+                    writer.drain()
+                    subprocess.run([sys.executable, "incremental_model.py", "update", "--workspace", workspace.root])
+                    month_model = load_month_model()
+            else:
+                print("   ⏳ Building baseline month (no predictions yet)")
+
+            # Scoring excludes time spent waiting on the writer
+            day_seconds = time.perf_counter() - day_start
+            score_seconds = day_seconds - (writer.waited - waited)
+            stage_seconds["score"] += score_seconds
+            telemetry.observe("insider_stage_seconds", score_seconds, stage="score")
+            telemetry.inc("insider_days_total")
+            telemetry.observe("insider_day_seconds", day_seconds)
+            # Delivery metrics per day, after the day's alerts were published
+            if dispatcher:
+                writer.submit(dispatcher.write_metrics)
+                writer.submit(dispatcher.record_metrics, telemetry)
+            writer.submit(telemetry.flush)
+
+        print(f"📅 Month {month_label} complete ({n_days} days)")
+
+        # =====================================================
+        # MONTH END
+        # =====================================================
+
+        # The retrain reads the workspace: every appended day must be on disk
+        writer.drain()
+
+        if n_days > 0 and baseline_exists and INCREMENTAL:
+            print("   🧠 Refreshing Baseline Model (incremental)")
+            subprocess.run([sys.executable, "incremental_model.py", "refresh", "--workspace", workspace.root])
+        elif n_days > 0:
+            print("   🧠 Training / Retraining Baseline Model")
+            subprocess.run([sys.executable, "make_model_repeated.py", "--workspace", workspace.root] + RETRAIN_ARGS)
+            baseline_exists = True
         else:
-            print("   ⏳ Building baseline month (no predictions yet)")
-
-        day += 1
-
-    # =====================================================
-    # MONTH END
-    # =====================================================
-
-    days_processed = day - 1
-
-    if days_processed > 0:
-        print("   🧠 Training / Retraining Baseline Model")
-        subprocess.run(["python", "make_model_repeated.py"])
-        baseline_exists = True
-    else:
-        print("   ⚠️ No data processed — skipping training")
-
-    # Archive cumulative
-    if os.path.exists("email_cumulative.csv"):
-        shutil.move(
-            "email_cumulative.csv",
-            f"archived_cumulatives/{month_label}_email_cumulative.csv"
-        )
-
-    if os.path.exists("usb_cumulative.csv"):
-        shutil.move(
-            "usb_cumulative.csv",
-            f"archived_cumulatives/{month_label}_usb_cumulative.csv"
-        )
-
-    # Reset for next month
-    initialize_cumulatives()
+            print("   ⚠️ No data processed — skipping training")
+
+        if baseline_exists:
+            month_model = load_month_model()
+            telemetry.info("insider_model_info", version=month_model[3])
+
+        if email_cum is not None:
+            # Month-end arrays for backtests (history/<month>/, memory-mapped)
+            writer.submit(write_month, month_label, email_cum, usb_cum)
+
+        # Archive cumulative, reset for next month
+        writer.submit(workspace.archive, workspace.path(ARCHIVE_DIR), month_label)
+        writer.submit(workspace.initialize)
+        if COMPACT:
+            writer.submit(compact, workspace.path(ARCHIVE_DIR))
+
+finally:
+    reader.close()
+    writer.close()
+    # Flush what the sinks still hold before the last metrics
+    dispatcher.close()
+    dispatcher.record_metrics(telemetry)
+    telemetry.flush()
+
+wall = time.perf_counter() - run_start
+print(
+    f"\n⏱️ Pipeline: {wall:.1f} s wall; read wait {stage_seconds['read_wait']:.1f} s, "
+    f"scoring {stage_seconds['score']:.1f} s, writes {writer.busy:.1f} s "
+    f"(waited {writer.waited:.1f} s on the writer; prefetch {PREFETCH}, write queue {WRITES})"
+)
 
 print("\n🎉 MULTI-MONTH SIMULATION COMPLETE\n")
@@ -0,0 +1,119 @@
+import argparse
+import time
+import numpy as np
+from scipy import sparse
+from scipy.stats import spearmanr
+from features import load_cumulative_matrix, scale
+from state import load_bundle
+
+# =====================================================
+# PATH-BASED ATTRIBUTION
+# =====================================================
+
+# Every node of an isolation tree has an expected path length
+#   v(node) = depth(node) + c(n_samples(node))
+# (c = average unsuccessful-search length, as in sklearn's scoring). Moving
+# from a parent to a child changes it by v(child) - v(parent); that change is
+# credited to the parent's split feature. Along a root-to-leaf path the
+# credits sum to the sample's path length minus c(max_samples), so averaged
+# over trees they explain the same quantity as TreeExplainer (mean path
+# length), with the same sign: negative = shorter path = more anomalous.
+# Cost per user is at most n_trees × max_depth node visits.
+
+class PathAttributor:
+
+    def __init__(self, model):
+        self.model = model
+        self.n_features = model.n_features_in_
+        self.credits = []
+        roots = []
+
+        for i, tree in enumerate(model.estimators_):
+            t = tree.tree_
+            value = (
+                np.asarray(model._decision_path_lengths[i], dtype=np.float64) - 1
+                + np.asarray(model._average_path_length_per_tree[i], dtype=np.float64)
+            )
+
+            child = np.concatenate([t.children_left, t.children_right])
+            parent = np.concatenate([np.arange(t.node_count)] * 2)
+            split = child >= 0
+            child, parent = child[split], parent[split]
+
+            features = model.estimators_features_[i][t.feature[parent]]
+            self.credits.append(sparse.csr_matrix(
+                (value[child] - value[parent], (child, features)),
+                shape=(t.node_count, self.n_features)
+            ))
+            roots.append(value[0])
+
+        self.expected_value = np.mean(roots)
+
+    def attributions(self, X_scaled, chunk_size=65536):
+        X_scaled = np.asarray(X_scaled, dtype=np.float32)
+        out = np.zeros((len(X_scaled), self.n_features))
+
+        for start in range(0, len(X_scaled), chunk_size):
+            block = X_scaled[start:start + chunk_size]
+            total = out[start:start + chunk_size]
+            for tree, features, credit in zip(
+                self.model.estimators_, self.model.estimators_features_, self.credits
+            ):
+                path = tree.decision_path(block[:, features])
+                total += (path @ credit).toarray()
+
+        out /= len(self.model.estimators_)
+        return out
+
+# =====================================================
+# FIDELITY CHECK AGAINST EXACT SHAP
+# =====================================================
+
+def fidelity(model, X_scaled, rows, top_k=5):
+    import shap
+
+    attributor = PathAttributor(model)
+
+    start = time.perf_counter()
+    fast = attributor.attributions(X_scaled[rows])
+    fast_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact = shap.TreeExplainer(model).shap_values(X_scaled[rows])
+    exact_time = time.perf_counter() - start
+
+    rank_corr = [spearmanr(f, e)[0] for f, e in zip(fast, exact)]
+    top1 = np.mean(np.argmax(np.abs(fast), 1) == np.argmax(np.abs(exact), 1))
+    fast_top = np.argsort(-np.abs(fast), 1)[:, :top_k]
+    exact_top = np.argsort(-np.abs(exact), 1)[:, :top_k]
+    overlap = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(fast_top, exact_top)])
+    sign = np.mean(np.sign(fast) == np.sign(exact))
+
+    return {
+        "rows": len(rows),
+        "fast_ms_per_row": 1000 * fast_time / len(rows),
+        "exact_ms_per_row": 1000 * exact_time / len(rows),
+        "spearman_median": float(np.nanmedian(rank_corr)),
+        "top1_agreement": float(top1),
+        f"top{top_k}_overlap": float(overlap),
+        "sign_agreement": float(sign),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare path attributions with exact SHAP")
+    parser.add_argument("--rows", type=int, default=200, help="lowest-scoring users to compare")
+    args = parser.parse_args()
+
+    model, scaler, feature_columns, _ = load_bundle()
+
+    _, X, _ = load_cumulative_matrix(feature_columns)
+    X_scaled = scale(scaler, X)
+
+    rows = np.argsort(model.decision_function(X_scaled))[:args.rows]
+    report = fidelity(model, X_scaled, rows)
+
+    print("\n==============================")
+    for key, value in report.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    print("==============================\n")
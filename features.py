@@ -0,0 +1,133 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from rolling import load_rolling, uses_rolling
+from schemas import read_psychometric
+from state import Workspace
+
+# =====================================================
+# SCHEMA
+# =====================================================
+
+PSYCHOMETRIC_COLUMNS = ["O", "C", "E", "A", "N"]
+FLIPPED_COLUMNS = ["C", "A"]        # lower C/A = higher risk
+
+PSYCHOMETRIC_FILE = "psychometric.csv"
+
+# =====================================================
+# PSYCHOMETRIC BLOCK (STATIC, CACHED)
+# =====================================================
+
+@lru_cache(maxsize=4)
+def _psychometric_block(path, mtime):
+    # Validated: one row per user, complete non-negative scores
+    psy_df = read_psychometric(path).rename(columns={"user_id": "user"})
+
+    index = pd.Index(psy_df["user"])
+    block = psy_df[PSYCHOMETRIC_COLUMNS].to_numpy(dtype=np.float64)
+    block.flags.writeable = False
+    return index, block
+
+
+def psychometric_block(path=PSYCHOMETRIC_FILE):
+    # Re-read only when the file changes
+    return _psychometric_block(path, os.path.getmtime(path))
+
+# =====================================================
+# MATRIX ASSEMBLY
+# =====================================================
+
+def infer_feature_columns(email_df, usb_df):
+    # Same column order as usb_agg.merge(email_agg)
+    columns = [col for col in usb_df.columns if col != "user"]
+    columns += [col for col in email_df.columns if col != "user" and col not in columns]
+    return columns
+
+
+def build_matrix(email_df, usb_df, feature_columns, users=None,
+                 mean_columns=(), psychometric_path=PSYCHOMETRIC_FILE,
+                 dtype=np.float64):
+    # Equivalent to groupby("user").sum() on both frames, an outer merge
+    # (users sorted), fillna(0), the psychometric left join with the C/A
+    # flip and the zero backfill of missing features, written straight into
+    # one (users × features) array in feature_columns order.
+    # Pass users to keep a fixed row order (left join on those users).
+    sources = [usb_df, email_df]
+
+    if users is None:
+        users = np.sort(pd.unique(np.concatenate(
+            [df["user"].to_numpy(dtype=object) for df in sources]
+        )))
+    else:
+        users = np.asarray(users, dtype=object)
+
+    n = len(users)
+    X = np.zeros((n, len(feature_columns)), dtype=dtype)
+    user_index = pd.Index(users)
+
+    source_rows = []
+    for df in sources:
+        rows = user_index.get_indexer(df["user"])
+        source_rows.append((df, rows, rows >= 0))
+
+    psy_rows = None
+
+    for j, col in enumerate(feature_columns):
+
+        if col in PSYCHOMETRIC_COLUMNS:
+            if psy_rows is None:
+                psy_index, psy_block = psychometric_block(psychometric_path)
+                psy_rows = psy_index.get_indexer(users)
+                psy_found = psy_rows >= 0
+            k = PSYCHOMETRIC_COLUMNS.index(col)
+            X[psy_found, j] = psy_block[psy_rows[psy_found], k]
+            if col in FLIPPED_COLUMNS:
+                np.subtract(100, X[:, j], out=X[:, j])
+            continue
+
+        for df, rows, found in source_rows:
+            if col not in df.columns:
+                continue
+
+            values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+            present = found & ~np.isnan(values)
+            X[:, j] = np.bincount(rows[present], weights=values[present], minlength=n)
+
+            if col in mean_columns:
+                counts = np.bincount(rows[present], minlength=n)
+                np.divide(X[:, j], counts, out=X[:, j], where=counts > 0)
+            break
+
+    return users, X
+
+
+def scale(scaler, X):
+    # StandardScaler.transform, in place on X
+    X -= scaler.mean_
+    X /= scaler.scale_
+    return X
+
+
+def feature_frame(users, X, feature_columns):
+    final_df = pd.DataFrame(X, columns=feature_columns, copy=True)
+    final_df.insert(0, "user", users)
+    return final_df
+
+
+def load_cumulative_matrix(feature_columns=None, workspace=None):
+    workspace = Workspace(workspace)
+    email_df, usb_df = workspace.load_cumulatives()
+
+    if feature_columns is None:
+        feature_columns = infer_feature_columns(email_df, usb_df)
+
+    users, X = build_matrix(email_df, usb_df, feature_columns)
+
+    # Rolling-window columns come from the workspace's ring buffers
+    if uses_rolling(feature_columns):
+        rolling = load_rolling(workspace)
+        if rolling is not None:
+            rolling.fill(users, X, feature_columns)
+
+    return users, X, feature_columns
@@ -0,0 +1,338 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from features import build_matrix, scale
+from peer_groups import score_users
+from pipeline import score_frame
+from rules import RuleEngine
+from schemas import read_daily
+from scoring import ScoringBackend, day_files
+from state import Workspace, load_bundle
+from synthetic import write_months
+
+# =====================================================
+# SETUP
+# =====================================================
+
+# Replays generated month folders through the original logic (the
+# reference below: cumulative CSVs, groupby().sum() of every column
+# including avg_email_size, outer merge, fillna(0), scaler.transform,
+# decision_function, `score <= threshold`) and through the code paths the
+# dashboards and retraining use today, then checks that they agree:
+#   day level    scores per user within --atol, identical alert sets;
+#                every path scores with the same (current) bundle
+#   month level  retrain: same feature columns, threshold within --atol,
+#                same scores and alerts on the month's population
+# and prints the timings side by side. Exits with 1 on any mismatch.
+#
+# A new fast path is checked by adding a class with start_month() and
+# day() to DAY_PATHS.
+
+RETRAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "make_model_repeated.py")
+
+# =====================================================
+# REFERENCE (ORIGINAL LOGIC, KEPT VERBATIM IN SPIRIT)
+# =====================================================
+
+EMAIL_COLUMNS = ["user", "total_emails", "external_emails", "attachments_sent", "bcc_in_email", "avg_email_size"]
+USB_COLUMNS = ["user", "usb_insertions", "files_accessed", "sensitive_files_accessed"]
+
+
+def safe_read(path, cols):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=cols)
+    if os.path.getsize(path) <= 2:
+        return pd.DataFrame(columns=cols)
+    return pd.read_csv(path)
+
+
+def reference_aggregate(email_cum, usb_cum):
+    usb_agg = usb_cum.groupby("user").sum().reset_index()
+    email_agg = email_cum.groupby("user").sum().reset_index()
+
+    final_df = usb_agg.merge(email_agg, on="user", how="outer")
+    final_df.fillna(0, inplace=True)
+    return final_df
+
+
+def reference_retrain(email_cum, usb_cum):
+    final_df = reference_aggregate(email_cum, usb_cum)
+    feature_columns = [col for col in final_df.columns if col != "user"]
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(final_df[feature_columns])
+
+    model = IsolationForest(n_estimators=200, contamination=0.05, random_state=42)
+    model.fit(X_scaled)
+
+    scores = model.decision_function(X_scaled)
+    threshold = np.percentile(scores, 5)
+    return final_df["user"].to_numpy(), scores, feature_columns, threshold
+
+
+class ReferencePath:
+
+    name = "reference"
+
+    def __init__(self, root):
+        self.email_path = os.path.join(root, "email_cumulative.csv")
+        self.usb_path = os.path.join(root, "usb_cumulative.csv")
+        os.makedirs(root, exist_ok=True)
+
+    def start_month(self):
+        for path in [self.email_path, self.usb_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cumulatives(self):
+        return safe_read(self.email_path, EMAIL_COLUMNS), safe_read(self.usb_path, USB_COLUMNS)
+
+    def day(self, month_folder, day, bundle):
+        email_file, usb_file = day_files(month_folder, day)
+        email_daily = pd.read_csv(email_file)
+        usb_daily = pd.read_csv(usb_file)
+
+        email_cum, usb_cum = self.cumulatives()
+        email_cum = pd.concat([email_cum, email_daily], ignore_index=True)
+        usb_cum = pd.concat([usb_cum, usb_daily], ignore_index=True)
+        email_cum.to_csv(self.email_path, index=False)
+        usb_cum.to_csv(self.usb_path, index=False)
+
+        if bundle is None:
+            return None
+
+        model, scaler, feature_columns, threshold = bundle
+        final_df = reference_aggregate(email_cum, usb_cum)
+        for col in feature_columns:
+            if col not in final_df.columns:
+                final_df[col] = 0
+
+        X_scaled = scaler.transform(final_df[feature_columns])
+        return final_df["user"].to_numpy(), model.decision_function(X_scaled)
+
+# =====================================================
+# CURRENT PATHS
+# =====================================================
+
+class MonitorPath:
+
+    # monitor.py: workspace cumulatives, build_matrix, in-place scaling
+    name = "monitor"
+
+    def __init__(self, root):
+        self.workspace = Workspace(root)
+
+    def start_month(self):
+        self.workspace.initialize()
+
+    def day(self, month_folder, day, bundle):
+        email_cum, usb_cum = self.workspace.append_day(*read_daily(*day_files(month_folder, day)))
+        if bundle is None:
+            return None
+
+        model, scaler, feature_columns, threshold = bundle
+        users, X = build_matrix(email_cum, usb_cum, feature_columns)
+        X_scaled = scale(scaler, X)
+        scores, _, _ = score_users(model, threshold, None, users, X_scaled)
+        return users, scores
+
+
+class AppPath:
+
+    # app.py: the shared ScoringBackend (incremental month-to-date frames;
+    # its time includes the policy rules)
+    name = "app"
+
+    def __init__(self, root):
+        self.backend = None
+
+    def start_month(self):
+        pass
+
+    def day(self, month_folder, day, bundle):
+        if bundle is None:
+            return None
+        if self.backend is None:
+            # Its rules need the limits the first retrain writes
+            self.backend = ScoringBackend()
+        result = self.backend.score_day(month_folder, day)
+        return result.final_df["user"].to_numpy(), result.final_df["anomaly_score"].to_numpy()
+
+
+class EnginePath:
+
+    # engine.py: month-to-date frames kept in memory, pipeline.score_frame
+    # (includes the day's policy rules)
+    name = "engine"
+
+    def __init__(self, root):
+        self.start_month()
+
+    def start_month(self):
+        # Rule limits are rewritten by the month-end retrain
+        self.email_cum = self.usb_cum = self.rules = None
+
+    def day(self, month_folder, day, bundle):
+        email_daily, usb_daily = read_daily(*day_files(month_folder, day))
+        if self.email_cum is None:
+            self.email_cum, self.usb_cum = email_daily, usb_daily
+        else:
+            self.email_cum = pd.concat([self.email_cum, email_daily], ignore_index=True)
+            self.usb_cum = pd.concat([self.usb_cum, usb_daily], ignore_index=True)
+        if bundle is None:
+            return None
+
+        if self.rules is None:
+            self.rules = RuleEngine()
+        final_df, _, scores, _ = score_frame(
+            bundle, None, self.rules, self.email_cum, self.usb_cum, email_daily, usb_daily
+        )
+        return final_df["user"].to_numpy(), scores
+
+
+DAY_PATHS = [MonitorPath, AppPath, EnginePath]
+
+# =====================================================
+# COMPARISON
+# =====================================================
+
+def compare(reference, candidate, threshold, atol):
+    # Aligned on user; a user missing on either side is a mismatch
+    ref_users, ref_scores = reference
+    users, scores = candidate
+    ref = pd.Series(ref_scores, index=pd.Index(ref_users).astype(str))
+    new = pd.Series(scores, index=pd.Index(users).astype(str))
+
+    missing = ref.index.symmetric_difference(new.index)
+    new = new.reindex(ref.index)
+    diff = float(np.nanmax(np.abs(new.to_numpy() - ref.to_numpy()))) if len(ref) else 0.0
+
+    ref_alerts = set(ref.index[ref.to_numpy() <= threshold])
+    new_alerts = set(new.index[new.to_numpy() <= threshold])
+    alert_diff = len(ref_alerts ^ new_alerts)
+
+    return {
+        "users": len(ref),
+        "missing_users": len(missing),
+        "max_abs_diff": diff,
+        "alerts": len(ref_alerts),
+        "alert_diff": alert_diff,
+        "ok": len(missing) == 0 and diff <= atol and alert_diff == 0,
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start
+
+
+def run(labels, n_days, atol):
+    reference = ReferencePath("golden_reference")
+    paths = [path("golden_" + path.name) for path in DAY_PATHS]
+    retrain_workspace = Workspace("golden_retrain")
+    rows = []
+    bundle = None
+
+    for label in labels:
+        month_folder = f"{label}_email"
+        for path in [reference] + paths:
+            path.start_month()
+
+        for day in range(1, n_days + 1):
+            ref, ref_seconds = timed(reference.day, month_folder, day, bundle)
+            for path in paths:
+                result, seconds = timed(path.day, month_folder, day, bundle)
+                if bundle is None:
+                    continue
+                rows.append({
+                    "level": "day", "month": label, "day": day, "path": path.name,
+                    "ref_ms": ref_seconds * 1000, "new_ms": seconds * 1000,
+                    **compare(ref, result, float(bundle[3]), atol)
+                })
+
+        # Month end: original retrain vs make_model_repeated.py on the same
+        # month, both from scratch (--force: no drift-based skip)
+        email_cum, usb_cum = reference.cumulatives()
+        (ref_users, ref_scores, ref_columns, ref_threshold), ref_seconds = timed(reference_retrain, email_cum, usb_cum)
+
+        retrain_workspace.initialize()
+        retrain_workspace.append_day(email_cum, usb_cum)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, RETRAIN, "--force", "--workspace", retrain_workspace.root],
+                       check=True, stdout=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+
+        bundle = load_bundle()
+        model, scaler, feature_columns, threshold = bundle
+        users, X = build_matrix(email_cum, usb_cum, feature_columns)
+        new_scores = model.decision_function(scale(scaler, X))
+
+        check = compare((ref_users, ref_scores), (users, new_scores), float(ref_threshold), atol)
+        threshold_diff = abs(float(threshold) - float(ref_threshold))
+        check["ok"] = check["ok"] and feature_columns == ref_columns and threshold_diff <= atol
+        rows.append({
+            "level": "month", "month": label, "day": None, "path": "retrain",
+            "ref_ms": ref_seconds * 1000, "new_ms": seconds * 1000,
+            **check, "threshold_diff": threshold_diff,
+        })
+
+    return pd.DataFrame(rows)
+
+
+def print_report(report):
+    report = report.assign(speedup=report["ref_ms"] / report["new_ms"])
+    columns = ["level", "month", "day", "path", "users", "alerts", "ref_ms", "new_ms", "speedup",
+               "max_abs_diff", "alert_diff", "ok"]
+    print("\n==============================")
+    print(report[columns].to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+
+    print("\nTotals (reference vs current):")
+    for (level, path), group in report.groupby(["level", "path"], sort=False):
+        ref, new = group["ref_ms"].sum(), group["new_ms"].sum()
+        print(f"   {level} / {path}: {ref:.0f} ms vs {new:.0f} ms ({ref / new:.2f}×), "
+              f"{(~group['ok']).sum()} mismatches of {len(group)}")
+    print("==============================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reference-vs-current equivalence check with timings")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--missing", type=float, default=0.02,
+                        help="share of users absent from each day's email / USB file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--atol", type=float, default=1e-9)
+    parser.add_argument("--workdir", default="golden_env")
+    parser.add_argument("--reuse", action="store_true", help="keep existing month folders in --workdir")
+    parser.add_argument("--out", default=None, help="write the per-day table as CSV")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    out = os.path.abspath(args.out) if args.out else None
+    if args.reuse and os.path.exists(workdir):
+        labels = sorted(
+            (f.replace("_email", "") for f in os.listdir(workdir) if f.endswith("_email")),
+            key=lambda label: pd.to_datetime(label, format="%b_%Y")
+        )
+    else:
+        print(f"🧪 Generating {args.users} users × {args.months} months × {args.days} days in {workdir}")
+        labels = write_months(workdir, args.users, args.months, args.days, args.seed, args.missing)
+    os.chdir(workdir)
+
+    report = run(labels, args.days, args.atol)
+    print_report(report)
+    if out:
+        report.to_csv(out, index=False)
+
+    if not report["ok"].all():
+        print("❌ Current paths differ from the reference")
+        sys.exit(1)
+    print("✅ All paths match the reference")
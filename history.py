@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from glob import glob
+import numpy as np
+import pandas as pd
+from features import PSYCHOMETRIC_COLUMNS, PSYCHOMETRIC_FILE, build_matrix, infer_feature_columns
+from compaction import ARCHIVE_DIR, archived_months, read_archive
+from shap_store import model_version
+from state import atomic_write, file_lock, load_bundle, save_npy
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# history/<month>/features.npy          users × columns float32 (raw, unscaled)
+#                /users.npy             fixed-width user ids (row order)
+#                /meta.json             columns, rows, source
+#                /scores_<version>.npy  decision_function per user for one model
+# Everything is opened with mmap_mode="r", so a backtest pages in only the
+# rows and columns it touches.
+
+HISTORY_DIR = "history"
+
+
+def parse_month(label):
+    return datetime.strptime(label, "%b_%Y")
+
+
+def month_dir(label, history_dir=HISTORY_DIR):
+    return os.path.join(history_dir, label)
+
+
+def months(history_dir=HISTORY_DIR):
+    labels = [
+        os.path.basename(os.path.dirname(path))
+        for path in glob(os.path.join(history_dir, "*", "meta.json"))
+    ]
+    return sorted(labels, key=parse_month)
+
+# =====================================================
+# WRITE (ONCE PER MONTH)
+# =====================================================
+
+def write_month(label, email_df, usb_df, history_dir=HISTORY_DIR, source=None,
+                psychometric_path=PSYCHOMETRIC_FILE):
+    # Raw month-end totals for every column the month has, plus the
+    # psychometric block, so any later model's feature list can be served
+    if len(email_df) == 0 and len(usb_df) == 0:
+        return None
+
+    columns = infer_feature_columns(email_df, usb_df)
+    if os.path.exists(psychometric_path):
+        columns += [col for col in PSYCHOMETRIC_COLUMNS if col not in columns]
+
+    users, X = build_matrix(email_df, usb_df, columns, psychometric_path=psychometric_path, dtype=np.float32)
+
+    path = month_dir(label, history_dir)
+    os.makedirs(path, exist_ok=True)
+    with file_lock(os.path.join(path, "features.npy")):
+        save_npy(os.path.join(path, "features.npy"), X)
+        save_npy(os.path.join(path, "users.npy"), np.asarray(users).astype(str))
+        with atomic_write(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"columns": columns, "rows": len(users), "source": source}, f)
+        # Scores belong to the old features
+        for stale in glob(os.path.join(path, "scores_*.npy")):
+            os.remove(stale)
+
+    return path
+
+# =====================================================
+# READ (ON DEMAND)
+# =====================================================
+
+class MonthArrays:
+
+    def __init__(self, label, history_dir=HISTORY_DIR):
+        self.label = label
+        self.path = month_dir(label, history_dir)
+        with file_lock(os.path.join(self.path, "features.npy"), shared=True):
+            with open(os.path.join(self.path, "meta.json")) as f:
+                self.meta = json.load(f)
+            self.features = np.load(os.path.join(self.path, "features.npy"), mmap_mode="r")
+            self.users = np.load(os.path.join(self.path, "users.npy"), mmap_mode="r")
+        self.columns = self.meta["columns"]
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def column(self, name):
+        return self.features[:, self.columns.index(name)]
+
+    def chunks(self, feature_columns, chunk_size=65536):
+        # float64 blocks in feature_columns order; columns the month lacks are 0
+        index = [self.columns.index(col) if col in self.columns else -1 for col in feature_columns]
+        present = [i for i, j in enumerate(index) if j >= 0]
+        source = [index[i] for i in present]
+
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            block = np.zeros((stop - start, len(feature_columns)))
+            block[:, present] = self.features[start:stop][:, source]
+            yield start, stop, block
+
+    def scores_path(self, version):
+        return os.path.join(self.path, f"scores_{version}.npy")
+
+    def scores(self, version):
+        path = self.scores_path(version)
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+# =====================================================
+# SCORING (CHUNKED, WRITTEN STRAIGHT TO DISK)
+# =====================================================
+
+def score_month(month, model, scaler, feature_columns, version, chunk_size=65536):
+    existing = month.scores(version)
+    if existing is not None:
+        return existing
+
+    path = month.scores_path(version)
+    tmp = f"{path}.tmp"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float64, shape=(len(month),))
+
+    for start, stop, block in month.chunks(feature_columns, chunk_size):
+        block -= scaler.mean_
+        block /= scaler.scale_
+        out[start:stop] = model.decision_function(block)
+
+    out.flush()
+    del out
+    os.replace(tmp, path)
+    return month.scores(version)
+
+
+def backtest(labels=None, chunk_size=65536, history_dir=HISTORY_DIR):
+    model, scaler, feature_columns, threshold = load_bundle()
+    version = model_version()
+
+    rows = []
+    previous = None
+
+    for label in labels or months(history_dir):
+        month = MonthArrays(label, history_dir)
+        start = time.perf_counter()
+        scores = score_month(month, model, scaler, feature_columns, version, chunk_size)
+        elapsed = time.perf_counter() - start
+
+        flagged = np.flatnonzero(scores <= threshold)
+        alerted = set(month.users[flagged].tolist())
+        repeat = len(alerted & previous) / len(alerted) if previous is not None and alerted else float("nan")
+        previous = alerted
+
+        rows.append({
+            "month": label,
+            "users": len(month),
+            "alerts": len(flagged),
+            "alert_rate": len(flagged) / max(len(month), 1),
+            "mean_score": float(np.mean(scores)),
+            "repeat_alert_share": repeat,
+            "score_seconds": elapsed,
+        })
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory-mapped monthly history and backtests")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    backfill_cmd = sub.add_parser("backfill", help="convert archived cumulatives (CSV or compacted)")
+    backfill_cmd.add_argument("--archive", default=ARCHIVE_DIR)
+
+    test_cmd = sub.add_parser("backtest", help="score every stored month with the current model")
+    test_cmd.add_argument("--months", nargs="*")
+    test_cmd.add_argument("--chunk-size", type=int, default=65536)
+
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        for label in archived_months(args.archive):
+            try:
+                email_cum = read_archive(label, "email", args.archive)
+                usb_cum = read_archive(label, "usb", args.archive)
+            except FileNotFoundError:
+                continue
+            path = write_month(label, email_cum, usb_cum, source=email_cum.attrs["source"])
+            print(f"✅ {label} → {path}" if path else f"⚠️ {label} empty — skipped")
+    else:
+        report = backtest(args.months, args.chunk_size)
+        print(report.to_string(index=False))
@@ -0,0 +1,206 @@
+import argparse
+import os
+import time
+import joblib
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import IsolationForest
+from features import load_cumulative_matrix, scale
+from schemas import EMAIL_SCHEMA, USB_SCHEMA
+from state import Workspace, file_lock, save_bundle, dump, load_bundle, BUNDLE_LOCK
+
+# =====================================================
+# SLIDING-WINDOW SETTINGS
+# =====================================================
+
+WINDOW_TREES = 200      # forest size kept on disk (same as make_model_repeated.py)
+DAILY_TREES = 10        # trees replaced per daily update
+REFRESH_TREES = 50      # trees replaced at month end
+THRESHOLD_PERCENTILE = 5
+
+STATE_FILE = "incremental_state.pkl"   # kept in the workspace, like rolling_state.npz
+
+# =====================================================
+# SLIDING WINDOW FOREST
+# =====================================================
+
+def slide_forest(model, X_scaled, n_new, seed, calibrate=True):
+    # Grow n_new trees on the latest data with warm_start, then drop the
+    # n_new oldest trees so the forest never exceeds WINDOW_TREES.
+    # calibrate=False keeps offset_ (and so the scale of decision_function)
+    # where the last calibration left it.
+    window = len(model.estimators_)
+    n_new = min(n_new, window)
+    old_seeds = np.asarray(model._seeds)
+    offset = model.offset_
+
+    model.set_params(
+        warm_start=True,
+        n_estimators=window + n_new,
+        random_state=seed
+    )
+    model.fit(X_scaled)
+
+    # After a warm start the path-length tables cover every tree but _seeds
+    # only the new ones; rebuild it so all per-tree state (and
+    # estimators_samples_) stays aligned with estimators_ after the slice
+    model._seeds = np.concatenate([old_seeds, model._seeds])
+
+    model.estimators_ = model.estimators_[n_new:]
+    model.estimators_features_ = model.estimators_features_[n_new:]
+    model._average_path_length_per_tree = model._average_path_length_per_tree[n_new:]
+    model._decision_path_lengths = model._decision_path_lengths[n_new:]
+    model._seeds = model._seeds[n_new:]
+
+    model.set_params(warm_start=False, n_estimators=window)
+
+    # fit() recalibrated offset_ on the grown forest
+    if not calibrate:
+        model.offset_ = offset
+    elif model.contamination != "auto":
+        model.offset_ = np.percentile(
+            model.score_samples(X_scaled), 100.0 * model.contamination
+        )
+
+    return model
+
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        return joblib.load(path)
+    return {"updates": 0}
+
+
+def next_seed(state):
+    state["updates"] += 1
+    return 42 + state["updates"]
+
+
+def training_scale(X, scaler, feature_columns):
+    # Month-to-date totals grow with the day while the scaler was fitted on
+    # month-end totals. One factor (training mean over current mean of the
+    # summed activity columns) brings them to that scale; psychometric and
+    # rolling-window columns are not totals and stay as they are.
+    summed = np.isin(feature_columns, [col for col in {**USB_SCHEMA, **EMAIL_SCHEMA} if col != "user"])
+    current = X[:, summed].mean(axis=0).sum()
+    if current > 0:
+        X[:, summed] *= scaler.mean_[summed].sum() / current
+    return X
+
+# =====================================================
+# MODES
+# =====================================================
+
+def slide_baseline(n_new, workspace=None, daily=False):
+    # Exclusive for the whole read-modify-write so no update is lost.
+    # Daily slides see month-to-date totals: their trees are grown on them
+    # brought to the training scale, and offset_ and the threshold stay as
+    # calibrated. The month-end refresh sees a full month, comparable with
+    # the training snapshot, and recomputes both so the alert rate stays at
+    # THRESHOLD_PERCENTILE. Returns the threshold in use.
+    workspace = Workspace(workspace)
+    state_path = workspace.path(STATE_FILE)
+
+    with file_lock(BUNDLE_LOCK):
+        model = joblib.load("baseline_model.pkl")
+        scaler = joblib.load("baseline_scaler.pkl")
+        feature_columns = joblib.load("baseline_features.pkl")
+
+        _, X, _ = load_cumulative_matrix(feature_columns, workspace.root)
+        if len(X) == 0:
+            print("⚠️ No cumulative data — forest unchanged")
+            return None
+
+        if daily:
+            X = training_scale(X, scaler, feature_columns)
+        X_scaled = scale(scaler, X)
+
+        state = load_state(state_path)
+        slide_forest(model, X_scaled, n_new, next_seed(state), calibrate=not daily)
+
+        if daily:
+            threshold = float(np.load("relative_threshold.npy"))
+            save_bundle(model)
+        else:
+            threshold = np.percentile(model.decision_function(X_scaled), THRESHOLD_PERCENTILE)
+            save_bundle(model, arrays={"relative_threshold": threshold})
+        dump(state, state_path)
+
+    return threshold
+
+
+def daily_update(workspace=None):
+    threshold = slide_baseline(DAILY_TREES, workspace, daily=True)
+    if threshold is not None:
+        print(f"✅ Forest updated ({DAILY_TREES} of {WINDOW_TREES} trees replaced, threshold kept at {threshold:.4f})")
+
+
+def month_end_refresh(workspace=None):
+    threshold = slide_baseline(REFRESH_TREES, workspace)
+    if threshold is not None:
+        print(f"✅ Baseline refreshed ({REFRESH_TREES} trees replaced, threshold {threshold:.4f})")
+
+# =====================================================
+# BENCHMARK VS FULL RETRAIN
+# =====================================================
+
+def alert_agreement(flags_a, flags_b):
+    union = np.logical_or(flags_a, flags_b).sum()
+    if union == 0:
+        return 1.0
+    return np.logical_and(flags_a, flags_b).sum() / union
+
+
+def benchmark(workspace=None):
+    model, scaler, feature_columns, _ = load_bundle()
+
+    _, X, _ = load_cumulative_matrix(feature_columns, workspace)
+
+    # Full retrain, exactly as make_model_repeated.py
+    start = time.perf_counter()
+    full_scaler = StandardScaler()
+    X_full = full_scaler.fit_transform(X)
+    full_model = IsolationForest(
+        n_estimators=200,
+        contamination=0.05,
+        random_state=42
+    )
+    full_model.fit(X_full)
+    full_scores = full_model.decision_function(X_full)
+    full_threshold = np.percentile(full_scores, THRESHOLD_PERCENTILE)
+    full_time = time.perf_counter() - start
+
+    # Cheap refresh of the current baseline
+    start = time.perf_counter()
+    X_scaled = scale(scaler, X)
+    slide_forest(model, X_scaled, REFRESH_TREES, seed=0)
+    inc_scores = model.decision_function(X_scaled)
+    inc_threshold = np.percentile(inc_scores, THRESHOLD_PERCENTILE)
+    inc_time = time.perf_counter() - start
+
+    full_flags = full_scores <= full_threshold
+    inc_flags = inc_scores <= inc_threshold
+
+    print("\n==============================")
+    print(f"Users: {len(X)}")
+    print(f"Full retrain:  {full_time:.3f}s ({int(full_flags.sum())} alerts)")
+    print(f"Refresh:       {inc_time:.3f}s ({int(inc_flags.sum())} alerts)")
+    print(f"Speedup:       {full_time / inc_time:.1f}x")
+    print(f"Alert overlap: {alert_agreement(full_flags, inc_flags):.2%} (Jaccard)")
+    print(f"Score corr:    {np.corrcoef(full_scores, inc_scores)[0, 1]:.4f}")
+    print("==============================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental sliding-window baseline updates")
+    parser.add_argument("mode", choices=["update", "refresh", "benchmark"])
+    parser.add_argument("--workspace", default=None,
+                        help="directory holding the cumulatives and update state (default: $WORKSPACE or .)")
+    args = parser.parse_args()
+
+    if args.mode == "update":
+        daily_update(args.workspace)
+    elif args.mode == "refresh":
+        month_end_refresh(args.workspace)
+    else:
+        benchmark(args.workspace)
@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from schemas import read_daily
+from state import Workspace
+from synthetic import write_months
+
+try:
+    import psutil
+except ImportError:     # falls back to /proc, or no memory numbers
+    psutil = None
+
+# =====================================================
+# SETUP
+# =====================================================
+
+# A headless `streamlit run app.py` serves a synthetic population from its
+# own directory (month folders, limits, baseline model). Each simulated
+# analyst is a scripted client on the same websocket protocol as a browser
+# tab: it sends reruns with widget states and waits for the script to
+# finish, so every session shares the server's one ScoringBackend.
+# (AppTest runs the script in-process and is not safe to run from several
+# threads at once.)
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+RETRAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "make_model_repeated.py")
+
+ACTIONS = {"next_day": 0.5, "flagged": 0.3, "filter": 0.1, "switch_month": 0.1}
+
+
+def rss_mb(pid):
+    if psutil is not None:
+        return psutil.Process(pid).memory_info().rss / 2**20
+    if os.path.exists(f"/proc/{pid}/statm"):
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    return None
+
+# =====================================================
+# SYNTHETIC POPULATION
+# =====================================================
+
+def synthesize(directory, n_users, n_months, n_days, seed=0):
+    labels = write_months(directory, n_users, n_months, n_days, seed)
+
+    # Baseline from the first month, as after one simulated month
+    workspace = Workspace(directory)
+    workspace.initialize()
+    for day in range(1, n_days + 1):
+        workspace.append_day(*read_daily(
+            os.path.join(directory, f"{labels[0]}_email", f"email_{day}.csv"),
+            os.path.join(directory, f"{labels[0]}_usbfiles", f"usbfile_{day}.csv")
+        ))
+    subprocess.run([sys.executable, RETRAIN, "--force"], cwd=directory, check=True, stdout=subprocess.DEVNULL)
+    return labels
+
+# =====================================================
+# SERVER
+# =====================================================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, port):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP,
+         "--server.headless", "true", "--server.port", str(port),
+         "--browser.gatherUsageStats", "false"],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("Streamlit server did not start")
+
+# =====================================================
+# SESSIONS (ONE WEBSOCKET EACH)
+# =====================================================
+
+class Session:
+
+    def __init__(self, url, seed, timeout, max_days):
+        self.url = url
+        self.max_days = max_days
+        self.rng = np.random.default_rng(seed)
+        self.timeout = timeout
+        self.ws = None
+        self.widgets = {}       # label -> element, from the last run
+        self.values = {}        # widget id -> WidgetState we set
+        self.texts = []
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+        await self.rerun()
+
+    async def rerun(self, trigger=None):
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        states = message.rerun_script.widget_states.widgets
+        for widget_id, state in self.values.items():
+            if widget_id in {w.id for _, w in self.widgets.values()}:
+                states.append(state)
+        if trigger is not None:
+            states.append(WidgetState(id=trigger, trigger_value=True))
+        await self.ws.send(message.SerializeToString())
+
+        # st.rerun() ends a run early and the server starts the next one;
+        # the interaction is over when a run finishes normally
+        widgets, texts = {}, []
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout))
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    raise RuntimeError(f"{element.exception.type}: {element.exception.message}")
+                if element_type in ("button", "selectbox", "text_input"):
+                    widget = getattr(element, element_type)
+                    widgets[widget.label] = (element_type, widget)
+                elif element_type == "alert":
+                    texts.append(element.alert.body)
+            elif kind == "script_finished":
+                if forward.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    widgets, texts = {}, []
+                    continue
+                break
+        self.widgets, self.texts = widgets, texts
+
+    def find(self, text):
+        return next((w for label, (_, w) in self.widgets.items() if text in label), None)
+
+    async def click(self, text):
+        button = self.find(text)
+        if button is None:
+            raise RuntimeError(f"no '{text}' widget on screen")
+        await self.rerun(trigger=button.id)
+
+    async def choose(self, widget, value):
+        self.values[widget.id] = WidgetState(id=widget.id, string_value=value)
+        await self.rerun()
+
+    def shows(self, text):
+        return any(text in body for body in self.texts)
+
+    async def warm_up(self, max_days):
+        # Click through the baseline month (the first session to finish it
+        # triggers the shared retrain) until a day is scored
+        for _ in range(max_days):
+            await self.click("Next Day")
+            if self.shows("Day processed"):
+                return
+        raise RuntimeError("no scored day after the baseline month")
+
+    async def act(self, action):
+        if self.shows("All Months Processed"):
+            # Finished the last month: start over, as an analyst would
+            await self.click("Reset Engine")
+            self.values = {}
+            await self.warm_up(self.max_days)
+            return "warmup"
+        if action == "next_day":
+            await self.click("Next Day")
+        elif action == "switch_month":
+            month = self.find("Month")
+            if month is None or len(month.options) < 2:
+                # A single month (--months 1): nothing to switch to
+                return await self.act("next_day")
+            options = [o for o in month.options if o != month.options[month.default]]
+            await self.choose(month, options[self.rng.integers(len(options))])
+        elif action == "flagged":
+            picker = self.find("flagged user")
+            if picker is None:
+                # Nothing scored on screen yet: the click is a Next Day
+                return await self.act("next_day")
+            await self.choose(picker, picker.options[self.rng.integers(len(picker.options))])
+        elif action == "filter":
+            box = self.find("Filter by user")
+            if box is None:
+                return await self.act("next_day")
+            await self.choose(box, f"LT{self.rng.integers(10)}")
+        return action
+
+
+async def run_session(index, args, url, results, errors):
+    session = Session(url, args.seed + index, args.timeout, args.days + 2)
+    try:
+        await session.connect()
+        start = time.perf_counter()
+        await session.warm_up(session.max_days)
+        results.append(("warmup", time.perf_counter() - start))
+    except Exception as e:
+        errors.append(f"session {index} start: {type(e).__name__}: {e}")
+        return
+
+    names, weights = list(ACTIONS), np.array(list(ACTIONS.values()))
+    try:
+        for _ in range(args.interactions):
+            action = names[session.rng.choice(len(names), p=weights / weights.sum())]
+            start = time.perf_counter()
+            try:
+                done = await session.act(action)
+            except websockets.ConnectionClosed:
+                raise
+            except Exception as e:
+                # A page the script did not expect fails this interaction,
+                # not the whole run
+                errors.append(f"session {index} {action}: {type(e).__name__}: {e}")
+                continue
+            results.append((done, time.perf_counter() - start))
+            await asyncio.sleep(session.rng.exponential(args.think))
+    except websockets.ConnectionClosed as e:
+        errors.append(f"session {index}: connection closed ({e})")
+    finally:
+        await session.ws.close()
+
+
+async def sample_memory(pid, memory, interval=0.5):
+    while True:
+        value = rss_mb(pid)
+        if value is not None:
+            memory["peak_mb"] = max(memory.get("peak_mb", 0.0), value)
+        await asyncio.sleep(interval)
+
+
+async def run(args, url, pid):
+    results, errors = [], []
+    memory = {"start_mb": rss_mb(pid) if pid else None}
+    sampler = asyncio.create_task(sample_memory(pid, memory)) if memory["start_mb"] is not None else None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(i, args, url, results, errors) for i in range(args.sessions)))
+    wall = time.perf_counter() - start
+
+    if sampler is not None:
+        sampler.cancel()
+        memory["end_mb"] = rss_mb(pid)
+        memory["peak_mb"] = max(memory["peak_mb"], memory["end_mb"])
+    return results, errors, memory, wall
+
+# =====================================================
+# REPORT
+# =====================================================
+
+def report(results, memory, errors, wall):
+    by_action = defaultdict(list)
+    for action, seconds in results:
+        by_action[action].append(seconds * 1000)
+    by_action["all"] = [v for action in ACTIONS for v in by_action[action]]
+
+    rows = []
+    for action in ["warmup"] + list(ACTIONS) + ["all"]:
+        values = np.asarray(by_action[action])
+        if len(values) == 0:
+            continue
+        rows.append({
+            "action": action,
+            "count": len(values),
+            "p50_ms": np.percentile(values, 50),
+            "p95_ms": np.percentile(values, 95),
+            "p99_ms": np.percentile(values, 99),
+            "max_ms": values.max()
+        })
+
+    table = pd.DataFrame(rows)
+    measured = len(by_action["all"])
+    print("\n==============================")
+    print(table.round(1).to_string(index=False))
+    print(f"Wall time: {wall:.1f} s, {measured / wall:.2f} interactions/s (excl. warmup), errors: {len(errors)}")
+    for error in errors[:5]:
+        print("   ❌", error)
+    if memory["start_mb"] is not None:
+        print(f"Server RSS: {memory['start_mb']:.0f} MB at start, peak {memory['peak_mb']:.0f} MB, "
+              f"{memory['end_mb']:.0f} MB at end (+{memory['end_mb'] - memory['start_mb']:.0f} MB)")
+    print("==============================\n")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent scripted sessions against the Streamlit dashboard")
+    parser.add_argument("--users", type=int, default=5000, help="synthetic population size")
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--days", type=int, default=5, help="days per synthetic month")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--interactions", type=int, default=15, help="per session, after the baseline month")
+    parser.add_argument("--think", type=float, default=0.5, help="mean seconds between interactions")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per interaction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default="loadtest_env")
+    parser.add_argument("--reuse", action="store_true", help="keep an existing population in --workdir")
+    parser.add_argument("--url", default=None, help="existing server (ws://host:port/_stcore/stream)")
+    parser.add_argument("--pid", type=int, default=None, help="its process id, for memory")
+    parser.add_argument("--out", default=None, help="write the summary as JSON")
+    args = parser.parse_args()
+    if args.url is None and args.months < 2:
+        # Sessions only score from the second month on
+        parser.error("--months must be at least 2: the first month builds the baseline")
+
+    server = None
+    if args.url is None:
+        workdir = os.path.abspath(args.workdir)
+        if not (args.reuse and os.path.exists(os.path.join(workdir, "baseline_model.pkl"))):
+            print(f"🧪 Generating {args.users} users × {args.months} months × {args.days} days in {workdir}")
+            synthesize(workdir, args.users, args.months, args.days, args.seed)
+        port = free_port()
+        server = start_server(workdir, port)
+        url, pid = f"ws://127.0.0.1:{port}/_stcore/stream", server.pid
+    else:
+        url, pid = args.url, args.pid
+
+    print(f"👥 {args.sessions} sessions × {args.interactions} interactions → {url}")
+    try:
+        results, errors, memory, wall = asyncio.run(run(args, url, pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    table = report(results, memory, errors, wall)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({
+                "config": vars(args),
+                "actions": table.to_dict(orient="records"),
+                "wall_s": wall,
+                "errors": errors,
+                "memory": memory
+            }, f, indent=2)
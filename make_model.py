@@ -1,22 +1,38 @@
+import argparse
+import os
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
-from scipy.stats import percentileofscore
+from scipy.stats import rankdata
 import shap
-import joblib
+from sampling import sample_rows, chunked_scores, dynamic_limit
+from features import build_matrix, feature_frame, scale
+from drift import save_summary, summarize
+from schemas import read_email_events, read_usb
+from shap_store import model_version
+from state import file_lock, save_bundle, write_csv, BUNDLE_LOCK
 
 # =====================================================
-# LOAD DATA (MONTH M)
+# OPTIONS
 # =====================================================
 
-email_df = pd.read_csv("email.csv")
-usb_df = pd.read_csv("file_usb_activity.csv")
-psy_df = pd.read_csv("psychometric.csv")
+parser = argparse.ArgumentParser(description="Monthly baseline training")
+parser.add_argument("--sample-cap", type=int, default=None,
+                    help="fit on at most this many users (default: all)")
+parser.add_argument("--sample-method", choices=["stratified", "reservoir"], default="stratified")
+parser.add_argument("--chunk-size", type=int, default=65536,
+                    help="rows per scoring chunk for threshold and limits")
+parser.add_argument("--domains", default=os.environ.get("COMPANY_DOMAINS", "@company.com"),
+                    help="comma-separated internal email domains (tenants.py sets COMPANY_DOMAINS)")
+args = parser.parse_args()
+
+# =====================================================
+# LOAD DATA (MONTH M)
+# =====================================================
 
-email_df.columns = email_df.columns.str.strip()
-usb_df.columns = usb_df.columns.str.strip()
-psy_df.columns = psy_df.columns.str.strip()
+email_df = read_email_events("email.csv")
+usb_df = read_usb("file_usb_activity.csv")
 
 print("✅ Training Data Loaded")
 
@@ -24,10 +40,14 @@ print("✅ Training Data Loaded")
 # FEATURE ENGINEERING
 # =====================================================
 
-company_domain = "@company.com"
+company_domains = [
+    domain if domain.startswith("@") else f"@{domain}"
+    for domain in (part.strip().lower() for part in args.domains.split(","))
+    if domain
+]
 
 email_df["external_flag"] = email_df["to"].astype(str).str.lower().apply(
-    lambda x: 0 if company_domain in x else 1
+    lambda x: 0 if any(domain in x for domain in company_domains) else 1
 )
 
 email_features = email_df.groupby("user").agg(
@@ -38,22 +58,6 @@ email_features = email_df.groupby("user").agg(
     external_emails=("external_flag", "sum")
 ).reset_index()
 
-final_df = email_features.merge(usb_df, on="user", how="left")
-
-psy_df = psy_df.rename(columns={"user_id": "user"})
-
-final_df = final_df.merge(
-    psy_df[["user", "O", "C", "E", "A", "N"]],
-    on="user",
-    how="left"
-)
-
-final_df.fillna(0, inplace=True)
-
-# Flip personality logic (lower C/A = higher risk)
-final_df["C"] = 100 - final_df["C"]
-final_df["A"] = 100 - final_df["A"]
-
 # =====================================================
 # WEIGHTS
 # =====================================================
@@ -75,17 +79,27 @@ weights = {
 }
 
 feature_columns = list(weights.keys())
-X = final_df[feature_columns].copy()
 
-for col in feature_columns:
-    X[col] *= weights[col]
+# Left join on email users; psychometric C/A flipped (lower C/A = higher risk)
+users, X = build_matrix(
+    email_features, usb_df, feature_columns,
+    users=email_features["user"]
+)
+
+final_df = feature_frame(users, X, feature_columns)
+
+X *= np.array([weights[col] for col in feature_columns])
+
+# Compact distribution summary for drift reports at the next retrain
+summary = summarize(X, feature_columns)
 
 # =====================================================
 # SCALING
 # =====================================================
 
 scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+scaler.fit(X)
+X_scaled = scale(scaler, X)
 
 # =====================================================
 # TRAIN ISOLATION FOREST
@@ -93,17 +107,23 @@ X_scaled = scaler.fit_transform(X)
 
 model = IsolationForest(
     n_estimators=300,
-    random_state=42
+    random_state=42,
+    n_jobs=-1
 )
 
-model.fit(X_scaled)
+train_rows = sample_rows(X_scaled, args.sample_cap, args.sample_method)
 
-scores = model.decision_function(X_scaled)
+if len(train_rows) < len(X_scaled):
+    print(f"🎯 Fitting on {len(train_rows)} of {len(X_scaled)} users ({args.sample_method})")
+    model.fit(X_scaled[train_rows])
+else:
+    model.fit(X_scaled)
+
+scores = chunked_scores(model, X_scaled, args.chunk_size)
 
 final_df["anomaly_score"] = scores
-final_df["trust_percentile"] = [
-    percentileofscore(scores, s) for s in scores
-]
+# Same as percentileofscore(scores, s) for every s, in O(n log n)
+final_df["trust_percentile"] = rankdata(scores) * 100 / len(scores)
 
 # =====================================================
 # MONTHLY FLAG = BOTTOM 5% ONLY (SCRIPT 2 LOGIC)
@@ -165,13 +185,8 @@ for idx in flagged.index:
 # (FOR FUTURE DAILY / POLICY USE)
 # =====================================================
 
-mean_sensitive = final_df["sensitive_files_accessed"].mean()
-std_sensitive = final_df["sensitive_files_accessed"].std()
-sensitive_dynamic = mean_sensitive + 3 * std_sensitive
-
-mean_usb = final_df["usb_insertions"].mean()
-std_usb = final_df["usb_insertions"].std()
-usb_dynamic = mean_usb + 3 * std_usb
+sensitive_dynamic = dynamic_limit(final_df["sensitive_files_accessed"], args.chunk_size)
+usb_dynamic = dynamic_limit(final_df["usb_insertions"], args.chunk_size)
 
 HARD_SENSITIVE_LIMIT = 100
 HARD_SENSITIVE_RATIO = 0.80
@@ -182,18 +197,19 @@ HARD_USB_LIMIT = 10
 # SAVE BASELINE FOR DAILY MONITORING
 # =====================================================
 
-joblib.dump(model, "baseline_model.pkl")
-joblib.dump(scaler, "baseline_scaler.pkl")
-joblib.dump(feature_columns, "baseline_features.pkl")
-
-np.save("relative_threshold.npy", relative_threshold)
-np.save("sensitive_dynamic.npy", sensitive_dynamic)
-np.save("usb_dynamic.npy", usb_dynamic)
+with file_lock(BUNDLE_LOCK):
+    save_bundle(model, scaler, feature_columns, arrays={
+        "relative_threshold": relative_threshold,
+        "sensitive_dynamic": sensitive_dynamic,
+        "usb_dynamic": usb_dynamic,
+        "hard_sensitive_limit": HARD_SENSITIVE_LIMIT,
+        "hard_sensitive_ratio": HARD_SENSITIVE_RATIO,
+        "hard_external_ratio": HARD_EXTERNAL_RATIO,
+        "hard_usb_limit": HARD_USB_LIMIT
+    })
 
-np.save("hard_sensitive_limit.npy", HARD_SENSITIVE_LIMIT)
-np.save("hard_sensitive_ratio.npy", HARD_SENSITIVE_RATIO)
-np.save("hard_external_ratio.npy", HARD_EXTERNAL_RATIO)
-np.save("hard_usb_limit.npy", HARD_USB_LIMIT)
+summary["threshold"] = float(relative_threshold)
+save_summary(model_version(), summary)
 
 # =====================================================
 # SAVE PER-USER DAILY LIMITS
@@ -217,7 +233,7 @@ user_thresholds = user_thresholds[[
     "usb_limit"
 ]]
 
-user_thresholds.to_csv("user_baseline_thresholds.csv", index=False)
+write_csv(user_thresholds, "user_baseline_thresholds.csv")
 
 print("\n✅ Baseline + Per-User Monitoring Thresholds Saved")
 print("✅ Monthly Analysis Completed")
@@ -1,40 +1,151 @@
-import pandas as pd
+import argparse
+import sys
+import time
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
-import joblib
+from sampling import sample_rows, chunked_scores, dynamic_limit
+from shap_store import model_version
+from drift import (
+    compare_snapshot, drift_report, is_stable, previous_baseline,
+    print_report, save_report, save_summary, summarize,
+    PSI_NEGLIGIBLE, SHIFT_NEGLIGIBLE
+)
+from features import build_matrix, infer_feature_columns, scale
+from metrics import registry
+from rolling import ROLLING_COLUMNS, load_rolling
+from peer_groups import (
+    PEER_FILE, assign_groups, cluster, fit_groups, load_mapping, load_peers, refresh_thresholds
+)
+from state import Workspace, dump, file_lock, remove, save_bundle, BUNDLE_LOCK
+
+# =====================================================
+# OPTIONS
+# =====================================================
+
+parser = argparse.ArgumentParser(description="Retrain baseline from cumulative aggregates")
+parser.add_argument("--sample-cap", type=int, default=None,
+                    help="fit on at most this many users (default: all)")
+parser.add_argument("--sample-method", choices=["stratified", "reservoir"], default="stratified")
+parser.add_argument("--chunk-size", type=int, default=65536,
+                    help="rows per scoring chunk for threshold and limits")
+parser.add_argument("--workspace", default=None,
+                    help="directory holding the cumulatives (default: $WORKSPACE or .)")
+parser.add_argument("--peer-groups", type=int, default=None,
+                    help="also fit one model per K-means peer group of this many groups")
+parser.add_argument("--peer-map", default=None,
+                    help="CSV of user,group to use instead of clustering")
+parser.add_argument("--workers", type=int, default=None,
+                    help="processes for peer-group fits (default: all cores)")
+parser.add_argument("--force", action="store_true",
+                    help="always refit, even when drift is below the limits")
+parser.add_argument("--max-psi", type=float, default=PSI_NEGLIGIBLE,
+                    help="refit when any feature's PSI reaches this")
+parser.add_argument("--max-shift", type=float, default=SHIFT_NEGLIGIBLE,
+                    help="refit when any feature mean moves this many old standard deviations")
+parser.add_argument("--rolling", action="store_true",
+                    help="add 7/30-day rolling-window features from the workspace's ring buffers")
+args = parser.parse_args()
+
+started = time.perf_counter()
+telemetry = registry("retrain")
+
+
+def record_retrain(outcome, version, threshold, n_users):
+    telemetry.observe("insider_retrain_seconds", time.perf_counter() - started, outcome=outcome)
+    telemetry.inc("insider_retrains_total", outcome=outcome)
+    telemetry.set("insider_training_users", n_users)
+    telemetry.set("insider_threshold", threshold)
+    telemetry.info("insider_model_info", version=version)
+    telemetry.flush()
 
 # =====================================================
 # LOAD CUMULATIVE DATA
 # =====================================================
 
-email_df = pd.read_csv("email_cumulative.csv")
-usb_df = pd.read_csv("usb_cumulative.csv")
+workspace = Workspace(args.workspace)
+email_df, usb_df = workspace.load_cumulatives()
+
+rolling = load_rolling(workspace) if args.rolling else None
+if args.rolling and rolling is None:
+    print("⚠️ No rolling state in workspace — training without rolling features")
 
 # =====================================================
-# AGGREGATE
+# AGGREGATE + FEATURES
 # =====================================================
 
-usb_agg = usb_df.groupby("user").sum().reset_index()
-email_agg = email_df.groupby("user").sum().reset_index()
+feature_columns = infer_feature_columns(email_df, usb_df)
+if rolling is not None:
+    feature_columns += ROLLING_COLUMNS
 
-final_df = usb_agg.merge(email_agg, on="user", how="outer")
-final_df.fillna(0, inplace=True)
+users, X = build_matrix(email_df, usb_df, feature_columns)
+if rolling is not None:
+    rolling.fill(users, X, feature_columns)
 
 # =====================================================
-# FEATURES
+# DYNAMIC LIMITS (PER-DAY ROWS, RAW VALUES)
 # =====================================================
 
-feature_columns = [col for col in final_df.columns if col != "user"]
+# The policy rules compare one day's activity against these, so they come
+# from the cumulative's daily rows, not the month-to-date totals in X
+sensitive_dynamic = dynamic_limit(usb_df["sensitive_files_accessed"].to_numpy(dtype=np.float64), args.chunk_size)
+usb_dynamic = dynamic_limit(usb_df["usb_insertions"].to_numpy(dtype=np.float64), args.chunk_size)
+
+# =====================================================
+# DRIFT INPUTS (RAW SNAPSHOT, BEFORE SCALING IN PLACE)
+# =====================================================
+
+summary = summarize(X, feature_columns)
+previous = previous_baseline()
+snapshot = compare_snapshot(previous, X, feature_columns, args.chunk_size) if previous else None
+
+# =====================================================
+# SKIP REFIT WHEN THE MONTH BARELY CHANGED
+# =====================================================
 
-X = final_df[feature_columns]
+# Peer options always refit (peer models are fitted with the new scaler)
+refit = args.force or args.peer_groups or args.peer_map or snapshot is None
+
+if not refit and is_stable(snapshot, args.max_psi, args.max_shift):
+    # Current model and scaler stay; only the thresholds follow the new scores
+    threshold = np.percentile(snapshot["old_scores"], 5)
+
+    # Peer forests saved with the current scaler stay too, with their group
+    # thresholds recomputed on this month's members
+    peers = load_peers()
+    if peers is not None:
+        old_columns = [feature_columns.index(col) for col in previous["feature_columns"]]
+        refresh_thresholds(peers, users, scale(previous["scaler"], X[:, old_columns]))
+        for name, group in sorted(peers["groups"].items()):
+            print(f"👥 {name}: {group['users']} users, threshold {group['threshold']:.4g}")
+
+    with file_lock(BUNDLE_LOCK):
+        save_bundle(arrays={
+            "relative_threshold": threshold,
+            "sensitive_dynamic": sensitive_dynamic,
+            "usb_dynamic": usb_dynamic
+        })
+        if peers is not None:
+            dump(peers, PEER_FILE)
+
+    # The model's training summary is kept, so drift is always measured
+    # against the data the forest was actually fitted on
+    report = drift_report(previous, snapshot, snapshot["old_scores"], threshold,
+                          previous["version"], retrained=False)
+    save_report(report)
+    print_report(report)
+    record_retrain("skipped", previous["version"], threshold, len(users))
+
+    print("✅ Threshold refreshed (refit skipped).")
+    sys.exit(0)
 
 # =====================================================
 # SCALE
 # =====================================================
 
 scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+scaler.fit(X)
+X_scaled = scale(scaler, X)
 
 # =====================================================
 # TRAIN MODEL
@@ -43,25 +154,72 @@ X_scaled = scaler.fit_transform(X)
 model = IsolationForest(
     n_estimators=200,
     contamination=0.05,
-    random_state=42
+    random_state=42,
+    n_jobs=-1
 )
 
-model.fit(X_scaled)
+train_rows = sample_rows(X_scaled, args.sample_cap, args.sample_method)
+
+if len(train_rows) < len(X_scaled):
+    print(f"🎯 Fitting on {len(train_rows)} of {len(X_scaled)} users ({args.sample_method})")
+    model.fit(X_scaled[train_rows])
+else:
+    model.fit(X_scaled)
 
 # =====================================================
-# THRESHOLD
+# THRESHOLD (FULL POPULATION)
 # =====================================================
 
-scores = model.decision_function(X_scaled)
+scores = chunked_scores(model, X_scaled, args.chunk_size)
 threshold = np.percentile(scores, 5)
 
+# =====================================================
+# PEER GROUPS (OPTIONAL, ONE MODEL PER GROUP)
+# =====================================================
+
+peers = None
+
+if args.peer_map or args.peer_groups:
+    mapping = load_mapping(args.peer_map) if args.peer_map else None
+    kmeans = None if mapping is not None else cluster(X_scaled, args.peer_groups)
+    groups = assign_groups(users, X_scaled, mapping, kmeans)
+
+    peers = {
+        "groups": fit_groups(X_scaled, groups, args.workers),
+        "mapping": mapping,
+        "kmeans": kmeans
+    }
+    for name, group in sorted(peers["groups"].items()):
+        print(f"👥 {name}: {group['users']} users, threshold {group['threshold']:.4g}")
+
 # =====================================================
 # SAVE EVERYTHING
 # =====================================================
 
-joblib.dump(model, "baseline_model.pkl")
-joblib.dump(scaler, "baseline_scaler.pkl")
-joblib.dump(feature_columns, "baseline_features.pkl")
-np.save("relative_threshold.npy", threshold)
+with file_lock(BUNDLE_LOCK):
+    save_bundle(model, scaler, feature_columns, arrays={
+        "relative_threshold": threshold,
+        "sensitive_dynamic": sensitive_dynamic,
+        "usb_dynamic": usb_dynamic
+    })
+    # Peer models are tied to this scaler; drop stale ones
+    if peers is not None:
+        dump(peers, PEER_FILE)
+    else:
+        remove(PEER_FILE)
+
+# =====================================================
+# DRIFT REPORT (OLD VS NEW MODEL ON THIS SNAPSHOT)
+# =====================================================
+
+version = model_version()
+summary["threshold"] = float(threshold)
+save_summary(version, summary)
+
+if snapshot is not None:
+    report = drift_report(previous, snapshot, scores, threshold, version)
+    save_report(report)
+    print_report(report)
 
+record_retrain("refit", version, threshold, len(users))
 print("✅ Model retrained successfully.")
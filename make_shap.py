@@ -1,15 +1,21 @@
-import joblib
+import argparse
 import shap
-import pandas as pd
-import numpy as np
+from features import build_matrix, scale
+from shap_matrix import update_shap_matrix
+from shap_store import model_version
+from state import Workspace, dump, load_bundle
+
+parser = argparse.ArgumentParser(description="Precompute SHAP values for every user")
+parser.add_argument("--snapshot", required=True,
+                    help="day the workspace cumulatives cover, e.g. mar_2026_Day12; "
+                         "the dashboard looks rows up under this key")
+args = parser.parse_args()
 
 # =====================================================
 # LOAD TRAINED MODEL + SCALER + FEATURES
 # =====================================================
 
-model = joblib.load("baseline_model.pkl")
-scaler = joblib.load("baseline_scaler.pkl")
-feature_columns = joblib.load("baseline_features.pkl")
+model, scaler, feature_columns, _ = load_bundle()
 
 print("✅ Model, scaler, and feature list loaded.")
 
@@ -17,58 +23,21 @@ print("✅ Model, scaler, and feature list loaded.")
 # LOAD BASELINE DATA (SAME STRUCTURE USED IN TRAINING)
 # =====================================================
 
-email_df = pd.read_csv("email_cumulative.csv")
-usb_df = pd.read_csv("usb_cumulative.csv")
-psy_df = pd.read_csv("psychometric.csv")
-
-email_df.columns = email_df.columns.str.strip()
-usb_df.columns = usb_df.columns.str.strip()
-psy_df.columns = psy_df.columns.str.strip()
+email_df, usb_df = Workspace().load_cumulatives()
 
 # =====================================================
-# AGGREGATION (MUST MATCH TRAINING EXACTLY)
+# AGGREGATION + FEATURES (MUST MATCH TRAINING EXACTLY)
 # =====================================================
 
-usb_agg = usb_df.groupby("user").agg(
-    sensitive_files_accessed=("sensitive_files_accessed", "sum"),
-    files_accessed=("files_accessed", "sum"),
-    usb_insertions=("usb_insertions", "sum")
-).reset_index()
-
-email_agg = email_df.groupby("user").agg(
-    external_emails=("external_emails", "sum"),
-    attachments_sent=("attachments_sent", "sum"),
-    bcc_in_email=("bcc_in_email", "sum"),
-    avg_email_size=("avg_email_size", "mean"),
-    total_emails=("total_emails", "sum")
-).reset_index()
-
-final_df = usb_agg.merge(email_agg, on="user", how="outer")
-final_df.fillna(0, inplace=True)
-
-psy_df = psy_df.rename(columns={"user_id": "user"})
-
-final_df = final_df.merge(
-    psy_df[["user", "O", "C", "E", "A", "N"]],
-    on="user",
-    how="left"
-)
-
-final_df.fillna(0, inplace=True)
-
-final_df["C"] = 100 - final_df["C"]
-final_df["A"] = 100 - final_df["A"]
+# Summed like make_model_repeated.py and the dashboard, so the persisted
+# rows hash-match the ones scoring looks up; psychometric traits joined if
+# the baseline uses them (C/A flipped), missing features backfilled with 0
+users, X = build_matrix(email_df, usb_df, feature_columns)
 
-# =====================================================
-# PREPARE FEATURES
-# =====================================================
-
-for col in feature_columns:
-    if col not in final_df.columns:
-        final_df[col] = 0
+if len(users) == 0:
+    raise SystemExit("❌ No rows in the workspace cumulatives (already archived at month end?)")
 
-X = final_df[feature_columns].copy()
-X_scaled = scaler.transform(X)
+X_scaled = scale(scaler, X)
 
 print("✅ Data prepared for SHAP.")
 
@@ -84,17 +53,22 @@ explainer = shap.TreeExplainer(
 print("✅ SHAP TreeExplainer created.")
 
 # =====================================================
-# OPTIONAL: TEST COMPUTE SHAP VALUES
+# COMPUTE + PERSIST SHAP MATRIX (STALE ROWS ONLY)
 # =====================================================
 
-shap_values = explainer.shap_values(X_scaled)
+version = model_version()
+
+recomputed = update_shap_matrix(
+    explainer, X_scaled, users, feature_columns, version,
+    snapshot=args.snapshot
+)
 
-print("✅ SHAP values computed successfully.")
+print(f"✅ SHAP matrix saved to shap_cache/{version}/{args.snapshot}/ ({recomputed} of {len(users)} rows recomputed)")
 
 # =====================================================
 # SAVE EXPLAINER
 # =====================================================
 
-joblib.dump(explainer, "shap_explainer.pkl")
+dump(explainer, "shap_explainer.pkl")
 
 print("✅ SHAP explainer saved as shap_explainer.pkl")
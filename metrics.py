@@ -0,0 +1,283 @@
+import argparse
+import atexit
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from state import atomic_write, file_lock
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# metrics/<job>.prom   Prometheus text format, one file per job (engine,
+#                      monitor, retrain, dashboard, score_api), usable as a
+#                      node-exporter textfile directory as is.
+# Processes record into memory (a dict update under a lock) and merge
+# their deltas into the job file at flush points: end of a day, end of a
+# retrain, every FLUSH_EVERY seconds in long-running servers and at exit.
+# Counters and histograms therefore keep counting across the short-lived
+# monitor / retrain processes that engine.py starts.
+# `python metrics.py serve` exposes every job file on one HTTP endpoint.
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "metrics")
+FLUSH_EVERY = 5.0
+
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+FAMILIES = {
+    "insider_ingest_rows_total": ("counter", "Daily activity rows read, by source"),
+    "insider_quarantined_rows_total": ("counter", "Daily rows rejected by schema validation, by source"),
+    "insider_days_total": ("counter", "Simulated days processed"),
+    "insider_day_seconds": ("histogram", "Wall time of one simulated day"),
+    "insider_stage_seconds": ("histogram", "engine.py pipeline stage time per day (read_wait, score, write)"),
+    "insider_scored_users_total": ("counter", "Users scored"),
+    "insider_score_seconds": ("histogram", "Scoring latency (features, scaling, model, rules)"),
+    "insider_alerts_total": ("counter", "Alerts raised, by alert status"),
+    "insider_alerts": ("gauge", "Alerts on the last scored day"),
+    "insider_shap_seconds": ("histogram", "SHAP / attribution latency, by method"),
+    "insider_shap_explained_total": ("counter", "Alerts explained, by method"),
+    "insider_shap_lookups_total": ("counter", "Dashboard SHAP matrix lookups, by result"),
+    "insider_retrain_seconds": ("histogram", "Retrain duration, by outcome"),
+    "insider_retrains_total": ("counter", "Retrains, by outcome (refit or skipped)"),
+    "insider_training_users": ("gauge", "Users in the last training snapshot"),
+    "insider_threshold": ("gauge", "Relative threshold in use"),
+    "insider_model_info": ("gauge", "Model version in use"),
+    "insider_cache_total": ("counter", "Dashboard day-result cache lookups, by result"),
+    "insider_sink_queued_total": ("counter", "Alert records queued for delivery, by sink"),
+    "insider_sink_delivered_total": ("counter", "Alert records delivered, by sink"),
+    "insider_sink_dropped_total": ("counter", "Alert records dropped on a full queue, by sink"),
+    "insider_sink_failed_total": ("counter", "Alert records dead-lettered after the last retry, by sink"),
+    "insider_sink_retries_total": ("counter", "Batch delivery retries, by sink"),
+    "insider_sink_pending": ("gauge", "Alert records waiting in the sink queue, by sink"),
+    "insider_api_requests_total": ("counter", "Scoring API requests, by status"),
+    "insider_api_request_seconds": ("histogram", "Scoring API request latency"),
+    "insider_tenant_service_seconds": ("counter", "Worker time used, by tenant (tenants.py fair scheduling)"),
+    "insider_tenant_wait_seconds": ("histogram", "Time a ready tenant waited for a worker"),
+}
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# =====================================================
+# TEXT FORMAT
+# =====================================================
+
+def family_of(name):
+    if name in FAMILIES:
+        return name
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def parse(text):
+    # {(sample name, ((label, value), ...)): value}
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if line.startswith("#") or match is None:
+            continue
+        name, labels, value = match.groups()
+        labels = tuple(sorted(
+            (k, v.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\"))
+            for k, v in LABEL.findall(labels or "")
+        ))
+        samples[(name, labels)] = float(value)
+    return samples
+
+
+def sort_key(sample):
+    (name, labels), _ = sample
+    le = dict(labels).get("le")
+    # Buckets in le order (+Inf last), then _count, _sum
+    return (
+        [(k, v) for k, v in labels if k != "le"],
+        name,
+        float(le) if le is not None else 0.0,
+    )
+
+
+def render(samples):
+    by_family = defaultdict(list)
+    for sample in samples.items():
+        by_family[family_of(sample[0][0])].append(sample)
+
+    lines = []
+    for family in sorted(by_family, key=lambda f: list(FAMILIES).index(f) if f in FAMILIES else len(FAMILIES)):
+        kind, description = FAMILIES.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {description}")
+        lines.append(f"# TYPE {family} {kind}")
+        for (name, labels), value in sorted(by_family[family], key=sort_key):
+            label_text = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+            number = repr(int(value)) if float(value).is_integer() and abs(value) < 2 ** 53 else repr(value)
+            lines.append(f"{name}{{{label_text}}} {number}" if labels else f"{name} {number}")
+    return "\n".join(lines) + "\n"
+
+# =====================================================
+# REGISTRY (ONE PER JOB AND PROCESS)
+# =====================================================
+
+class Registry:
+
+    def __init__(self, job, directory=None):
+        self.job = job
+        self.path = os.path.join(directory or METRICS_DIR, f"{job}.prom")
+        self.lock = threading.Lock()
+        self.deltas = defaultdict(float)
+        self.histograms = {}        # (name, labels) -> [per-bucket counts, sum, count]
+        self.gauges = {}
+        self.cleared = set()
+        self.last_flush = time.monotonic()
+
+    def key(self, name, labels):
+        return (name, tuple(sorted({"job": self.job, **{k: str(v) for k, v in labels.items()}}.items())))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.deltas[self.key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        # One bucket slot per observation; made cumulative at flush
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(SECONDS_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect_left(SECONDS_BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def expand(self, histograms, deltas):
+        # Every bucket is written so the series exist from the first
+        # observation
+        for (name, labels), (counts, total, count) in histograms.items():
+            running = 0
+            for le, n in zip(SECONDS_BUCKETS + ["+Inf"], counts):
+                running += n
+                deltas[(f"{name}_bucket", tuple(sorted(labels + (("le", str(le)),))))] += running
+            deltas[(f"{name}_sum", labels)] += total
+            deltas[(f"{name}_count", labels)] += count
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = float(value)
+
+    def info(self, name, **labels):
+        # Single-sample gauge whose labels change (e.g. model version)
+        with self.lock:
+            self.cleared.add(name)
+            self.gauges = {k: v for k, v in self.gauges.items() if k[0] != name}
+            self.gauges[self.key(name, labels)] = 1.0
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, defaultdict(float)
+            histograms, self.histograms = self.histograms, {}
+            gauges, self.gauges = self.gauges, {}
+            cleared, self.cleared = self.cleared, set()
+            self.last_flush = time.monotonic()
+        self.expand(histograms, deltas)
+        if not (deltas or gauges):
+            return
+
+        with file_lock(self.path):
+            try:
+                with open(self.path) as f:
+                    samples = parse(f.read())
+            except FileNotFoundError:
+                samples = {}
+            samples = {k: v for k, v in samples.items() if k[0] not in cleared}
+            for key, value in deltas.items():
+                samples[key] = samples.get(key, 0.0) + value
+            samples.update(gauges)
+            with atomic_write(self.path, "w") as f:
+                f.write(render(samples))
+
+    def maybe_flush(self):
+        # For hot paths in long-running processes
+        if time.monotonic() - self.last_flush >= FLUSH_EVERY:
+            self.flush()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def registry(job):
+    with _registries_lock:
+        if job not in _registries:
+            _registries[job] = Registry(job)
+            atexit.register(_registries[job].flush)
+        return _registries[job]
+
+# =====================================================
+# EXPOSITION
+# =====================================================
+
+def collect(directory=None):
+    samples = {}
+    for path in sorted(glob(os.path.join(directory or METRICS_DIR, "*.prom"))):
+        with file_lock(path, shared=True), open(path) as f:
+            samples.update(parse(f.read()))
+    return render(samples)
+
+
+def serve(host, port, directory=None):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = collect(directory).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print(f"📈 Metrics on http://{host}:{port}/metrics (from {directory or METRICS_DIR}/)")
+    ThreadingHTTPServer((host, port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prometheus metrics from the pipeline")
+    parser.add_argument("--dir", default=None, help=f"job files (default {METRICS_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = sub.add_parser("serve", help="HTTP endpoint over every job file")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=9108)
+
+    sub.add_parser("show", help="print the merged exposition")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.dir)
+    else:
+        print(collect(args.dir), end="")
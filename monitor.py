@@ -1,11 +1,31 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import joblib
 import os
+import subprocess
+import sys
+import time
 from glob import glob
 from datetime import datetime
-import shap
+from rules import RuleEngine
+from schemas import read_daily
+from shap_store import model_version
+from peer_groups import load_peers
+from pipeline import EXPLAIN_MODE, explain, log_explanations, score_frame
+from alert_state import STATE_FILE as ALERT_STATE_FILE, reconcile_alerts
+from alert_sinks import from_environment
+from metrics import registry
+from rolling import STATE_FILE, advance_rolling, uses_rolling
+from state import Workspace, load_bundle, remove
+
+
+@st.cache_resource
+def load_dispatcher():
+    # Sink workers outlive reruns; ALERT_SINKS selects them (see alert_sinks.py)
+    return from_environment()
+
+
+dispatcher = load_dispatcher()
+telemetry = registry("monitor")
 
 # =====================================================
 # AUTO-DETECT MONTHS
@@ -34,6 +54,9 @@ if "day" not in st.session_state:
 if "baseline_exists" not in st.session_state:
     st.session_state.baseline_exists = False
 
+# WORKSPACE (set by engine.py) selects the cumulatives directory
+workspace = Workspace()
+
 # =====================================================
 # CURRENT MONTH INFO
 # =====================================================
@@ -50,27 +73,6 @@ st.title("🔐 Insider Threat Detection Dashboard")
 st.markdown(f"### Month: {current_month}")
 st.markdown(f"### Day: {st.session_state.day}")
 
-# =====================================================
-# SAFE CSV LOADER
-# =====================================================
-
-def safe_read(path, cols):
-    if not os.path.exists(path):
-        return pd.DataFrame(columns=cols)
-    if os.path.getsize(path) <= 2:
-        return pd.DataFrame(columns=cols)
-    return pd.read_csv(path)
-
-EMAIL_COLUMNS = [
-    "user","total_emails","external_emails",
-    "attachments_sent","bcc_in_email","avg_email_size"
-]
-
-USB_COLUMNS = [
-    "user","usb_insertions",
-    "files_accessed","sensitive_files_accessed"
-]
-
 # =====================================================
 # NEXT DAY BUTTON
 # =====================================================
@@ -90,18 +92,17 @@ if st.button("➡️ Next Day"):
 
         st.info("📅 Month Completed")
 
-        if os.path.exists("email_cumulative.csv"):
+        if workspace.has_cumulatives():
             st.info("🧠 Training / Updating Baseline Model")
-            os.system("python make_model_repeated.py")
+            # Keep rolling-window features if the current model uses them
+            rolling_args = ["--rolling"] if st.session_state.baseline_exists and uses_rolling(load_bundle()[2]) else []
+            subprocess.run([sys.executable, "make_model_repeated.py", "--workspace", workspace.root] + rolling_args)
             st.session_state.baseline_exists = True
 
         st.session_state.month_index += 1
         st.session_state.day = 1
 
-        if os.path.exists("email_cumulative.csv"):
-            os.remove("email_cumulative.csv")
-        if os.path.exists("usb_cumulative.csv"):
-            os.remove("usb_cumulative.csv")
+        workspace.reset()
 
         if st.session_state.month_index >= len(email_months):
             st.success("🎉 All Months Processed")
@@ -117,17 +118,14 @@ if st.button("➡️ Next Day"):
         st.warning("USB file missing for this day.")
         st.stop()
 
-    email_daily = pd.read_csv(email_file)
-    usb_daily = pd.read_csv(usb_file)
-
-    email_cum = safe_read("email_cumulative.csv", EMAIL_COLUMNS)
-    usb_cum = safe_read("usb_cumulative.csv", USB_COLUMNS)
-
-    email_cum = pd.concat([email_cum, email_daily], ignore_index=True)
-    usb_cum = pd.concat([usb_cum, usb_daily], ignore_index=True)
+    email_daily, usb_daily = read_daily(email_file, usb_file)
+    telemetry.inc("insider_ingest_rows_total", len(email_daily), source="email")
+    telemetry.inc("insider_ingest_rows_total", len(usb_daily), source="usb")
+    telemetry.inc("insider_quarantined_rows_total", email_daily.attrs["quarantined"], source="email")
+    telemetry.inc("insider_quarantined_rows_total", usb_daily.attrs["quarantined"], source="usb")
 
-    email_cum.to_csv("email_cumulative.csv", index=False)
-    usb_cum.to_csv("usb_cumulative.csv", index=False)
+    email_cum, usb_cum = workspace.append_day(email_daily, usb_daily)
+    rolling = advance_rolling(workspace, email_daily, usb_daily, f"{current_month}:{day}")
 
     if not st.session_state.baseline_exists:
         st.warning("⏳ Baseline Month — Accumulating Data Only")
@@ -138,89 +136,48 @@ if st.button("➡️ Next Day"):
     # MONITORING MODE
     # =====================================================
 
-    model = joblib.load("baseline_model.pkl")
-    scaler = joblib.load("baseline_scaler.pkl")
-    feature_columns = joblib.load("baseline_features.pkl")
-    threshold = np.load("relative_threshold.npy")
-
-    usb_agg = usb_cum.groupby("user").sum().reset_index()
-    email_agg = email_cum.groupby("user").sum().reset_index()
-
-    final_df = usb_agg.merge(email_agg, on="user", how="outer")
-    final_df.fillna(0, inplace=True)
+    score_start = time.perf_counter()
+    bundle = load_bundle()
+    model, scaler, feature_columns, threshold = bundle
 
-    for col in feature_columns:
-        if col not in final_df.columns:
-            final_df[col] = 0
-
-    X = final_df[feature_columns]
-    X_scaled = scaler.transform(X)
-
-    scores = model.decision_function(X_scaled)
-    final_df["anomaly_score"] = scores
-
-    alerts = final_df[final_df["anomaly_score"] <= threshold]
+    final_df, X_scaled, scores, thresholds = score_frame(
+        bundle, load_peers(), RuleEngine(), email_cum, usb_cum, email_daily, usb_daily, rolling
+    )
 
-    final_df["FLAG"] = np.where(
-        final_df["anomaly_score"] <= threshold,
-        "🚨 ALERT",
-        "✅ SAFE"
+    # Only alerts that are new or escalated since yesterday are explained
+    # and logged; ongoing, acknowledged and suppressed ones are not
+    status, notify = reconcile_alerts(
+        workspace, final_df["user"].to_numpy(), scores, scores <= thresholds, current_month, day
     )
+    final_df["alert_status"] = status
+    alerts = final_df[scores <= thresholds]
+    changed = final_df.index[notify]
+
+    telemetry.observe("insider_score_seconds", time.perf_counter() - score_start)
+    telemetry.inc("insider_scored_users_total", len(final_df))
+    telemetry.set("insider_alerts", len(alerts))
+    for alert_status, count in alerts["alert_status"].value_counts().items():
+        telemetry.inc("insider_alerts_total", count, status=alert_status)
+    telemetry.set("insider_threshold", threshold)
 
     # =====================================================
     # SHAP LOGGING
     # =====================================================
 
-    if len(alerts) > 0:
-
-        LOG_DIR = "daily_shap_logs"
-        os.makedirs(LOG_DIR, exist_ok=True)
-
-        today_str = f"{current_month}_Day{day}"
-        log_file_path = os.path.join(LOG_DIR, f"shap_log_{today_str}.txt")
-
-        explainer = shap.TreeExplainer(model)
-
-        with open(log_file_path, "w") as log_file:
-
-            log_file.write("\n========================================\n")
-            log_file.write(f"SHAP Log: {today_str}\n")
-            log_file.write(f"Total Alerts: {len(alerts)}\n")
-            log_file.write("========================================\n")
-
-            for idx in alerts.index[:10]:
-
-                user = final_df.loc[idx, "user"]
-                score = round(final_df.loc[idx, "anomaly_score"], 4)
-
-                shap_values = explainer.shap_values(
-                    X_scaled[idx].reshape(1, -1)
-                )
-
-                impacts = pd.DataFrame({
-                    "Feature": feature_columns,
-                    "Impact": shap_values[0]
-                })
+    if len(changed) > 0:
 
-                impacts["AbsImpact"] = impacts["Impact"].abs()
-                impacts = impacts.sort_values("AbsImpact", ascending=False)
+        shap_start = time.perf_counter()
+        explained, shap_matrix = explain(model, X_scaled, changed, EXPLAIN_MODE)
 
-                log_file.write("\n----------------------------------------\n")
-                log_file.write(f"User: {user}\n")
-                log_file.write(f"Anomaly Score: {score}\n")
-                log_file.write("Top Risk Drivers:\n")
+        telemetry.observe("insider_shap_seconds", time.perf_counter() - shap_start, method=EXPLAIN_MODE)
+        telemetry.inc("insider_shap_explained_total", len(explained), method=EXPLAIN_MODE)
 
-                for _, row in impacts.head(5).iterrows():
-
-                    direction = (
-                        "Increased Risk"
-                        if row["Impact"] < 0
-                        else "Reduced Risk"
-                    )
-
-                    log_file.write(
-                        f" - {row['Feature']} ({direction})\n"
-                    )
+        version = model_version()
+        telemetry.info("insider_model_info", version=version)
+        log_file_path = log_explanations(
+            current_month, day, final_df, len(alerts), changed, explained, shap_matrix,
+            feature_columns, thresholds, version, EXPLAIN_MODE, dispatcher, X_scaled=X_scaled
+        )
 
         st.info(f"📁 SHAP explanations logged to {log_file_path}")
 
@@ -230,9 +187,13 @@ if st.button("➡️ Next Day"):
 
     st.success(f"Day {day} Processed")
 
-    col1, col2 = st.columns(2)
+    policy_hits = final_df[final_df["rule_hit_count"] > 0]
+
+    col1, col2, col3, col4 = st.columns(4)
     col1.metric("Total Users", len(final_df))
     col2.metric("Alerts Today", len(alerts))
+    col3.metric("New / Escalated", len(changed))
+    col4.metric("Policy Hits Today", len(policy_hits))
 
     st.markdown("---")
 
@@ -244,9 +205,28 @@ if st.button("➡️ Next Day"):
 
     st.markdown("---")
 
+    st.subheader("📏 Policy Rule Hits")
+    if len(policy_hits) > 0:
+        st.dataframe(policy_hits.sort_values("rule_hit_count", ascending=False)[
+            ["user", "rule_hits", "rule_hit_count", "anomaly_score"]
+        ])
+    else:
+        st.info("No policy rules triggered today")
+
+    st.markdown("---")
+
     st.subheader("📊 All Users")
     st.dataframe(final_df.sort_values("anomaly_score"))
 
+    if dispatcher:
+        dispatcher.write_metrics()
+        dispatcher.record_metrics(telemetry)
+        with st.expander("📤 Alert Delivery"):
+            st.dataframe(pd.DataFrame(dispatcher.metrics()))
+
+    telemetry.inc("insider_days_total")
+    telemetry.flush()
+
     st.session_state.day += 1
 
 # =====================================================
@@ -259,9 +239,8 @@ if st.button("🔄 Reset Engine"):
     st.session_state.day = 1
     st.session_state.baseline_exists = False
 
-    if os.path.exists("email_cumulative.csv"):
-        os.remove("email_cumulative.csv")
-    if os.path.exists("usb_cumulative.csv"):
-        os.remove("usb_cumulative.csv")
+    workspace.reset()
+    remove(workspace.path(STATE_FILE))
+    remove(workspace.path(ALERT_STATE_FILE))
 
     st.success("Simulation Reset")
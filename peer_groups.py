@@ -0,0 +1,145 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.ensemble import IsolationForest
+from state import file_lock, root_path, BUNDLE_LOCK
+
+# =====================================================
+# ARTIFACT
+# =====================================================
+
+# peer_models.pkl:
+#   {"groups": {group: {"model": IsolationForest, "threshold": float, "users": n}},
+#    "mapping": {user: group} or None, "kmeans": KMeans or None}
+# Users in no trained group (too small, unmapped, unseen) fall back to the
+# global baseline model and relative_threshold.
+
+PEER_FILE = "peer_models.pkl"
+PEER_MAP_FILE = "peer_groups.csv"
+GLOBAL_GROUP = "global"
+MIN_GROUP_SIZE = 50
+PARALLEL_MIN_ROWS = 50000
+
+
+def load_mapping(path=PEER_MAP_FILE):
+    # CSV with user,group columns
+    df = pd.read_csv(path)
+    df.columns = df.columns.str.strip()
+    df = df.rename(columns={"user_id": "user"})
+    return dict(zip(df["user"], df["group"].astype(str)))
+
+# =====================================================
+# GROUP ASSIGNMENT
+# =====================================================
+
+def assign_groups(users, X_scaled, mapping=None, kmeans=None):
+    if mapping is not None:
+        groups = pd.Series(users).map(mapping).fillna(GLOBAL_GROUP).to_numpy(dtype=object)
+    elif kmeans is not None:
+        groups = np.char.add("cluster_", kmeans.predict(X_scaled).astype(str)).astype(object)
+    else:
+        groups = np.full(len(users), GLOBAL_GROUP, dtype=object)
+    return groups
+
+
+def cluster(X_scaled, n_groups, seed=42):
+    return KMeans(n_clusters=n_groups, n_init=4, random_state=seed).fit(X_scaled)
+
+# =====================================================
+# FIT (ONE PROCESS PER GROUP)
+# =====================================================
+
+def fit_group(X_group, seed=42):
+    # Runs in a worker process
+    model = IsolationForest(
+        n_estimators=100,
+        contamination=0.05,
+        random_state=seed,
+        n_jobs=1
+    )
+    model.fit(X_group)
+    return model, float(np.percentile(model.decision_function(X_group), 5))
+
+
+def fit_groups(X_scaled, groups, workers=None):
+    names = [
+        g for g in pd.unique(groups)
+        if g != GLOBAL_GROUP and np.sum(groups == g) >= MIN_GROUP_SIZE
+    ]
+
+    fitted = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {name: pool.submit(fit_group, X_scaled[groups == name]) for name in names}
+        for name, future in futures.items():
+            model, threshold = future.result()
+            fitted[name] = {
+                "model": model,
+                "threshold": threshold,
+                "users": int(np.sum(groups == name))
+            }
+    return fitted
+
+
+def refresh_thresholds(peers, users, X_scaled):
+    # Refit skipped: each group keeps its forest, and its threshold moves to
+    # the 5th percentile of its current members' scores
+    groups = assign_groups(users, X_scaled, peers["mapping"], peers["kmeans"])
+    for name, group in peers["groups"].items():
+        rows = groups == name
+        if rows.any():
+            group["threshold"] = float(np.percentile(group["model"].decision_function(X_scaled[rows]), 5))
+            group["users"] = int(rows.sum())
+    return peers
+
+# =====================================================
+# SCORE (MERGED BACK INTO ONE VIEW)
+# =====================================================
+
+def load_peers(path=PEER_FILE, root=None):
+    path = root_path(root, path)
+    with file_lock(root_path(root, BUNDLE_LOCK), shared=True):
+        if not os.path.exists(path):
+            return None
+        return joblib.load(path)
+
+
+def score_groups(peers, users, X_scaled, global_model, global_threshold, workers=None):
+    # Returns per-user scores, thresholds and group labels in row order.
+    # Trees release the GIL while predicting, so groups score on threads and
+    # the fitted forests are not copied into worker processes.
+    groups = assign_groups(users, X_scaled, peers["mapping"], peers["kmeans"])
+    groups = np.where(pd.Series(groups).isin(list(peers["groups"])), groups, GLOBAL_GROUP)
+
+    scores = np.empty(len(users))
+    thresholds = np.empty(len(users))
+
+    def score(name):
+        rows = np.flatnonzero(groups == name)
+        if name == GLOBAL_GROUP:
+            model, threshold = global_model, float(global_threshold)
+        else:
+            model, threshold = peers["groups"][name]["model"], peers["groups"][name]["threshold"]
+        scores[rows] = model.decision_function(X_scaled[rows])
+        thresholds[rows] = threshold
+
+    names = list(pd.unique(groups))
+    if len(users) >= PARALLEL_MIN_ROWS and len(names) > 1:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            list(pool.map(score, names))
+    else:
+        for name in names:
+            score(name)
+
+    return scores, thresholds, groups
+
+
+def score_users(model, threshold, peers, users, X_scaled):
+    # Global model, or each user's peer-group model when peers are loaded.
+    # Returns scores, per-user thresholds and groups (None without peers).
+    if peers is None:
+        scores = model.decision_function(X_scaled)
+        return scores, np.full(len(scores), float(threshold)), None
+    return score_groups(peers, users, X_scaled, model, threshold)
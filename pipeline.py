@@ -0,0 +1,272 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import shap
+from alert_sinks import alert_records
+from fast_attribution import PathAttributor
+from features import PSYCHOMETRIC_FILE, build_matrix, feature_frame, scale
+from peer_groups import score_users
+from rules import daily_matrix
+from schemas import read_daily
+from shap_matrix import CACHE_DIR, day_snapshot, store_shap_rows
+from shap_store import LOG_DIR, ShapStore
+from state import atomic_write, copy_file
+
+# EXPLAIN_MODE=fast explains every alert with path attributions
+# (see fast_attribution.py); exact runs TreeExplainer on the first 10
+EXPLAIN_MODE = os.environ.get("EXPLAIN_MODE", "exact")
+
+PREFETCH_DAYS = 2       # days parsed ahead of the one being scored
+READ_WORKERS = 2
+WRITE_QUEUE = 8         # pending write tasks before the scorer waits
+
+# =====================================================
+# DAY SCORING (SHARED BY monitor.py AND engine.py)
+# =====================================================
+
+def score_frame(bundle, peers, rules, email_cum, usb_cum, email_daily, usb_daily, rolling=None,
+                psychometric_path=PSYCHOMETRIC_FILE):
+    # Month-to-date features, model scores, today's policy hits and flags.
+    # Returns (final_df, X_scaled, scores, per-user thresholds).
+    model, scaler, feature_columns, threshold = bundle
+
+    users, X = build_matrix(email_cum, usb_cum, feature_columns, psychometric_path=psychometric_path)
+    if rolling is not None:
+        rolling.fill(users, X, feature_columns)
+    final_df = feature_frame(users, X, feature_columns)
+    X_scaled = scale(scaler, X)
+
+    scores, thresholds, groups = score_users(model, threshold, peers, users, X_scaled)
+    final_df["anomaly_score"] = scores
+    if groups is not None:
+        final_df["peer_group"] = groups
+        final_df["threshold"] = thresholds
+
+    policy = rules.evaluate_frame(daily_matrix(email_daily, usb_daily))
+    final_df = final_df.merge(policy, on="user", how="left")
+    final_df["rule_hit_count"] = final_df["rule_hit_count"].fillna(0).astype(int)
+    final_df["rule_hits"] = final_df["rule_hits"].fillna("")
+
+    final_df["FLAG"] = np.where(
+        scores <= thresholds,
+        "🚨 ALERT",
+        "✅ SAFE"
+    )
+    return final_df, X_scaled, scores, thresholds
+
+
+@lru_cache(maxsize=8)
+def tree_explainer(model):
+    # Per loaded model object: a long-running caller builds it once (one
+    # model per tenant in tenants.py)
+    return shap.TreeExplainer(model)
+
+
+def explain(model, X_scaled, rows, mode=EXPLAIN_MODE):
+    # (explained rows, attributions); exact SHAP covers the first 10 rows
+    if mode == "fast":
+        return rows, PathAttributor(model).attributions(X_scaled[rows])
+    explained = rows[:10]
+    return explained, tree_explainer(model).shap_values(X_scaled[explained])
+
+# =====================================================
+# OUTPUTS
+# =====================================================
+
+def log_explanations(month, day, final_df, n_alerts, changed, explained, shap_matrix,
+                     feature_columns, thresholds, version, mode=EXPLAIN_MODE,
+                     dispatcher=None, log_dir=LOG_DIR, X_scaled=None, cache_dir=CACHE_DIR):
+    # SHAP store records, the day's SHAP matrix (exact values only, what the
+    # dashboard's Flagged tab looks up), sink delivery and the day's text
+    # log; returns the log path
+    store = ShapStore(log_dir)
+    store.append(
+        month, day,
+        final_df.loc[explained, "user"].to_numpy(),
+        final_df.loc[explained, "anomaly_score"].to_numpy(),
+        shap_matrix,
+        feature_columns,
+        version=version,
+        extra={
+            "threshold": thresholds[explained].tolist(),
+            "rule_hits": final_df.loc[explained, "rule_hits"].tolist(),
+            "alert_status": final_df.loc[explained, "alert_status"].tolist(),
+            "method": [mode] * len(explained)
+        }
+    )
+    store.close()
+
+    if X_scaled is not None and mode == "exact" and len(explained) > 0:
+        store_shap_rows(
+            shap_matrix, X_scaled[explained], final_df.loc[explained, "user"].to_numpy(),
+            feature_columns, version, day_snapshot(month, day), cache_dir
+        )
+
+    # Queued for the sink workers; a slow sink does not hold up the day
+    if dispatcher:
+        dispatcher.publish(alert_records(
+            final_df, changed, thresholds, month, day, version, shap_matrix, feature_columns
+        ))
+
+    today_str = f"{month}_Day{day}"
+    log_file_path = os.path.join(log_dir, f"shap_log_{today_str}.txt")
+
+    with atomic_write(log_file_path, "w") as log_file:
+
+        log_file.write("\n========================================\n")
+        log_file.write(f"SHAP Log: {today_str}\n")
+        log_file.write(f"Total Alerts: {n_alerts}\n")
+        log_file.write(f"New / Escalated: {len(changed)}\n")
+        log_file.write(f"Explained: {len(explained)} ({mode})\n")
+        log_file.write("========================================\n")
+
+        for i, idx in enumerate(explained):
+
+            user = final_df.loc[idx, "user"]
+            score = round(final_df.loc[idx, "anomaly_score"], 4)
+
+            impacts = pd.DataFrame({
+                "Feature": feature_columns,
+                "Impact": shap_matrix[i]
+            })
+
+            impacts["AbsImpact"] = impacts["Impact"].abs()
+            impacts = impacts.sort_values("AbsImpact", ascending=False)
+
+            log_file.write("\n----------------------------------------\n")
+            log_file.write(f"User: {user} ({final_df.loc[idx, 'alert_status']})\n")
+            log_file.write(f"Anomaly Score: {score}\n")
+            if final_df.loc[idx, "rule_hits"]:
+                log_file.write(f"Policy Rule Hits: {final_df.loc[idx, 'rule_hits']}\n")
+            log_file.write("Top Risk Drivers:\n")
+
+            for _, row in impacts.head(5).iterrows():
+
+                direction = (
+                    "Increased Risk"
+                    if row["Impact"] < 0
+                    else "Reduced Risk"
+                )
+
+                log_file.write(
+                    f" - {row['Feature']} ({direction})\n"
+                )
+
+    return log_file_path
+
+
+def persist_day(workspace, email_file, usb_file, email_daily, usb_daily):
+    # Daily scratch copies and the day's rows appended to the cumulatives
+    copy_file(email_file, workspace.path("daily_email_activity.csv"))
+    copy_file(usb_file, workspace.path("daily_usb_activity.csv"))
+    workspace.extend(email_daily, usb_daily)
+
+# =====================================================
+# PIPELINE STAGES
+# =====================================================
+
+class DayReader:
+
+    # Parses up to `depth` days ahead of the one being scored on a small
+    # thread pool (pyarrow releases the GIL while parsing) and yields
+    # ((key, email_file, usb_file), (email_daily, usb_daily)) in input
+    # order. depth=0 reads each day when it is asked for.
+
+    def __init__(self, days, depth=PREFETCH_DAYS, workers=READ_WORKERS):
+        self.days = iter(days)
+        self.depth = depth
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="reader") if depth > 0 else None
+        self.pending = deque()
+        for _ in range(depth):
+            self._submit()
+
+    def _submit(self):
+        day = next(self.days, None)
+        if day is not None:
+            self.pending.append((day, self.pool.submit(read_daily, *day[1:])))
+
+    def __iter__(self):
+        if self.pool is None:
+            for day in self.days:
+                yield day, read_daily(*day[1:])
+            return
+        while self.pending:
+            day, future = self.pending.popleft()
+            self._submit()
+            yield day, future.result()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class OutputWriter:
+
+    # One thread runs write tasks in submission order; submit() blocks while
+    # `depth` tasks are queued. After a failed task nothing later is
+    # written and the error is raised on the next submit / drain.
+    # depth=0 runs each task inline.
+
+    def __init__(self, depth=WRITE_QUEUE, on_task=None):
+        self.tasks = queue.Queue(depth) if depth > 0 else None
+        self.error = None
+        self.busy = 0.0         # seconds spent writing
+        self.waited = 0.0       # seconds callers spent in submit / drain
+        self.on_task = on_task
+        if self.tasks is not None:
+            self.thread = threading.Thread(target=self._run, name="writer", daemon=True)
+            self.thread.start()
+
+    def _execute(self, function, args):
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        self.busy += seconds
+        if self.on_task is not None:
+            self.on_task(seconds)
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    self._execute(*task)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.tasks.task_done()
+
+    def _raise(self):
+        if self.error is not None:
+            raise RuntimeError(f"output writer failed: {self.error!r}") from self.error
+
+    def submit(self, function, *args):
+        self._raise()
+        start = time.perf_counter()
+        if self.tasks is None:
+            self._execute(function, args)
+        else:
+            self.tasks.put((function, args))
+        self.waited += time.perf_counter() - start
+
+    def drain(self):
+        # Everything submitted so far is on disk
+        start = time.perf_counter()
+        if self.tasks is not None:
+            self.tasks.join()
+        self.waited += time.perf_counter() - start
+        self._raise()
+
+    def close(self):
+        if self.tasks is not None:
+            self.tasks.put(None)
+            self.thread.join()
+        self._raise()
@@ -0,0 +1,176 @@
+import os
+import numpy as np
+import pandas as pd
+from schemas import read_daily
+from state import atomic_write, file_lock
+
+# =====================================================
+# ROLLING FEATURES
+# =====================================================
+
+# Per user and base feature, the last WINDOW days sit in a ring buffer
+# (days × users × base features) with one running sum per window, so a new
+# day costs O(users × features) however long the history. State carries
+# over month boundaries (cumulatives are reset, the window is not).
+
+ROLLING_BASE = [
+    "usb_insertions", "files_accessed", "sensitive_files_accessed",
+    "total_emails", "external_emails", "attachments_sent"
+]
+WINDOW = 30
+SUM_WINDOWS = (7,)
+MEAN_WINDOWS = (30,)
+
+ROLLING_COLUMNS = (
+    [f"{base}_sum_{w}d" for w in SUM_WINDOWS for base in ROLLING_BASE]
+    + [f"{base}_mean_{w}d" for w in MEAN_WINDOWS for base in ROLLING_BASE]
+    + [f"{base}_delta_1d" for base in ROLLING_BASE]
+)
+
+STATE_FILE = "rolling_state.npz"
+
+
+def uses_rolling(feature_columns):
+    return any(col in ROLLING_COLUMNS for col in feature_columns)
+
+
+def daily_values(email_daily, usb_daily):
+    # One day's per-user totals of the base features
+    frames = [
+        df.groupby("user")[[col for col in ROLLING_BASE if col in df.columns]].sum()
+        for df in (usb_daily, email_daily)
+    ]
+    merged = pd.concat(frames, axis=1).fillna(0)
+    merged = merged.loc[:, ~merged.columns.duplicated()]
+    return merged.index.to_numpy(dtype=object), merged.reindex(columns=ROLLING_BASE, fill_value=0).to_numpy()
+
+# =====================================================
+# RING BUFFER
+# =====================================================
+
+class RollingWindow:
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.users = pd.Index([], dtype=object)
+        self.buffer = np.zeros((window, 0, len(ROLLING_BASE)), dtype=np.float32)
+        self.sums = {w: np.zeros((0, len(ROLLING_BASE))) for w in set(SUM_WINDOWS) | set(MEAN_WINDOWS)}
+        self.head = -1
+        self.filled = 0
+        self.last_key = None
+
+    def _grow(self, users):
+        new = pd.Index(users).difference(self.users)
+        if len(new) == 0:
+            return
+        self.users = self.users.append(new)
+        self.buffer = np.concatenate(
+            [self.buffer, np.zeros((self.window, len(new), len(ROLLING_BASE)), dtype=np.float32)], axis=1
+        )
+        for w in self.sums:
+            self.sums[w] = np.concatenate([self.sums[w], np.zeros((len(new), len(ROLLING_BASE)))])
+
+    def update(self, users, values, key=None):
+        # key (e.g. "mar_2026:5") makes re-applying the same day a no-op
+        if key is not None and key == self.last_key:
+            return False
+
+        self._grow(users)
+        today = np.zeros((len(self.users), len(ROLLING_BASE)), dtype=np.float32)
+        today[self.users.get_indexer(users)] = values
+
+        self.head = (self.head + 1) % self.window
+        for w, total in self.sums.items():
+            # The day leaving a w-day window is w slots back (the slot being
+            # overwritten when w == window)
+            total -= self.buffer[(self.head - w) % self.window]
+            total += today
+        self.buffer[self.head] = today
+
+        self.filled = min(self.filled + 1, self.window)
+        self.last_key = key
+        return True
+
+    def update_day(self, email_daily, usb_daily, key=None):
+        return self.update(*daily_values(email_daily, usb_daily), key=key)
+
+    def features(self, users):
+        # (len(users) × ROLLING_COLUMNS); unknown users get 0
+        rows = self.users.get_indexer(users)
+        found = rows >= 0
+        out = np.zeros((len(users), len(ROLLING_COLUMNS)))
+        if self.filled == 0:
+            return out
+
+        blocks = [self.sums[w] for w in SUM_WINDOWS]
+        blocks += [self.sums[w] / min(self.filled, w) for w in MEAN_WINDOWS]
+        yesterday = self.buffer[(self.head - 1) % self.window] if self.filled > 1 else 0
+        blocks.append(self.buffer[self.head] - yesterday)
+
+        out[found] = np.hstack(blocks)[rows[found]]
+        return out
+
+    def fill(self, users, X, feature_columns):
+        # Write rolling columns of X in place (other columns untouched)
+        wanted = [(j, ROLLING_COLUMNS.index(col)) for j, col in enumerate(feature_columns) if col in ROLLING_COLUMNS]
+        if wanted:
+            values = self.features(users)
+            for j, k in wanted:
+                X[:, j] = values[:, k]
+        return X
+
+    # -------------------------------------------------
+    # PERSISTENCE
+    # -------------------------------------------------
+
+    def save(self, path):
+        with atomic_write(path) as f:
+            np.savez(
+                f,
+                users=self.users.to_numpy().astype(str),
+                buffer=self.buffer,
+                head=self.head,
+                filled=self.filled,
+                last_key="" if self.last_key is None else self.last_key,
+                **{f"sum_{w}": total for w, total in self.sums.items()}
+            )
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            rolling = cls(data["buffer"].shape[0])
+            rolling.users = pd.Index(data["users"].astype(object))
+            rolling.buffer = data["buffer"]
+            rolling.head = int(data["head"])
+            rolling.filled = int(data["filled"])
+            rolling.last_key = str(data["last_key"]) or None
+            rolling.sums = {w: data[f"sum_{w}"] for w in rolling.sums}
+        return rolling
+
+# =====================================================
+# WORKSPACE STATE
+# =====================================================
+
+def load_rolling(workspace):
+    with file_lock(workspace.path(STATE_FILE), shared=True):
+        return RollingWindow.load(workspace.path(STATE_FILE))
+
+
+def advance_rolling(workspace, email_daily, usb_daily, key):
+    # Locked read-modify-write of the workspace's window
+    path = workspace.path(STATE_FILE)
+    with file_lock(path):
+        rolling = RollingWindow.load(path) or RollingWindow()
+        if rolling.update_day(email_daily, usb_daily, key):
+            rolling.save(path)
+    return rolling
+
+
+def replay(day_files, window=WINDOW):
+    # day_files: [(email_path, usb_path, key), ...] oldest first
+    rolling = RollingWindow(window)
+    for email_path, usb_path, key in day_files[-window:]:
+        rolling.update_day(*read_daily(email_path, usb_path), key)
+    return rolling
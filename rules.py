@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from features import build_matrix, feature_frame, infer_feature_columns
+from state import root_path
+
+# =====================================================
+# RULE DEFINITIONS
+# =====================================================
+
+# Each rule compares a daily feature (or numerator / denominator ratio)
+# against a limit. A limit is either a column of user_baseline_thresholds.csv
+# (per-user) or the name of a saved <limit>.npy scalar. Every limit is on the
+# one-day scale: sensitive_dynamic / usb_dynamic are mean + 3 sd of per-user
+# daily rows, never of month-to-date totals.
+DEFAULT_RULES = [
+    {"name": "hard_sensitive_limit", "feature": "sensitive_files_accessed",
+     "op": ">", "limit": "hard_sensitive_limit"},
+    {"name": "hard_sensitive_ratio", "feature": "sensitive_files_accessed",
+     "denominator": "files_accessed", "op": ">", "limit": "hard_sensitive_ratio"},
+    {"name": "hard_external_ratio", "feature": "external_emails",
+     "denominator": "total_emails", "op": ">", "limit": "hard_external_ratio"},
+    {"name": "hard_usb_limit", "feature": "usb_insertions",
+     "op": ">", "limit": "hard_usb_limit"},
+    {"name": "sensitive_dynamic", "feature": "sensitive_files_accessed",
+     "op": ">", "limit": "sensitive_dynamic"},
+    {"name": "usb_dynamic", "feature": "usb_insertions",
+     "op": ">", "limit": "usb_dynamic"},
+    {"name": "user_sensitive_limit", "feature": "sensitive_files_accessed",
+     "op": ">", "limit": "sensitive_limit"},
+    {"name": "user_usb_limit", "feature": "usb_insertions",
+     "op": ">", "limit": "usb_limit"},
+]
+
+RULES_FILE = "policy_rules.json"
+USER_LIMITS_FILE = "user_baseline_thresholds.csv"
+
+OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+}
+
+
+def load_rules(path=RULES_FILE):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return DEFAULT_RULES
+
+# =====================================================
+# ENGINE
+# =====================================================
+
+class RuleEngine:
+
+    def __init__(self, rules=None, user_limits_path=USER_LIMITS_FILE, root=None):
+        # root: read the rules and limits from a tenant root (tenants.py)
+        rules = rules if rules is not None else load_rules(root_path(root, RULES_FILE))
+        user_limits_path = root_path(root, user_limits_path)
+
+        for rule in rules:
+            if rule["op"] not in OPS:
+                raise ValueError(f"Unknown operator {rule['op']!r} in rule {rule['name']}")
+
+        if os.path.exists(user_limits_path):
+            user_limits = pd.read_csv(user_limits_path)
+            user_limits.columns = user_limits.columns.str.strip()
+            self.user_limits = user_limits.set_index("user")
+        else:
+            self.user_limits = pd.DataFrame()
+
+        # Only make_model.py writes the hard_*.npy limits; a rule whose limit
+        # was never saved is switched off instead of failing the caller
+        self.rules = []
+        self.scalar_limits = {}
+        for rule in rules:
+            limit = rule["limit"]
+            if isinstance(limit, (int, float)):
+                self.scalar_limits[limit] = float(limit)
+            elif limit not in self.user_limits.columns and limit not in self.scalar_limits:
+                limit_path = root_path(root, f"{limit}.npy")
+                if not os.path.exists(limit_path):
+                    print(f"⚠️ Rule {rule['name']} disabled: no {limit_path}")
+                    continue
+                self.scalar_limits[limit] = float(np.load(limit_path))
+            self.rules.append(rule)
+
+        self.names = [rule["name"] for rule in self.rules]
+
+        self._aligned_users = None
+        self._rows = None
+        self._aligned_limits = {}
+
+    def _per_user(self, users, column):
+        # Align per-user limits to the day's user order once; days with the
+        # same user list reuse the arrays.
+        if self._aligned_users is not users and (
+            self._aligned_users is None or not np.array_equal(self._aligned_users, users)
+        ):
+            rows = self.user_limits.index.get_indexer(users)
+            self._aligned_users = users
+            self._aligned_limits = {}
+            self._rows = rows
+
+        if column not in self._aligned_limits:
+            values = self.user_limits[column].to_numpy(dtype=np.float64)
+            aligned = np.full(len(self._rows), np.nan)
+            found = self._rows >= 0
+            aligned[found] = values[self._rows[found]]
+            self._aligned_limits[column] = aligned
+
+        return self._aligned_limits[column]
+
+    def evaluate(self, users, columns):
+        # users: array of user ids; columns: feature name -> 1-D array aligned
+        # to users. Returns a (users × rules) boolean hit matrix.
+        hits = np.zeros((len(users), len(self.rules)), dtype=bool)
+
+        for j, rule in enumerate(self.rules):
+            if rule["feature"] not in columns:
+                continue
+
+            values = np.asarray(columns[rule["feature"]], dtype=np.float64)
+
+            if "denominator" in rule:
+                if rule["denominator"] not in columns:
+                    continue
+                denominator = np.asarray(columns[rule["denominator"]], dtype=np.float64)
+                values = np.divide(
+                    values, denominator,
+                    out=np.zeros_like(values),
+                    where=denominator > 0
+                )
+
+            limit = rule["limit"]
+            if limit in self.scalar_limits:
+                limit_values = self.scalar_limits[limit]
+            else:
+                limit_values = self._per_user(users, limit)
+
+            # NaN limits (user without a baseline) never fire
+            OPS[rule["op"]](values, limit_values, out=hits[:, j])
+
+        return hits
+
+    def evaluate_frame(self, day_df):
+        columns = {col: day_df[col].to_numpy() for col in day_df.columns if col != "user"}
+        hits = self.evaluate(day_df["user"].to_numpy(), columns)
+
+        result = pd.DataFrame({"user": day_df["user"].to_numpy()})
+        result["rule_hit_count"] = hits.sum(axis=1)
+
+        names = np.array(self.names, dtype=object)
+        labels = np.full(len(result), "", dtype=object)
+        for i in np.flatnonzero(result["rule_hit_count"].to_numpy()):
+            labels[i] = ", ".join(names[hits[i]])
+        result["rule_hits"] = labels
+
+        return result
+
+
+def daily_matrix(email_daily, usb_daily):
+    feature_columns = infer_feature_columns(email_daily, usb_daily)
+    users, X = build_matrix(email_daily, usb_daily, feature_columns)
+    return feature_frame(users, X, feature_columns)
+
+# =====================================================
+# BENCHMARK
+# =====================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate policy rules on synthetic users")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = args.users
+
+    users = np.array([f"U{i:07d}" for i in range(n)], dtype=object)
+    files = rng.poisson(20, n).astype(np.float64)
+    total = rng.poisson(30, n).astype(np.float64)
+    columns = {
+        "sensitive_files_accessed": rng.binomial(files.astype(int), 0.5).astype(np.float64),
+        "files_accessed": files,
+        "usb_insertions": rng.poisson(3, n).astype(np.float64),
+        "total_emails": total,
+        "external_emails": rng.binomial(total.astype(int), 0.2).astype(np.float64),
+    }
+
+    engine = RuleEngine()
+    engine.user_limits = pd.DataFrame(
+        {"sensitive_limit": rng.uniform(5, 30, n), "usb_limit": rng.uniform(1, 6, n)},
+        index=pd.Index(users, name="user")
+    )
+
+    start = time.perf_counter()
+    engine.evaluate(users, columns)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = engine.evaluate(users, columns)
+    warm = time.perf_counter() - start
+
+    print(f"✅ {len(engine.rules)} rules × {n} users")
+    print(f"   first day (aligns per-user limits): {cold * 1000:.1f} ms")
+    print(f"   next days:                          {warm * 1000:.1f} ms")
+    for name, count in zip(engine.names, hits.sum(axis=0)):
+        print(f"   {name}: {count}")
@@ -0,0 +1,97 @@
+import numpy as np
+
+# =====================================================
+# TRAINING SAMPLES
+# =====================================================
+
+def stratified_sample(X, cap, seed=42, n_strata=10):
+    # Strata are activity deciles (row sum of z-scores) so the heavy tail the
+    # forest has to isolate is kept in proportion.
+    n = len(X)
+    if cap is None or n <= cap:
+        return np.arange(n)
+
+    rng = np.random.default_rng(seed)
+
+    X = np.asarray(X, dtype=np.float64)
+    std = X.std(axis=0)
+    std[std == 0] = 1
+    activity = ((X - X.mean(axis=0)) / std).sum(axis=1)
+
+    edges = np.quantile(activity, np.linspace(0, 1, n_strata + 1)[1:-1])
+    strata = np.searchsorted(edges, activity, side="right")
+
+    picked = []
+    for s in range(n_strata):
+        members = np.flatnonzero(strata == s)
+        if len(members) == 0:
+            continue
+        take = max(1, int(round(cap * len(members) / n)))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+
+    picked = np.concatenate(picked)
+    if len(picked) > cap:
+        picked = rng.choice(picked, size=cap, replace=False)
+    return np.sort(picked)
+
+
+def reservoir_sample(n, cap, seed=42, chunk_size=65536):
+    # Algorithm R over the row stream, one chunk of row ids at a time
+    if cap is None or n <= cap:
+        return np.arange(n)
+
+    rng = np.random.default_rng(seed)
+    reservoir = np.arange(cap)
+
+    for start in range(cap, n, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, n))
+        slots = rng.integers(0, rows + 1)
+        keep = slots < cap
+        # later rows win when two land in the same slot, as in the serial loop
+        reservoir[slots[keep]] = rows[keep]
+
+    return np.sort(reservoir)
+
+
+def sample_rows(X, cap, method="stratified", seed=42):
+    if method == "reservoir":
+        return reservoir_sample(len(X), cap, seed)
+    return stratified_sample(X, cap, seed)
+
+# =====================================================
+# STREAMING PASSES OVER THE FULL POPULATION
+# =====================================================
+
+def chunked_scores(model, X_scaled, chunk_size=65536):
+    scores = np.empty(len(X_scaled), dtype=np.float64)
+    for start in range(0, len(X_scaled), chunk_size):
+        end = start + chunk_size
+        scores[start:end] = model.decision_function(X_scaled[start:end])
+    return scores
+
+
+def streaming_mean_std(values, chunk_size=65536):
+    # Chan et al. pairwise merge; std uses ddof=1 like pandas .std()
+    count, mean, m2 = 0, 0.0, 0.0
+    values = np.asarray(values, dtype=np.float64)
+
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        n_b = len(chunk)
+        mean_b = chunk.mean()
+        m2_b = ((chunk - mean_b) ** 2).sum()
+
+        delta = mean_b - mean
+        total = count + n_b
+        mean += delta * n_b / total
+        m2 += m2_b + delta ** 2 * count * n_b / total
+        count = total
+
+    if count < 2:
+        return mean, 0.0
+    return mean, np.sqrt(m2 / (count - 1))
+
+
+def dynamic_limit(values, chunk_size=65536):
+    mean, std = streaming_mean_std(values, chunk_size)
+    return mean + 3 * std
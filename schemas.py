@@ -0,0 +1,247 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+    ENGINE = "pyarrow"
+except ImportError:     # pandas' C parser
+    pyarrow = None
+    ENGINE = "c"
+
+# =====================================================
+# SCHEMAS
+# =====================================================
+
+# Column -> kind. "count" columns are non-negative integers (int64),
+# "amount" / "score" non-negative floats, "str" free text. Columns not in
+# a schema are dropped; a missing column fails the whole file.
+
+EMAIL_SCHEMA = {
+    "user": "str",
+    "total_emails": "count",
+    "external_emails": "count",
+    "attachments_sent": "count",
+    "bcc_in_email": "count",
+    "avg_email_size": "amount",
+}
+
+USB_SCHEMA = {
+    "user": "str",
+    "usb_insertions": "count",
+    "files_accessed": "count",
+    "sensitive_files_accessed": "count",
+}
+
+PSYCHOMETRIC_SCHEMA = {
+    "employee_name": "str",
+    "user_id": "str",
+    "O": "score",
+    "C": "score",
+    "E": "score",
+    "A": "score",
+    "N": "score",
+}
+
+# Raw email log used by make_model.py (one row per message)
+EMAIL_EVENTS_SCHEMA = {
+    "id": "str",
+    "user": "str",
+    "to": "str",
+    "bcc": "str",
+    "size": "amount",
+    "attachments": "amount",
+}
+
+DTYPES = {"str": "str", "count": "int64", "amount": "float64", "score": "float64"}
+
+QUARANTINE_DIR = os.environ.get("QUARANTINE_DIR", "quarantine")
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def empty_frame(schema):
+    return pd.DataFrame({col: pd.Series(dtype=DTYPES[kind]) for col, kind in schema.items()})
+
+# =====================================================
+# PARSING
+# =====================================================
+
+def read_header(path):
+    # Raw header names, or None for a missing / empty file (what the old
+    # getsize(path) <= 2 check stood for)
+    if not os.path.exists(path):
+        return None
+    with open(path, newline="") as f:
+        # Only the line ending: the raw names must match what the parser sees
+        line = f.readline().rstrip("\r\n")
+    return line.split(",") if line.strip() else None
+
+
+def parse(path, schema, header):
+    # Numbers are parsed as float64 so blanks survive to validation; a
+    # file with unparseable text in a numeric column is re-read as text
+    # and coerced, so only those rows fail.
+    names = {raw: raw.strip() for raw in header}
+    missing = [col for col in schema if col not in names.values()]
+    if missing:
+        raise SchemaError(f"{path}: missing columns {missing} (found {list(names.values())})")
+
+    usecols = [raw for raw, col in names.items() if col in schema]
+    dtype = {raw: "str" if schema[names[raw]] == "str" else "float64" for raw in usecols}
+    try:
+        if ENGINE == "pyarrow":
+            # pyarrow.csv directly: pandas' engine="pyarrow" adds several ms
+            # of dtype post-processing per file
+            types = {raw: pyarrow.string() if kind == "str" else pyarrow.float64() for raw, kind in dtype.items()}
+            df = pyarrow_csv.read_csv(path, convert_options=pyarrow_csv.ConvertOptions(
+                column_types=types, include_columns=usecols, strings_can_be_null=True
+            )).to_pandas()
+        else:
+            df = pd.read_csv(path, usecols=usecols, dtype=dtype)
+    except ValueError:
+        df = pd.read_csv(path, usecols=usecols, dtype=str, keep_default_na=False)
+        for raw in usecols:
+            if schema[names[raw]] != "str":
+                df[raw] = pd.to_numeric(df[raw].str.strip(), errors="coerce").astype("float64")
+            else:
+                df[raw] = df[raw].replace("", np.nan)
+
+    return df.rename(columns=names)[list(schema)]
+
+# =====================================================
+# VALIDATION (VECTORIZED)
+# =====================================================
+
+def checks(df, schema, key, unique):
+    # [(reason, bad row mask)], first matching reason wins
+    numeric = [col for col, kind in schema.items() if kind != "str"]
+    counts = [col for col, kind in schema.items() if kind == "count"]
+    values = df[numeric].to_numpy(dtype=np.float64)
+
+    rules = []
+    if key is not None:
+        rules.append(("missing user", df[key].isna().to_numpy()))
+    rules.append(("missing or malformed value", np.isnan(values).any(axis=1)))
+    rules.append(("negative value", (values < 0).any(axis=1)))
+    if counts:
+        whole = df[counts].to_numpy(dtype=np.float64)
+        rules.append(("non-integer count", (whole != np.rint(whole)).any(axis=1)))
+    if "external_emails" in df.columns and "total_emails" in df.columns:
+        rules.append((
+            "external_emails > total_emails",
+            df["external_emails"].to_numpy() > df["total_emails"].to_numpy()
+        ))
+    if unique and key is not None:
+        # Among otherwise valid rows the first row per user is kept
+        bad = np.logical_or.reduce([mask for _, mask in rules])
+        duplicated = np.zeros(len(df), dtype=bool)
+        users = df[key] if not bad.any() else df.loc[~bad, key]
+        if not users.is_unique:
+            duplicated[~bad] = users.duplicated().to_numpy()
+        rules.append(("duplicate user", duplicated))
+    return rules
+
+
+def quarantine_path(path):
+    # apr_2026_email/email_3.csv -> quarantine/apr_2026_email_email_3.csv;
+    # tenants/acme/apr_2026_email/... -> quarantine/tenants_acme_apr_2026_email_...
+    parent = os.path.relpath(os.path.dirname(os.path.abspath(path)))
+    if parent == os.curdir or parent.startswith(os.pardir):
+        parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return os.path.join(QUARANTINE_DIR, f"{parent.replace(os.sep, '_')}_{os.path.basename(path)}")
+
+
+def quarantine(rejected, path):
+    # One file per source, rewritten on every read, so re-reading a day is
+    # idempotent
+    target = quarantine_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.tmp{os.getpid()}"
+    rejected.to_csv(tmp, index=False)
+    os.replace(tmp, target)
+    return target
+
+# =====================================================
+# READERS
+# =====================================================
+
+def read_table(path, schema, key="user", unique=True, validate=True):
+    # Typed frame in schema order. With validate, rows failing a check are
+    # written to the quarantine with a reason column and left out;
+    # df.attrs["quarantined"] holds their count.
+    header = read_header(path)
+    if header is None:
+        df = empty_frame(schema)
+        df.attrs["quarantined"] = 0
+        return df
+
+    df = parse(path, schema, header)
+    rejected = 0
+    if validate and len(df) > 0:
+        rules = checks(df, schema, key, unique)
+        bad = np.logical_or.reduce([mask for _, mask in rules])
+        rejected = int(bad.sum())
+        if rejected:
+            reasons = np.select([mask for _, mask in rules], [reason for reason, _ in rules], default="")
+            target = quarantine(df[bad].assign(reason=reasons[bad]), path)
+            print(f"⚠️ {rejected} of {len(df)} rows quarantined from {path} → {target}")
+            df = df[~bad].reset_index(drop=True)
+
+    # Counts are whole numbers here (validated, or written by us)
+    df = pd.DataFrame({
+        col: df[col].to_numpy().astype(np.int64) if kind == "count" else df[col]
+        for col, kind in schema.items()
+    })
+    df.attrs["quarantined"] = rejected
+    return df
+
+
+def read_email(path, validate=True):
+    return read_table(path, EMAIL_SCHEMA, validate=validate)
+
+
+def read_usb(path, validate=True):
+    return read_table(path, USB_SCHEMA, validate=validate)
+
+
+def read_daily(email_file, usb_file):
+    return read_email(email_file), read_usb(usb_file)
+
+
+def read_psychometric(path):
+    return read_table(path, PSYCHOMETRIC_SCHEMA, key="user_id")
+
+
+def read_email_events(path):
+    return read_table(path, EMAIL_EVENTS_SCHEMA, unique=False)
+
+
+READERS = {
+    "email": read_email,
+    "usb": read_usb,
+    "psychometric": read_psychometric,
+    "email_events": read_email_events,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate exports against their schema")
+    parser.add_argument("kind", choices=list(READERS))
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.paths:
+        try:
+            df = READERS[args.kind](path)
+        except SchemaError as e:
+            print(f"❌ {e}")
+            failed = True
+            continue
+        print(f"✅ {path}: {len(df)} rows ({df.attrs['quarantined']} quarantined, {ENGINE} parser)")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import http.client
+import json
+import threading
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from features import build_matrix, scale
+from fast_attribution import PathAttributor
+from metrics import registry
+from peer_groups import score_users
+from scoring import ScoringBackend, severity
+
+# =====================================================
+# PAYLOADS
+# =====================================================
+
+# POST /score
+#   {"rows": [{"user": "U1", "total_emails": 12, ...}, ...]}        → records
+#   {"columns": {"user": ["U1", ...], "total_emails": [12, ...]}}   → columnar
+#   optional: "drivers": k (top-k attributions), "explain": "fast" | "exact"
+# GET /metrics, GET /health
+#
+# Rows are per-user activity totals; repeated users are summed, missing
+# features backfilled with 0 and psychometric traits joined, as in the
+# dashboards. Severity quantiles are taken over the submitted batch.
+
+MAX_BODY = 256 * 1024 * 1024
+
+
+def parse_payload(payload):
+    if "rows" in payload:
+        return pd.DataFrame.from_records(payload["rows"]), "rows"
+    if "columns" in payload:
+        return pd.DataFrame(payload["columns"]), "columns"
+    raise ValueError("payload needs 'rows' or 'columns'")
+
+# =====================================================
+# SCORER
+# =====================================================
+
+class BatchScorer:
+
+    def __init__(self, backend=None):
+        self.backend = backend or ScoringBackend()
+        self._attributors = {}
+        self._lock = threading.Lock()
+
+    def attributor(self, bundle):
+        with self._lock:
+            if bundle.version not in self._attributors:
+                self._attributors = {bundle.version: PathAttributor(bundle.model)}
+            return self._attributors[bundle.version]
+
+    def score(self, payload):
+        frame, layout = parse_payload(payload)
+        if "user" not in frame.columns:
+            raise ValueError("every row needs a 'user'")
+
+        bundle = self.backend.bundle()
+        users = pd.unique(frame["user"].to_numpy(dtype=object))
+        users, X = build_matrix(frame, frame, bundle.feature_columns, users=users)
+        X_scaled = scale(bundle.scaler, X)
+
+        scores, thresholds, groups = score_users(bundle.model, bundle.threshold, bundle.peers, users, X_scaled)
+        flagged = scores <= thresholds
+
+        result = {
+            "user": users.tolist(),
+            "anomaly_score": scores.tolist(),
+            "flag": np.where(flagged, "ALERT", "SAFE").tolist(),
+            "severity": severity(scores, thresholds).tolist(),
+        }
+        if groups is not None:
+            result["peer_group"] = groups.tolist()
+            result["threshold"] = thresholds.tolist()
+
+        k = int(payload.get("drivers", 0))
+        if k > 0:
+            if payload.get("explain", "fast") == "exact":
+                values = self.backend.explainer(bundle.version).shap_values(X_scaled)
+            else:
+                values = self.attributor(bundle).attributions(X_scaled)
+            order = np.argsort(np.abs(values), axis=1)[:, ::-1][:, :k]
+            result["drivers"] = [
+                [{"feature": bundle.feature_columns[j], "impact": float(values[i, j])} for j in row]
+                for i, row in enumerate(order)
+            ]
+
+        meta = {
+            "model_version": bundle.version,
+            "threshold": bundle.threshold,
+            "users": len(users),
+        }
+        if layout == "columns":
+            return {**meta, "columns": result}
+        return {**meta, "rows": [dict(zip(result, values)) for values in zip(*result.values())]}
+
+# =====================================================
+# METRICS
+# =====================================================
+
+class Metrics:
+
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.users = 0
+        self.latencies = deque(maxlen=window)
+        self.batch_users = deque(maxlen=window)
+
+    def record(self, seconds, users):
+        self.requests += 1
+        self.users += users
+        self.latencies.append(seconds)
+        self.batch_users.append(users)
+
+    def snapshot(self):
+        latencies = np.asarray(self.latencies) * 1000
+        busy = float(np.sum(self.latencies))
+        report = {
+            "uptime_s": time.time() - self.started,
+            "requests": self.requests,
+            "errors": self.errors,
+            "users_scored": self.users,
+            "users_per_s": float(np.sum(self.batch_users)) / busy if busy > 0 else 0.0,
+        }
+        if len(latencies) > 0:
+            report.update({
+                "latency_ms_mean": float(latencies.mean()),
+                "latency_ms_p50": float(np.percentile(latencies, 50)),
+                "latency_ms_p95": float(np.percentile(latencies, 95)),
+                "latency_ms_p99": float(np.percentile(latencies, 99)),
+            })
+        return report
+
+# =====================================================
+# HTTP (ASYNCIO STREAMS)
+# =====================================================
+
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ScoreServer:
+
+    def __init__(self, scorer=None):
+        self.scorer = scorer or BatchScorer()
+        self.metrics = Metrics()
+        self.telemetry = registry("score_api")
+
+    async def respond(self, writer, status, body, keep_alive):
+        data = json.dumps(body).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def read_head(self, reader, request_line):
+        # (method, path, version, headers, body length); ValueError when
+        # the request line or a header is malformed
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            raise ValueError(f"bad request line {request_line[:80]!r}")
+        method, path, version = parts
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, colon, value = line.decode("latin-1").partition(":")
+            if not colon or not name.strip():
+                raise ValueError(f"bad header {line[:80]!r}")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length < 0:
+            raise ValueError(f"bad content-length {length}")
+        return method, path, version, headers, length
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version, headers, length = await self.read_head(reader, request_line)
+                except ValueError as e:
+                    self.metrics.errors += 1
+                    self.telemetry.inc("insider_api_requests_total", status=400)
+                    await self.respond(writer, 400, {"error": str(e)}, False)
+                    break
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, response = await self.route(method, path, body)
+                await self.respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics.snapshot()
+        if method != "POST" or path != "/score":
+            return 404, {"error": f"no route {method} {path}"}
+
+        start = time.perf_counter()
+        try:
+            payload = json.loads(body)
+            # Scoring is CPU-bound; keep the event loop free for other clients
+            result = await asyncio.get_running_loop().run_in_executor(None, self.scorer.score, payload)
+        except (ValueError, KeyError, TypeError) as e:
+            self.metrics.errors += 1
+            self.telemetry.inc("insider_api_requests_total", status=400)
+            return 400, {"error": str(e)}
+        except Exception as e:
+            self.metrics.errors += 1
+            self.telemetry.inc("insider_api_requests_total", status=500)
+            return 500, {"error": str(e)}
+
+        elapsed = time.perf_counter() - start
+        self.metrics.record(elapsed, result["users"])
+        self.telemetry.inc("insider_api_requests_total", status=200)
+        self.telemetry.observe("insider_api_request_seconds", elapsed)
+        self.telemetry.inc("insider_scored_users_total", result["users"])
+        self.telemetry.maybe_flush()
+        return 200, result
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"🚀 Scoring API on http://{host}:{port} (model {self.scorer.backend.bundle().version})")
+        async with server:
+            await server.serve_forever()
+
+# =====================================================
+# LOCALHOST BENCHMARK CLIENT
+# =====================================================
+
+def post(connection, path, payload):
+    connection.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def bench(host, port, n_users, n_requests, drivers):
+    from features import load_cumulative_matrix
+
+    # Real feature columns, synthetic users drawn from the current cumulatives
+    users, X, feature_columns = load_cumulative_matrix()
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, len(users), n_users)
+    payload = {
+        "columns": {"user": [f"bench_{i}" for i in range(n_users)],
+                    **{col: X[rows, j].tolist() for j, col in enumerate(feature_columns)}},
+        "drivers": drivers,
+    }
+
+    connection = http.client.HTTPConnection(host, port)
+    latencies = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        status, body = post(connection, "/score", payload)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            print("❌", status, body)
+            return
+
+    connection.request("GET", "/metrics")
+    server_metrics = json.loads(connection.getresponse().read())
+    connection.close()
+
+    latencies = np.asarray(latencies) * 1000
+    print("\n==============================")
+    print(f"Batch: {n_users} users × {n_requests} requests (drivers={drivers})")
+    print(f"Client latency p50 / p95: {np.percentile(latencies, 50):.1f} / {np.percentile(latencies, 95):.1f} ms")
+    print(f"Client throughput: {n_users * n_requests / (latencies.sum() / 1000):,.0f} users/s")
+    for key, value in server_metrics.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    print("==============================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local batch scoring HTTP API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = sub.add_parser("serve")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8765)
+
+    bench_cmd = sub.add_parser("bench", help="time a running server from localhost")
+    bench_cmd.add_argument("--host", default="127.0.0.1")
+    bench_cmd.add_argument("--port", type=int, default=8765)
+    bench_cmd.add_argument("--users", type=int, default=5000)
+    bench_cmd.add_argument("--requests", type=int, default=20)
+    bench_cmd.add_argument("--drivers", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(ScoreServer().serve(args.host, args.port))
+    else:
+        bench(args.host, args.port, args.users, args.requests, args.drivers)
@@ -0,0 +1,298 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from glob import glob
+import numpy as np
+import pandas as pd
+import shap
+from peer_groups import load_peers, score_users
+from rolling import STATE_FILE, replay, uses_rolling
+from rules import RuleEngine, daily_matrix
+from schemas import read_daily
+from features import PSYCHOMETRIC_FILE, build_matrix, feature_frame, scale
+from metrics import registry
+from shap_matrix import CACHE_DIR, ShapMatrix, day_snapshot, store_shap_rows
+from shap_store import model_version
+from state import Workspace, WORKSPACE_ROOT, load_bundle, root_path
+
+# =====================================================
+# SEVERITY
+# =====================================================
+
+SEVERITIES = ["Critical", "High", "Elevated", "Normal"]
+
+
+def severity(scores, threshold):
+    # Critical at or below the model threshold (scalar or per user), then
+    # the batch's own 10th / 25th percentiles
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return np.array([], dtype=object)
+    q10, q25 = np.quantile(scores, [0.10, 0.25])
+    return np.select(
+        [scores <= np.asarray(threshold, dtype=np.float64), scores <= q10, scores <= q25],
+        SEVERITIES[:3],
+        default="Normal"
+    ).astype(object)
+
+# =====================================================
+# SHARED BACKEND
+# =====================================================
+
+# One per process, shared by every dashboard session. Results are read-only:
+# sessions keep only (month, day) and UI selections.
+
+DayResult = namedtuple("DayResult", [
+    "month", "day", "version", "threshold", "feature_columns",
+    "final_df", "alerts", "X_scaled"
+])
+
+Bundle = namedtuple("Bundle", ["version", "model", "scaler", "feature_columns", "threshold", "peers", "rules"])
+
+
+def month_label(month_folder):
+    return os.path.basename(month_folder).replace("_email", "")
+
+
+def day_files(month_folder, day):
+    # month_folder may sit under a tenant root; the USB folder is its sibling
+    return (
+        os.path.join(month_folder, f"email_{day}.csv"),
+        os.path.join(os.path.dirname(month_folder), f"{month_label(month_folder)}_usbfiles", f"usbfile_{day}.csv")
+    )
+
+
+def month_folders(root=None):
+    return sorted(glob(root_path(root, "*_email")), key=lambda f: datetime.strptime(month_label(f), "%b_%Y"))
+
+
+def days_in_month(month_folder):
+    day = 0
+    while all(os.path.exists(path) for path in day_files(month_folder, day + 1)):
+        day += 1
+    return day
+
+
+def history_until(month_folder, day, root=None):
+    # [(email_path, usb_path, key), ...] for every day up to (month, day),
+    # oldest first, across earlier months
+    days = []
+    for folder in month_folders(root):
+        last = day if folder == month_folder else days_in_month(folder)
+        days += [(*day_files(folder, d), f"{month_label(folder)}:{d}") for d in range(1, last + 1)]
+        if folder == month_folder:
+            break
+    return days
+
+
+class ScoringBackend:
+
+    # root: one organisation's data root (see tenants.py); month folders
+    # passed in are then under it, as month_folders(root) returns them
+
+    def __init__(self, max_results=8, root=None, job="dashboard"):
+        self.max_results = max_results
+        self.root = root
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._bundle = None
+        self._explainers = {}
+        self._results = OrderedDict()
+        self._cumulative = {}       # month -> (day, email_cum, usb_cum)
+        self._rolling = (None, None, None)   # (month, day, RollingWindow)
+        self._retrained = set()
+        self.telemetry = registry(job)
+
+    def path(self, name):
+        return root_path(self.root, name)
+
+    # -------------------------------------------------
+    # MODEL
+    # -------------------------------------------------
+
+    def bundle(self):
+        # Reload only when the model or threshold file is replaced. Every
+        # retrain rewrites the threshold along with the rule limits, so the
+        # rules are rebuilt with it.
+        stamp = tuple(
+            (stat.st_mtime_ns, stat.st_size)
+            for stat in map(os.stat, [self.path("baseline_model.pkl"), self.path("relative_threshold.npy")])
+        )
+        with self._lock:
+            if stamp != self._stamp:
+                model, scaler, feature_columns, threshold = load_bundle(root=self.root)
+                self._bundle = Bundle(
+                    model_version(self.path("baseline_model.pkl")), model, scaler, feature_columns,
+                    float(threshold), load_peers(root=self.root), RuleEngine(root=self.root)
+                )
+                self._stamp = stamp
+            return self._bundle
+
+    def explainer(self, version=None):
+        with self._lock:
+            bundle = self.bundle()
+            version = version or bundle.version
+            if version not in self._explainers:
+                self._explainers = {version: shap.TreeExplainer(bundle.model)}
+            return self._explainers[version]
+
+    # -------------------------------------------------
+    # DATA
+    # -------------------------------------------------
+
+    def cumulative(self, month_folder, day):
+        # Month-to-date frames; extends the previous day's cumulative when
+        # sessions move forward, rebuilds from day 1 otherwise
+        with self._lock:
+            start, email_cum, usb_cum = self._cumulative.get(month_folder, (0, None, None))
+            if start > day:
+                start, email_cum, usb_cum = 0, None, None
+
+            email_days, usb_days = [email_cum], [usb_cum]
+            for d in range(start + 1, day + 1):
+                email_daily, usb_daily = read_daily(*day_files(month_folder, d))
+                email_days.append(email_daily)
+                usb_days.append(usb_daily)
+                quarantined = email_daily.attrs["quarantined"] + usb_daily.attrs["quarantined"]
+                if quarantined:
+                    self.telemetry.inc("insider_quarantined_rows_total", quarantined)
+
+            if day > start:
+                email_cum = pd.concat([df for df in email_days if df is not None], ignore_index=True)
+                usb_cum = pd.concat([df for df in usb_days if df is not None], ignore_index=True)
+                self._cumulative = {month_folder: (day, email_cum, usb_cum)}
+
+            return email_cum, usb_cum
+
+    def rolling(self, month_folder, day):
+        # Ring buffers as of (month, day): one update when sessions move to
+        # the next day, otherwise replayed from the last WINDOW days
+        with self._lock:
+            month, last, window = self._rolling
+            if (month, last) == (month_folder, day):
+                return window
+            if window is not None and (month, last) == (month_folder, day - 1):
+                window.update_day(*read_daily(*day_files(month_folder, day)), f"{month_label(month_folder)}:{day}")
+            else:
+                window = replay(history_until(month_folder, day, self.root))
+            self._rolling = (month_folder, day, window)
+            return window
+
+    # -------------------------------------------------
+    # SCORING
+    # -------------------------------------------------
+
+    def score_day(self, month_folder, day):
+        bundle = self.bundle()
+        key = (month_folder, day, bundle.version, bundle.threshold)
+
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.telemetry.inc("insider_cache_total", result="hit")
+                return self._results[key]
+
+            start = time.perf_counter()
+            email_cum, usb_cum = self.cumulative(month_folder, day)
+            email_file, usb_file = day_files(month_folder, day)
+
+            users, X = build_matrix(email_cum, usb_cum, bundle.feature_columns,
+                                    psychometric_path=self.path(PSYCHOMETRIC_FILE))
+            if uses_rolling(bundle.feature_columns):
+                self.rolling(month_folder, day).fill(users, X, bundle.feature_columns)
+            final_df = feature_frame(users, X, bundle.feature_columns)
+            X_scaled = scale(bundle.scaler, X)
+
+            scores, thresholds, groups = score_users(bundle.model, bundle.threshold, bundle.peers, users, X_scaled)
+            final_df["anomaly_score"] = scores
+            if groups is not None:
+                final_df["peer_group"] = groups
+                final_df["threshold"] = thresholds
+
+            policy = bundle.rules.evaluate_frame(
+                daily_matrix(*read_daily(email_file, usb_file))
+            )
+            final_df = final_df.merge(policy, on="user", how="left")
+            final_df["rule_hit_count"] = final_df["rule_hit_count"].fillna(0).astype(int)
+            final_df["rule_hits"] = final_df["rule_hits"].fillna("")
+
+            flagged = scores <= thresholds
+            final_df["FLAG"] = np.where(flagged, "🚨 ALERT", "✅ SAFE")
+            final_df["severity"] = severity(scores, thresholds)
+
+            # No bulk SHAP here: the Flagged tab explains the one user it
+            # shows through explain()
+
+            self.telemetry.inc("insider_cache_total", result="miss")
+            self.telemetry.observe("insider_score_seconds", time.perf_counter() - start)
+            self.telemetry.inc("insider_scored_users_total", len(final_df))
+            self.telemetry.set("insider_alerts", flagged.sum())
+            self.telemetry.set("insider_threshold", bundle.threshold)
+            self.telemetry.info("insider_model_info", version=bundle.version)
+            self.telemetry.maybe_flush()
+
+            X_scaled.flags.writeable = False
+            result = DayResult(
+                month_folder, day, bundle.version, bundle.threshold,
+                bundle.feature_columns, final_df, final_df[flagged], X_scaled
+            )
+
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+            return result
+
+    def explain(self, result, row):
+        # One user's SHAP values from the day's matrix (engine.py and
+        # monitor.py store the alerts they explained); computed and stored
+        # there on a miss, so other sessions reuse them
+        user = result.final_df["user"].iat[row]
+        x_scaled = result.X_scaled[row].reshape(1, -1)
+        snapshot = day_snapshot(month_label(result.month), result.day)
+        cache_dir = self.path(CACHE_DIR)
+
+        matrix = ShapMatrix.open(result.version, cache_dir, snapshot=snapshot)
+        values = matrix.lookup(user, x_scaled[0]) if matrix is not None else None
+        self.telemetry.inc("insider_shap_lookups_total", result="miss" if values is None else "hit")
+        if values is not None:
+            return np.array(values)
+
+        values = self.explainer(result.version).shap_values(x_scaled)[0]
+        store_shap_rows(values, x_scaled, [user], result.feature_columns, result.version, snapshot, cache_dir)
+        return values
+
+    # -------------------------------------------------
+    # MONTH END
+    # -------------------------------------------------
+
+    def retrain(self, month_folder):
+        # Once per month per process, however many sessions finish it
+        with self._lock:
+            if month_folder in self._retrained:
+                return False
+
+            days = days_in_month(month_folder)
+            if days == 0:
+                return False
+
+            email_cum, usb_cum = self.cumulative(month_folder, days)
+            workspace = Workspace(self.path(os.path.join(WORKSPACE_ROOT, month_label(month_folder))))
+            workspace.reset()
+            workspace.append_day(email_cum, usb_cum)
+
+            # Keep rolling-window features if the current model uses them
+            args = []
+            if os.path.exists(self.path("baseline_model.pkl")) and uses_rolling(self.bundle().feature_columns):
+                self.rolling(month_folder, days).save(workspace.path(STATE_FILE))
+                args = ["--rolling"]
+
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "make_model_repeated.py")
+            subprocess.run([sys.executable, script, "--workspace", os.path.abspath(workspace.root)] + args,
+                           cwd=self.root)
+            self._retrained.add(month_folder)
+            return True
@@ -0,0 +1,143 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from contextlib import nullcontext
+from state import file_lock, save_npy, atomic_write
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# shap_cache/<model_version>/<snapshot>/values.npy    users × features SHAP values
+#                                      /users.npy     fixed-width user ids (row order)
+#                                      /row_hash.npy  hash of each user's scaled feature row
+#                                      /meta.json     features, snapshot label
+# Scored rows are month-to-date, so each day is its own snapshot
+# (day_snapshot); a row is valid while its hash matches the user's
+# current scaled row.
+
+CACHE_DIR = "shap_cache"
+
+
+def row_hashes(X_scaled):
+    return pd.util.hash_pandas_object(
+        pd.DataFrame(X_scaled), index=False
+    ).to_numpy(dtype=np.uint64)
+
+
+def day_snapshot(month, day):
+    return f"{month}_Day{day}"
+
+
+def _version_dir(version, cache_dir, snapshot=None):
+    return os.path.join(cache_dir, version, snapshot) if snapshot else os.path.join(cache_dir, version)
+
+# =====================================================
+# READ (ZERO-COPY)
+# =====================================================
+
+class ShapMatrix:
+
+    def __init__(self, version, cache_dir=CACHE_DIR, lock=True, snapshot=None):
+        path = _version_dir(version, cache_dir, snapshot)
+        self.version = version
+        self.snapshot = snapshot
+        # Shared lock so all four files come from the same update
+        guard = file_lock(os.path.join(path, "values.npy"), shared=True) if lock else nullcontext()
+        with guard:
+            self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+            self.hashes = np.load(os.path.join(path, "row_hash.npy"), mmap_mode="r")
+            self.users = pd.Index(np.load(os.path.join(path, "users.npy")))
+            with open(os.path.join(path, "meta.json")) as f:
+                self.meta = json.load(f)
+
+    @classmethod
+    def open(cls, version, cache_dir=CACHE_DIR, lock=True, snapshot=None):
+        if version is None or not os.path.exists(os.path.join(_version_dir(version, cache_dir, snapshot), "meta.json")):
+            return None
+        return cls(version, cache_dir, lock, snapshot)
+
+    def lookup(self, user, x_scaled_row=None):
+        # Memmapped row view, or None if missing / computed for other features
+        row = self.users.get_indexer([user])[0]
+        if row < 0 or np.isnan(self.values[row, 0]):
+            return None
+        if x_scaled_row is not None and self.hashes[row] != row_hashes(x_scaled_row.reshape(1, -1))[0]:
+            return None
+        return self.values[row]
+
+# =====================================================
+# WRITE (ONLY STALE ROWS RECOMPUTED)
+# =====================================================
+
+def update_shap_matrix(explainer, X_scaled, users, feature_columns, version,
+                       rows=None, snapshot=None, cache_dir=CACHE_DIR):
+    # rows: optional subset of row positions to bring up to date (e.g. today's
+    # alerts); by default every user. Returns the number of rows recomputed.
+    path = _version_dir(version, cache_dir, snapshot)
+    os.makedirs(path, exist_ok=True)
+
+    with file_lock(os.path.join(path, "values.npy")):
+        users = np.asarray(users).astype(str)
+        n, k = X_scaled.shape
+        hashes = row_hashes(X_scaled)
+
+        values = np.full((n, k), np.nan)
+        stored_hash = np.zeros(n, dtype=np.uint64)
+
+        # Already holding the exclusive lock
+        previous = ShapMatrix.open(version, cache_dir, lock=False, snapshot=snapshot)
+        if previous is not None and previous.meta["features"] == list(feature_columns):
+            old_rows = previous.users.get_indexer(users)
+            found = old_rows >= 0
+            values[found] = previous.values[old_rows[found]]
+            stored_hash[found] = previous.hashes[old_rows[found]]
+            del previous
+
+        candidates = np.arange(n) if rows is None else np.asarray(rows)
+        stale = candidates[
+            (stored_hash[candidates] != hashes[candidates]) | np.isnan(values[candidates, 0])
+        ]
+
+        if len(stale) > 0:
+            values[stale] = explainer.shap_values(X_scaled[stale])
+            stored_hash[stale] = hashes[stale]
+
+        _save(path, users, stored_hash, values, feature_columns, snapshot)
+
+    return len(stale)
+
+
+def store_shap_rows(values, X_rows, users, feature_columns, version, snapshot, cache_dir=CACHE_DIR):
+    # Rows already explained elsewhere (a day's alerts, one dashboard
+    # lookup); replaces those users' rows and keeps the others
+    path = _version_dir(version, cache_dir, snapshot)
+    os.makedirs(path, exist_ok=True)
+
+    with file_lock(os.path.join(path, "values.npy")):
+        users = np.asarray(users).astype(str)
+        values = np.asarray(values, dtype=np.float64).reshape(len(users), -1)
+        hashes = row_hashes(X_rows)
+
+        previous = ShapMatrix.open(version, cache_dir, lock=False, snapshot=snapshot)
+        if previous is not None and previous.meta["features"] == list(feature_columns):
+            keep = ~previous.users.isin(users)
+            users = np.concatenate([previous.users.to_numpy().astype(str)[keep], users])
+            values = np.vstack([previous.values[keep], values])
+            hashes = np.concatenate([previous.hashes[keep], hashes])
+            del previous
+
+        _save(path, users, hashes, values, feature_columns, snapshot)
+
+    return len(users)
+
+
+def _save(path, users, hashes, values, feature_columns, snapshot):
+    # Write next to the live files and swap in, so memmapped readers keep
+    # the previous version until they reopen
+    for name, array in [("values", values), ("row_hash", hashes), ("users", users)]:
+        save_npy(os.path.join(path, f"{name}.npy"), array)
+
+    with atomic_write(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"features": list(feature_columns), "snapshot": snapshot}, f)
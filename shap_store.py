@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from glob import glob
+import numpy as np
+import pandas as pd
+from state import file_lock
+
+# =====================================================
+# LAYOUT
+# =====================================================
+
+# daily_shap_logs/shap_<month>.jsonl   append-only records, one per explained user
+# daily_shap_logs/shap_index.sqlite    (user, date) -> file offset + top drivers
+
+LOG_DIR = "daily_shap_logs"
+INDEX_FILE = "shap_index.sqlite"
+TOP_DRIVERS = 5
+
+
+def model_version(path="baseline_model.pkl"):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+# =====================================================
+# STORE
+# =====================================================
+
+class ShapStore:
+
+    def __init__(self, log_dir=LOG_DIR):
+        self.log_dir = log_dir
+        os.makedirs(log_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(log_dir, INDEX_FILE))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS explanations (
+                month TEXT, day INTEGER, user TEXT, model_version TEXT,
+                anomaly_score REAL, file TEXT, offset INTEGER, length INTEGER,
+                PRIMARY KEY (month, day, user)
+            );
+            CREATE INDEX IF NOT EXISTS explanations_user ON explanations (user);
+            CREATE TABLE IF NOT EXISTS drivers (
+                month TEXT, day INTEGER, user TEXT,
+                rank INTEGER, feature TEXT, impact REAL,
+                PRIMARY KEY (month, day, user, rank)
+            );
+            CREATE INDEX IF NOT EXISTS drivers_feature ON drivers (month, rank, feature);
+        """)
+
+    def segment(self, month):
+        return os.path.join(self.log_dir, f"shap_{month}.jsonl")
+
+    def append(self, month, day, users, scores, shap_values, feature_columns,
+               threshold=None, version=None, extra=None):
+        # shap_values: (len(users) × features). Re-running a day appends new
+        # records and repoints the index at them.
+        path = self.segment(month)
+        shap_values = np.asarray(shap_values, dtype=np.float64)
+        order = np.argsort(np.abs(shap_values), axis=1)[:, ::-1][:, :TOP_DRIVERS]
+
+        index_rows, driver_rows = [], []
+
+        with file_lock(path), open(path, "ab") as f:
+            for i, user in enumerate(users):
+                record = {
+                    "month": month,
+                    "day": int(day),
+                    "user": str(user),
+                    "anomaly_score": float(scores[i]),
+                    "threshold": None if threshold is None else float(threshold),
+                    "model_version": version,
+                    "features": list(feature_columns),
+                    "shap": shap_values[i].tolist(),
+                }
+                if extra is not None:
+                    record.update({k: v[i] for k, v in extra.items()})
+
+                line = (json.dumps(record) + "\n").encode()
+                offset = f.tell()
+                f.write(line)
+
+                index_rows.append((month, int(day), str(user), version,
+                                   float(scores[i]), os.path.basename(path), offset, len(line)))
+                driver_rows += [
+                    (month, int(day), str(user), rank + 1,
+                     feature_columns[k], float(shap_values[i, k]))
+                    for rank, k in enumerate(order[i])
+                ]
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                index_rows
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO drivers VALUES (?, ?, ?, ?, ?, ?)",
+                driver_rows
+            )
+
+    def _read(self, rows):
+        records = []
+        handles = {}
+        try:
+            for file, offset, length in rows:
+                if file not in handles:
+                    handles[file] = open(os.path.join(self.log_dir, file), "rb")
+                handles[file].seek(offset)
+                records.append(json.loads(handles[file].read(length)))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def user_history(self, user):
+        rows = self.db.execute(
+            "SELECT file, offset, length FROM explanations WHERE user = ? "
+            "ORDER BY file, offset", (user,)
+        ).fetchall()
+        return self._read(rows)
+
+    def day_records(self, month, day):
+        rows = self.db.execute(
+            "SELECT file, offset, length FROM explanations WHERE month = ? AND day = ? "
+            "ORDER BY anomaly_score", (month, int(day))
+        ).fetchall()
+        return self._read(rows)
+
+    def top_drivers(self, month=None, rank=1):
+        # How often each feature was the rank-1 (or up to `rank`) driver
+        query = (
+            "SELECT feature, COUNT(*) AS alerts, AVG(impact) AS mean_impact "
+            "FROM drivers WHERE rank <= ?"
+        )
+        params = [rank]
+        if month is not None:
+            query += " AND month = ?"
+            params.append(month)
+        query += " GROUP BY feature ORDER BY alerts DESC"
+        return pd.read_sql_query(query, self.db, params=params)
+
+    def rebuild_index(self):
+        with self.db:
+            self.db.execute("DELETE FROM explanations")
+            self.db.execute("DELETE FROM drivers")
+
+        for path in sorted(glob(os.path.join(self.log_dir, "shap_*.jsonl"))):
+            index_rows, driver_rows = [], []
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    r = json.loads(line)
+                    index_rows.append((r["month"], r["day"], r["user"], r["model_version"],
+                                       r["anomaly_score"], os.path.basename(path), offset, len(line)))
+                    shap_row = np.asarray(r["shap"])
+                    order = np.argsort(np.abs(shap_row))[::-1][:TOP_DRIVERS]
+                    driver_rows += [
+                        (r["month"], r["day"], r["user"], rank + 1,
+                         r["features"][k], float(shap_row[k]))
+                        for rank, k in enumerate(order)
+                    ]
+                    offset += len(line)
+
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    index_rows
+                )
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO drivers VALUES (?, ?, ?, ?, ?, ?)",
+                    driver_rows
+                )
+
+    def drop_month(self, month):
+        # Retention (compaction.py): the month's index rows and JSONL segment
+        with self.db:
+            self.db.execute("DELETE FROM explanations WHERE month = ?", (month,))
+            self.db.execute("DELETE FROM drivers WHERE month = ?", (month,))
+        path = self.segment(month)
+        if os.path.exists(path):
+            with file_lock(path):
+                os.remove(path)
+            os.remove(f"{path}.lock")
+
+    def close(self):
+        self.db.close()
+
+# =====================================================
+# CLI
+# =====================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query structured SHAP explanations")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    user_cmd = sub.add_parser("user", help="all explanations for one user")
+    user_cmd.add_argument("user")
+
+    top_cmd = sub.add_parser("top", help="most frequent risk drivers")
+    top_cmd.add_argument("--month")
+    top_cmd.add_argument("--rank", type=int, default=1)
+
+    sub.add_parser("rebuild-index", help="re-index every JSONL segment")
+
+    args = parser.parse_args()
+    store = ShapStore()
+
+    if args.command == "user":
+        for r in store.user_history(args.user):
+            drivers = sorted(zip(r["features"], r["shap"]), key=lambda p: abs(p[1]), reverse=True)
+            top = ", ".join(
+                f"{feat} ({'↑' if value < 0 else '↓'})" for feat, value in drivers[:TOP_DRIVERS]
+            )
+            print(f"{r['month']} Day {r['day']}: score {r['anomaly_score']:.4f} [{r['model_version']}] {top}")
+
+    elif args.command == "top":
+        print(store.top_drivers(args.month, args.rank).to_string(index=False))
+
+    else:
+        store.rebuild_index()
+        print("✅ SHAP index rebuilt")
+
+    store.close()
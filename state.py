@@ -0,0 +1,232 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager, nullcontext
+import joblib
+import numpy as np
+import pandas as pd
+from schemas import EMAIL_SCHEMA, USB_SCHEMA, empty_frame, read_table
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:     # pandas writes the appends
+    pyarrow = None
+
+# =====================================================
+# LOCKS
+# =====================================================
+
+@contextmanager
+def file_lock(path, shared=False):
+    # Advisory lock on <path>.lock. Shared locks let readers overlap; on
+    # Windows every lock is exclusive.
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# =====================================================
+# ATOMIC WRITES
+# =====================================================
+
+@contextmanager
+def atomic_write(path, mode="wb"):
+    # Write to a temp file in the same directory, then rename over path;
+    # readers see either the old or the new file, never a partial one.
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_csv(df, path):
+    with atomic_write(path, "w") as f:
+        df.to_csv(f, index=False)
+
+
+def append_csv(df, path):
+    # Rows only (the header is already there); pyarrow's writer is ~10×
+    # faster than to_csv and releases the GIL. Values that would need
+    # quoting fall back to pandas.
+    if pyarrow is not None:
+        buffer = pyarrow.BufferOutputStream()
+        try:
+            pyarrow_csv.write_csv(
+                pyarrow.Table.from_pandas(df, preserve_index=False), buffer,
+                pyarrow_csv.WriteOptions(include_header=False, quoting_style="none")
+            )
+        except pyarrow.ArrowInvalid:
+            buffer = None
+        if buffer is not None:
+            with open(path, "ab") as f:
+                f.write(buffer.getvalue())
+            return
+    with open(path, "a") as f:
+        df.to_csv(f, header=False, index=False)
+
+
+def save_npy(path, value):
+    with atomic_write(path) as f:
+        np.save(f, value)
+
+
+def dump(obj, path):
+    with atomic_write(path) as f:
+        joblib.dump(obj, f)
+
+
+def copy_file(src, dst):
+    with open(src, "rb") as source, atomic_write(dst) as target:
+        shutil.copyfileobj(source, target)
+
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+# =====================================================
+# MODEL BUNDLE (SHARED, SINGLE WRITER)
+# =====================================================
+
+BUNDLE_LOCK = "baseline_model.pkl"
+
+
+def root_path(root, name):
+    # Files of one organisation's data root (tenants.py); root=None is the
+    # working directory
+    return os.path.join(root, name) if root else name
+
+
+def load_bundle(lock=True, root=None):
+    # lock=False when the caller already holds file_lock(BUNDLE_LOCK)
+    with file_lock(root_path(root, BUNDLE_LOCK), shared=True) if lock else nullcontext():
+        model = joblib.load(root_path(root, "baseline_model.pkl"))
+        scaler = joblib.load(root_path(root, "baseline_scaler.pkl"))
+        feature_columns = joblib.load(root_path(root, "baseline_features.pkl"))
+        threshold = np.load(root_path(root, "relative_threshold.npy"))
+    return model, scaler, feature_columns, threshold
+
+
+def save_bundle(model=None, scaler=None, feature_columns=None, arrays=None):
+    # Callers that read-modify-write the model should hold
+    # file_lock(BUNDLE_LOCK) themselves; file_lock is not re-entrant.
+    if model is not None:
+        dump(model, "baseline_model.pkl")
+    if scaler is not None:
+        dump(scaler, "baseline_scaler.pkl")
+    if feature_columns is not None:
+        dump(feature_columns, "baseline_features.pkl")
+    for name, value in (arrays or {}).items():
+        save_npy(f"{name}.npy", value)
+
+# =====================================================
+# WORKSPACES (PER RUN CUMULATIVES)
+# =====================================================
+
+EMAIL_COLUMNS = list(EMAIL_SCHEMA)
+USB_COLUMNS = list(USB_SCHEMA)
+
+WORKSPACE_ROOT = "workspaces"
+
+
+def default_workspace():
+    return os.environ.get("WORKSPACE", ".")
+
+
+class Workspace:
+
+    def __init__(self, root=None):
+        self.root = root or default_workspace()
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    @property
+    def email_cumulative(self):
+        return self.path("email_cumulative.csv")
+
+    @property
+    def usb_cumulative(self):
+        return self.path("usb_cumulative.csv")
+
+    def _read(self, path, schema):
+        # Typed; rows were validated when their day was read
+        return read_table(path, schema, validate=False)
+
+    def load_cumulatives(self):
+        with file_lock(self.email_cumulative, shared=True):
+            email_cum = self._read(self.email_cumulative, EMAIL_SCHEMA)
+            usb_cum = self._read(self.usb_cumulative, USB_SCHEMA)
+        return email_cum, usb_cum
+
+    def has_cumulatives(self):
+        return os.path.exists(self.email_cumulative)
+
+    def append_day(self, email_daily, usb_daily):
+        # One locked read-modify-write per day, so concurrent writers to the
+        # same workspace cannot interleave and double-count
+        with file_lock(self.email_cumulative):
+            email_cum = pd.concat(
+                [self._read(self.email_cumulative, EMAIL_SCHEMA), email_daily],
+                ignore_index=True
+            )
+            usb_cum = pd.concat(
+                [self._read(self.usb_cumulative, USB_SCHEMA), usb_daily],
+                ignore_index=True
+            )
+            write_csv(email_cum, self.email_cumulative)
+            write_csv(usb_cum, self.usb_cumulative)
+        return email_cum, usb_cum
+
+    def extend(self, email_daily, usb_daily):
+        # Append-only variant for callers that keep the month-to-date frames
+        # in memory (engine.py): O(day) instead of rewriting the month.
+        # Readers hold the shared lock, so they never see a partial append.
+        with file_lock(self.email_cumulative):
+            append_csv(email_daily, self.email_cumulative)
+            append_csv(usb_daily, self.usb_cumulative)
+
+    def initialize(self):
+        with file_lock(self.email_cumulative):
+            write_csv(empty_frame(EMAIL_SCHEMA), self.email_cumulative)
+            write_csv(empty_frame(USB_SCHEMA), self.usb_cumulative)
+
+    def reset(self):
+        with file_lock(self.email_cumulative):
+            remove(self.email_cumulative)
+            remove(self.usb_cumulative)
+
+    def archive(self, directory, label):
+        os.makedirs(directory, exist_ok=True)
+        with file_lock(self.email_cumulative):
+            for kind, path in [("email", self.email_cumulative), ("usb", self.usb_cumulative)]:
+                if os.path.exists(path):
+                    os.replace(path, os.path.join(directory, f"{label}_{kind}_cumulative.csv"))
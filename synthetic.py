@@ -0,0 +1,76 @@
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from state import save_npy, write_csv
+
+# =====================================================
+# SYNTHETIC POPULATION
+# =====================================================
+
+# Month folders in the same layout and schema as full_generator.py, drawn
+# vectorized so any population size is quick, plus the limits files the
+# policy rules read. Used by the load test and the equivalence harness.
+
+HARD_LIMITS = {
+    "hard_sensitive_limit": 100,
+    "hard_sensitive_ratio": 0.80,
+    "hard_external_ratio": 0.75,
+    "hard_usb_limit": 10
+}
+
+
+def write_months(directory, n_users, n_months, n_days, seed=0, missing=0.0):
+    # Per-user limits scale each user's activity; `missing` is the share of
+    # users left out of each day's email and USB files independently.
+    # Returns the month labels.
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    users = np.array([f"LT{i:07d}" for i in range(n_users)], dtype=object)
+    sensitive_limit = rng.gamma(2.0, 3.0, n_users).round()
+    usb_limit = rng.gamma(2.0, 1.5, n_users).round() + 1
+    write_csv(pd.DataFrame({"user": users, "sensitive_limit": sensitive_limit, "usb_limit": usb_limit}),
+              os.path.join(directory, "user_baseline_thresholds.csv"))
+    for name, value in HARD_LIMITS.items():
+        save_npy(os.path.join(directory, f"{name}.npy"), value)
+
+    start = datetime(2026, 1, 1)
+    labels = []
+    for m in range(n_months):
+        label = (start + pd.DateOffset(months=m)).strftime("%b_%Y").lower()
+        labels.append(label)
+        os.makedirs(os.path.join(directory, f"{label}_email"), exist_ok=True)
+        os.makedirs(os.path.join(directory, f"{label}_usbfiles"), exist_ok=True)
+
+        for day in range(1, n_days + 1):
+            # ~5% of user-days run above their limits, as in full_generator.py
+            level = np.select(
+                [rng.random(n_users) < 0.8, rng.random(n_users) < 0.75],
+                [rng.uniform(0.6, 0.85, n_users), rng.uniform(0.85, 1.0, n_users)],
+                default=rng.uniform(1.0, 1.2, n_users)
+            )
+            activity = np.maximum(5, sensitive_limit + usb_limit) * level * 0.8
+            total_emails = rng.poisson(activity)
+            email = pd.DataFrame({
+                "user": users,
+                "total_emails": total_emails,
+                "external_emails": (total_emails * rng.uniform(0.05, 0.25, n_users)).astype(int),
+                "attachments_sent": (total_emails * rng.uniform(0.05, 0.30, n_users)).astype(int),
+                "bcc_in_email": (total_emails * rng.uniform(0.0, 0.08, n_users)).astype(int),
+                "avg_email_size": rng.uniform(50, 300, n_users).round(2)
+            })
+            sensitive = rng.poisson(np.maximum(sensitive_limit, 1) * level)
+            usb = pd.DataFrame({
+                "user": users,
+                "usb_insertions": rng.poisson(usb_limit * level),
+                "files_accessed": sensitive + rng.integers(1, 8, n_users),
+                "sensitive_files_accessed": sensitive
+            })
+            if missing > 0:
+                email = email[rng.random(n_users) >= missing]
+                usb = usb[rng.random(n_users) >= missing]
+            write_csv(email, os.path.join(directory, f"{label}_email", f"email_{day}.csv"))
+            write_csv(usb, os.path.join(directory, f"{label}_usbfiles", f"usbfile_{day}.csv"))
+
+    return labels
@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+import pandas as pd
+from alert_sinks import DEAD_LETTER, METRICS_FILE, AlertDispatcher, parse_sinks
+from alert_state import reconcile_alerts
+from compaction import ARCHIVE_DIR, compact
+from features import PSYCHOMETRIC_FILE
+from history import HISTORY_DIR, write_month
+from incremental_model import STATE_FILE as INCREMENTAL_STATE
+from metrics import registry
+from peer_groups import load_peers
+from pipeline import EXPLAIN_MODE, explain, log_explanations, persist_day, score_frame
+from rolling import STATE_FILE, advance_rolling
+from rules import RuleEngine
+from schemas import read_daily
+from scoring import day_files, days_in_month, month_folders, month_label
+from shap_matrix import CACHE_DIR
+from shap_store import LOG_DIR, model_version
+from state import Workspace, load_bundle, remove, root_path
+
+# =====================================================
+# TENANTS
+# =====================================================
+
+# tenants.json:
+# {"tenants": [
+#   {"name": "acme", "root": "tenants/acme", "domains": ["@acme.com", "@acme.co.uk"]},
+#   {"name": "globex", "root": "tenants/globex", "domains": ["@globex.com"],
+#    "weight": 2, "sinks": "jsonl:alert_outbox/globex.jsonl"}
+# ]}
+# Each root holds one organisation in the single-company layout (month
+# folders, psychometric.csv, email.csv, baseline_*.pkl, ...). Relative roots
+# are resolved against the tenants file, relative sink files against the
+# tenant's root.
+
+TENANTS_FILE = os.environ.get("TENANTS_FILE", "tenants.json")
+TENANT_WORKERS = 2
+TENANT_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+Tenant = namedtuple("Tenant", ["name", "root", "domains", "weight", "sinks"])
+
+
+def load_tenants(path=TENANTS_FILE):
+    # {name: Tenant} in file order; {} without a tenants file
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        config = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    tenants = {}
+    for entry in config["tenants"]:
+        name = entry["name"]
+        if not TENANT_NAME.match(name) or name in tenants:
+            raise ValueError(f"{path}: invalid or duplicate tenant name {name!r}")
+        root = os.path.normpath(os.path.join(base, entry["root"]))
+        if not os.path.isdir(root):
+            raise ValueError(f"{path}: root of tenant {name} not found ({root})")
+        weight = float(entry.get("weight", 1))
+        if weight <= 0:
+            raise ValueError(f"{path}: weight of tenant {name} must be positive")
+        tenants[name] = Tenant(name, root, list(entry.get("domains", [])), weight, entry.get("sinks", ""))
+    return tenants
+
+
+def run_script(tenant, script, *args):
+    # Training scripts run as child processes in the tenant root, with its
+    # workspace and internal domains. A failed script raises
+    # CalledProcessError, which stops the tenant in FairScheduler.run.
+    env = dict(os.environ, WORKSPACE=tenant.root)
+    if tenant.domains:
+        env["COMPANY_DOMAINS"] = ",".join(tenant.domains)
+    return subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, script), *args], cwd=tenant.root, env=env,
+                          check=True)
+
+# =====================================================
+# PER-TENANT ENGINE
+# =====================================================
+
+class TenantEngine:
+
+    # engine.py's month loop for one tenant, cut into steps (one per day,
+    # one per month end) for the scheduler. Everything is read from and
+    # written under the tenant root; imported code, the worker threads and
+    # the explainer cache are shared with the other tenants. Metrics go to
+    # metrics/tenant_<name>.prom.
+
+    def __init__(self, tenant, incremental=False, rolling=False,
+                 retrain_args=(), explain_mode=EXPLAIN_MODE, compact_months=False):
+        self.tenant = tenant
+        self.telemetry = registry(f"tenant_{tenant.name}")
+        self.incremental = incremental
+        self.rolling = rolling
+        self.retrain_args = list(retrain_args) + (["--rolling"] if rolling else [])
+        self.explain_mode = explain_mode
+        self.compact_months = compact_months
+        self.workspace = Workspace(tenant.root)
+        self.dispatcher = AlertDispatcher(
+            parse_sinks(tenant.sinks, tenant.root),
+            root_path(tenant.root, METRICS_FILE), root_path(tenant.root, DEAD_LETTER)
+        )
+        self.model = None       # (bundle, peers, rules, version) once a baseline exists
+        self.email_cum = self.usb_cum = None
+        self.days = 0
+        self.alerts = 0
+
+    def path(self, name):
+        return root_path(self.tenant.root, name)
+
+    def load_model(self):
+        self.model = (
+            load_bundle(root=self.tenant.root),
+            load_peers(root=self.tenant.root),
+            RuleEngine(root=self.tenant.root),
+            model_version(self.path("baseline_model.pkl"))
+        )
+        self.telemetry.info("insider_model_info", version=self.model[3])
+
+    def steps(self):
+        steps = [self.start]
+        for folder in month_folders(self.tenant.root):
+            n_days = days_in_month(folder)
+            steps += [partial(self.day, month_label(folder), day, *day_files(folder, day))
+                      for day in range(1, n_days + 1)]
+            steps.append(partial(self.month_end, month_label(folder), n_days))
+        return steps
+
+    def start(self):
+        self.workspace.initialize()
+        remove(self.workspace.path(STATE_FILE))
+        remove(self.workspace.path(INCREMENTAL_STATE))
+
+    def day(self, month, day, email_file, usb_file):
+        start = time.perf_counter()
+        name = self.tenant.name
+        email_daily, usb_daily = read_daily(email_file, usb_file)
+        for source, df in [("email", email_daily), ("usb", usb_daily)]:
+            self.telemetry.inc("insider_ingest_rows_total", len(df), source=source)
+            self.telemetry.inc("insider_quarantined_rows_total", df.attrs["quarantined"], source=source)
+
+        self.email_cum = email_daily if self.email_cum is None else pd.concat([self.email_cum, email_daily], ignore_index=True)
+        self.usb_cum = usb_daily if self.usb_cum is None else pd.concat([self.usb_cum, usb_daily], ignore_index=True)
+        persist_day(self.workspace, email_file, usb_file, email_daily, usb_daily)
+        rolling = advance_rolling(self.workspace, email_daily, usb_daily, f"{month}:{day}") if self.rolling else None
+        self.days += 1
+        self.telemetry.inc("insider_days_total")
+
+        if self.model is None:
+            print(f"   [{name}] {month} day {day}: building baseline month")
+            return
+
+        bundle, peers, rules, version = self.model
+        model, _, feature_columns, threshold = bundle
+
+        final_df, X_scaled, scores, thresholds = score_frame(
+            bundle, peers, rules, self.email_cum, self.usb_cum, email_daily, usb_daily, rolling,
+            psychometric_path=self.path(PSYCHOMETRIC_FILE)
+        )
+        flagged = scores <= thresholds
+        status, notify = reconcile_alerts(self.workspace, final_df["user"].to_numpy(), scores, flagged, month, day)
+        final_df["alert_status"] = status
+        changed = final_df.index[notify]
+        self.alerts += int(flagged.sum())
+
+        self.telemetry.inc("insider_scored_users_total", len(final_df))
+        self.telemetry.set("insider_alerts", flagged.sum())
+        self.telemetry.set("insider_threshold", threshold)
+
+        if len(changed) > 0:
+            explained, shap_matrix = explain(model, X_scaled, changed, self.explain_mode)
+            log_explanations(
+                month, day, final_df, int(flagged.sum()), changed, explained, shap_matrix,
+                feature_columns, thresholds, version, self.explain_mode, self.dispatcher,
+                log_dir=self.path(LOG_DIR), X_scaled=X_scaled, cache_dir=self.path(CACHE_DIR)
+            )
+
+        self.telemetry.observe("insider_score_seconds", time.perf_counter() - start)
+        if self.dispatcher:
+            self.dispatcher.write_metrics()
+            self.dispatcher.record_metrics(self.telemetry)
+        self.telemetry.maybe_flush()
+        print(f"   [{name}] {month} day {day}: {len(final_df)} users, {int(flagged.sum())} alerts, "
+              f"{len(changed)} new / escalated")
+
+        if self.incremental:
+            run_script(self.tenant, "incremental_model.py", "update")
+            self.load_model()
+
+    def month_end(self, month, n_days):
+        name = self.tenant.name
+        if n_days > 0 and self.model is not None and self.incremental:
+            print(f"   [{name}] 🧠 Refreshing baseline after {month} (incremental)")
+            run_script(self.tenant, "incremental_model.py", "refresh")
+        elif n_days > 0:
+            print(f"   [{name}] 🧠 Training / retraining baseline on {month}")
+            run_script(self.tenant, "make_model_repeated.py", "--workspace", self.tenant.root, *self.retrain_args)
+        if n_days > 0:
+            self.load_model()
+
+        if self.email_cum is not None:
+            write_month(month, self.email_cum, self.usb_cum, history_dir=self.path(HISTORY_DIR),
+                        psychometric_path=self.path(PSYCHOMETRIC_FILE))
+        self.workspace.archive(self.workspace.path(ARCHIVE_DIR), month)
+        self.workspace.initialize()
+        if self.compact_months:
+            compact(self.workspace.path(ARCHIVE_DIR), self.path(LOG_DIR))
+        self.email_cum = self.usb_cum = None
+
+# =====================================================
+# FAIR SCHEDULING
+# =====================================================
+
+class FairScheduler:
+
+    # Runs several tenants' steps on one pool of `workers` threads. A tenant
+    # has at most one step in flight (each day builds on the one before);
+    # whenever a worker is free, the ready tenant with the least worker time
+    # so far per unit of weight goes next. A large population or a retrain
+    # holds one worker, not the pool, and a tenant with weight 2 gets about
+    # twice the worker time of a weight-1 tenant while both have work.
+
+    def __init__(self, workers=TENANT_WORKERS, telemetry=None):
+        self.workers = workers
+        self.telemetry = telemetry or registry("tenants")
+        self.service = defaultdict(float)   # tenant -> worker seconds used
+
+    def _timed(self, step):
+        start = time.perf_counter()
+        step()
+        return time.perf_counter() - start
+
+    def run(self, steps, weights):
+        # steps: {tenant: [callables]}. Returns {tenant: exception} for
+        # tenants stopped by a failed step; the others carry on.
+        pending = {name: iter(tenant_steps) for name, tenant_steps in steps.items()}
+        ready = {name: time.perf_counter() for name in pending}    # tenant -> ready since
+        running = {}
+        errors = {}
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="tenant") as pool:
+            while ready or running:
+                while ready and len(running) < self.workers:
+                    name = min(ready, key=lambda n: self.service[n] / weights[n])
+                    since = ready.pop(name)
+                    step = next(pending[name], None)
+                    if step is not None:
+                        self.telemetry.observe("insider_tenant_wait_seconds", time.perf_counter() - since, tenant=name)
+                        running[pool.submit(self._timed, step)] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        seconds = future.result()
+                    except Exception as e:
+                        errors[name] = e
+                        print(f"❌ Tenant {name} stopped: {e!r}")
+                        continue
+                    self.service[name] += seconds
+                    self.telemetry.inc("insider_tenant_service_seconds", seconds, tenant=name)
+                    self.telemetry.maybe_flush()
+                    ready[name] = time.perf_counter()
+
+        self.telemetry.flush()
+        return errors
+
+# =====================================================
+# CLI
+# =====================================================
+
+def selected(tenants, names):
+    if not names:
+        return tenants
+    unknown = [name for name in names if name not in tenants]
+    if unknown:
+        raise SystemExit(f"❌ Unknown tenant(s): {', '.join(unknown)}")
+    return {name: tenants[name] for name in names}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve several organisations from one engine process")
+    parser.add_argument("--config", default=TENANTS_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="show the configured tenants")
+
+    limits_cmd = sub.add_parser("limits", help="run make_model.py in each tenant root with its domains")
+    limits_cmd.add_argument("--tenants", nargs="*")
+
+    run_cmd = sub.add_parser("run", help="simulate every tenant's months on a shared worker pool")
+    run_cmd.add_argument("--tenants", nargs="*")
+    run_cmd.add_argument("--workers", type=int, default=TENANT_WORKERS)
+    run_cmd.add_argument("--incremental", action="store_true")
+    run_cmd.add_argument("--force-retrain", action="store_true")
+    run_cmd.add_argument("--rolling", action="store_true")
+    run_cmd.add_argument("--fast-explain", action="store_true")
+    run_cmd.add_argument("--compact", action="store_true")
+
+    args = parser.parse_args()
+    tenants = selected(load_tenants(args.config), getattr(args, "tenants", None))
+    if not tenants:
+        raise SystemExit(f"❌ No tenants configured in {args.config}")
+
+    if args.command == "list":
+        for tenant in tenants.values():
+            months = [month_label(folder) for folder in month_folders(tenant.root)]
+            print(f"{tenant.name}: {tenant.root} (weight {tenant.weight:g}, domains {', '.join(tenant.domains) or '-'}, "
+                  f"months {', '.join(months) or '-'})")
+
+    elif args.command == "limits":
+        failed = []
+        for tenant in tenants.values():
+            print(f"\n🏢 {tenant.name}")
+            try:
+                run_script(tenant, "make_model.py")
+            except subprocess.CalledProcessError as e:
+                failed.append(tenant.name)
+                print(f"❌ Tenant {tenant.name}: {e}")
+        raise SystemExit(1 if failed else 0)
+
+    else:
+        print(f"\n🚀 MULTI-TENANT SIMULATION STARTED ({len(tenants)} tenants, {args.workers} workers)\n")
+        engines = {
+            name: TenantEngine(
+                tenant, args.incremental, args.rolling,
+                ["--force"] if args.force_retrain else [],
+                "fast" if args.fast_explain else EXPLAIN_MODE, args.compact
+            )
+            for name, tenant in tenants.items()
+        }
+        scheduler = FairScheduler(args.workers)
+
+        run_start = time.perf_counter()
+        errors = scheduler.run(
+            {name: engine.steps() for name, engine in engines.items()},
+            {name: tenant.weight for name, tenant in tenants.items()}
+        )
+        wall = time.perf_counter() - run_start
+
+        for engine in engines.values():
+            engine.dispatcher.close()
+            engine.dispatcher.record_metrics(engine.telemetry)
+            engine.telemetry.flush()
+
+        print("\n==============================")
+        for name, engine in engines.items():
+            state = f"❌ {errors[name]!r}" if name in errors else "✅"
+            print(f"{name}: {engine.days} days, {engine.alerts} alerts, {scheduler.service[name]:.1f} s worker time "
+                  f"(weight {tenants[name].weight:g}) {state}")
+        print(f"⏱️ {wall:.1f} s wall, {sum(scheduler.service.values()):.1f} s worker time on {args.workers} workers")
+        print("==============================\n")
+
+        raise SystemExit(1 if errors else 0)
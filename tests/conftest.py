@@ -0,0 +1,39 @@
+import os
+import sys
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+# The modules are flat scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features import build_matrix, infer_feature_columns
+from schemas import read_daily
+from scoring import day_files, month_folders
+from synthetic import write_months
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    # Two synthetic days and a baseline fitted on the first month's totals;
+    # the backend's metrics go under tmp_path too
+    monkeypatch.setattr("metrics.METRICS_DIR", str(tmp_path / "metrics"))
+    write_months(tmp_path, 300, 1, 2, seed=1)
+    folder = month_folders(str(tmp_path))[0]
+    email, usb = zip(*(read_daily(*day_files(folder, day)) for day in (1, 2)))
+    email_cum, usb_cum = pd.concat(email, ignore_index=True), pd.concat(usb, ignore_index=True)
+
+    feature_columns = infer_feature_columns(email_cum, usb_cum)
+    _, X = build_matrix(email_cum, usb_cum, feature_columns)
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(n_estimators=20, contamination=0.05, random_state=0).fit(scaler.transform(X))
+    threshold = np.percentile(model.decision_function(scaler.transform(X)), 5)
+
+    for name, value in [("baseline_model.pkl", model), ("baseline_scaler.pkl", scaler),
+                        ("baseline_features.pkl", feature_columns)]:
+        joblib.dump(value, tmp_path / name)
+    np.save(tmp_path / "relative_threshold.npy", threshold)
+    return tmp_path
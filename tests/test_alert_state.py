@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from alert_state import (
+    ESCALATION_MARGIN, STATUS_ACKNOWLEDGED, STATUS_ESCALATED, STATUS_NEW, STATUS_ONGOING,
+    STATUS_SUPPRESSED, AlertState, day_number, reconcile_alerts
+)
+from state import Workspace
+
+USERS = np.array(["a", "b", "c"], dtype=object)
+
+
+def day(n):
+    return day_number("mar_2026", n)
+
+
+def test_new_then_ongoing_then_closed():
+    state = AlertState()
+
+    status, notify = state.reconcile(USERS, [-0.1, 0.2, 0.3], [True, False, False], day(1))
+    assert list(status) == [STATUS_NEW, "", ""]
+    assert list(notify) == [True, False, False]
+
+    status, notify = state.reconcile(USERS, [-0.1, 0.2, 0.3], [True, False, False], day(2))
+    assert list(status) == [STATUS_ONGOING, "", ""]
+    assert not notify.any()
+
+    # A day off closes the alert; the next one is new again
+    state.reconcile(USERS, [0.1, 0.2, 0.3], [False, False, False], day(3))
+    status, notify = state.reconcile(USERS, [-0.1, 0.2, 0.3], [True, False, False], day(4))
+    assert status[0] == STATUS_NEW and notify[0]
+    assert state.first_seen[0] == day(1)
+    assert state.last_seen[0] == day(4)
+
+
+def test_escalation_needs_the_margin():
+    state = AlertState()
+    state.reconcile(USERS, [-0.10, 0, 0], [True, False, False], day(1))
+
+    status, notify = state.reconcile(USERS, [-0.10 - ESCALATION_MARGIN / 2, 0, 0], [True, False, False], day(2))
+    assert status[0] == STATUS_ONGOING and not notify[0]
+
+    status, notify = state.reconcile(USERS, [-0.10 - 2 * ESCALATION_MARGIN, 0, 0], [True, False, False], day(3))
+    assert status[0] == STATUS_ESCALATED and notify[0]
+    assert state.peak_score[0] == pytest.approx(-0.10 - 2 * ESCALATION_MARGIN)
+
+
+def test_acknowledged_alert_stops_escalating_until_it_closes():
+    state = AlertState()
+    state.reconcile(USERS, [-0.1, 0, 0], [True, False, False], day(1))
+    state.set_flag(["a"], "acknowledged")
+
+    status, notify = state.reconcile(USERS, [-0.5, 0, 0], [True, False, False], day(2))
+    assert status[0] == STATUS_ACKNOWLEDGED and not notify[0]
+
+    state.reconcile(USERS, [0.1, 0, 0], [False, False, False], day(3))
+    assert not state.acknowledged[0]
+    status, notify = state.reconcile(USERS, [-0.1, 0, 0], [True, False, False], day(4))
+    assert status[0] == STATUS_NEW and notify[0]
+
+
+def test_suppressed_user_stays_quiet():
+    state = AlertState()
+    state.set_flag(["b"], "suppressed")
+
+    status, notify = state.reconcile(USERS, [0, -0.2, 0], [False, True, False], day(1))
+    assert status[1] == STATUS_SUPPRESSED and not notify[1]
+
+    state.set_flag(["b"], "suppressed", False)
+    status, notify = state.reconcile(USERS, [0, -0.2, 0], [False, True, False], day(2))
+    assert status[1] == STATUS_ONGOING and not notify[1]
+
+
+def test_replayed_day_repeats_notifications_without_changing_state():
+    state = AlertState()
+    state.reconcile(USERS, [-0.1, 0, 0], [True, False, False], day(1))
+    _, first = state.reconcile(USERS, [-0.1, -0.3, 0], [True, True, False], day(2))
+    peak = state.peak_score.copy()
+
+    status, notify = state.reconcile(USERS, [-0.1, -0.3, 0], [True, True, False], day(2))
+
+    np.testing.assert_array_equal(notify, first)
+    assert list(status) == [STATUS_ONGOING, STATUS_NEW, ""]
+    np.testing.assert_array_equal(state.peak_score, peak)
+
+
+def test_users_can_arrive_and_reorder():
+    state = AlertState()
+    state.reconcile(USERS, [-0.1, 0, 0], [True, False, False], day(1))
+
+    users = np.array(["d", "a"], dtype=object)
+    status, notify = state.reconcile(users, [-0.2, -0.1], [True, True], day(2))
+
+    assert list(status) == [STATUS_NEW, STATUS_ONGOING]
+    assert list(notify) == [True, False]
+    assert list(state.users) == ["a", "b", "c", "d"]
+
+
+def test_workspace_round_trip(tmp_path):
+    workspace = Workspace(str(tmp_path))
+
+    reconcile_alerts(workspace, USERS, [-0.1, 0, 0], [True, False, False], "mar_2026", 1)
+    status, notify = reconcile_alerts(workspace, USERS, [-0.1, 0, 0], [True, False, False], "mar_2026", 2)
+
+    assert status[0] == STATUS_ONGOING and not notify.any()
+    assert list(AlertState.load(workspace.path("alert_state.npz")).frame()["user"]) == ["a"]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.ensemble._iforest import _average_path_length
+from fast_attribution import PathAttributor
+from incremental_model import slide_forest
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(400, 6))
+    X[:5] += 6      # a few clear outliers
+    return X
+
+
+def mean_path_length(model, X):
+    # Inverse of score_samples = -2 ** (-mean path length / c(max_samples))
+    return -np.log2(-model.score_samples(X)) * _average_path_length([model._max_samples])[0]
+
+
+@pytest.mark.parametrize("max_features", [1.0, 0.5])
+def test_attributions_sum_to_mean_path_length(data, max_features):
+    model = IsolationForest(n_estimators=30, max_features=max_features, random_state=0).fit(data)
+    attributor = PathAttributor(model)
+
+    values = attributor.attributions(data)
+
+    assert values.shape == data.shape
+    np.testing.assert_allclose(
+        attributor.expected_value + values.sum(axis=1), mean_path_length(model, data), rtol=1e-6
+    )
+
+
+def test_expected_value_is_c_of_max_samples(data):
+    model = IsolationForest(n_estimators=30, random_state=0).fit(data)
+
+    assert PathAttributor(model).expected_value == pytest.approx(
+        _average_path_length([model._max_samples])[0]
+    )
+
+
+def test_chunks_do_not_change_the_result(data):
+    attributor = PathAttributor(IsolationForest(n_estimators=20, random_state=0).fit(data))
+
+    np.testing.assert_allclose(attributor.attributions(data, chunk_size=7), attributor.attributions(data))
+
+
+def test_outliers_get_negative_totals(data):
+    attributor = PathAttributor(IsolationForest(n_estimators=50, random_state=0).fit(data))
+
+    totals = attributor.attributions(data).sum(axis=1)
+
+    assert (totals[:5] < np.median(totals)).all()
+    assert (totals[:5] < 0).all()
+
+
+def test_identity_holds_after_a_slide(data):
+    model = IsolationForest(n_estimators=30, random_state=0).fit(data)
+    slide_forest(model, data, 10, 1)
+    attributor = PathAttributor(model)
+
+    np.testing.assert_allclose(
+        attributor.expected_value + attributor.attributions(data).sum(axis=1),
+        mean_path_length(model, data), rtol=1e-6
+    )
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+from incremental_model import slide_forest, training_scale
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).normal(size=(600, 5))
+
+
+def fitted(X, n_estimators=40):
+    return IsolationForest(n_estimators=n_estimators, contamination=0.05, random_state=0).fit(X)
+
+
+def test_per_tree_state_stays_aligned(data):
+    model = fitted(data)
+    for seed in (1, 2, 3):
+        slide_forest(model, data, 10, seed)
+
+    assert model.n_estimators == 40
+    assert len(model.estimators_) == 40
+    assert len(model.estimators_features_) == 40
+    assert len(model._seeds) == 40
+    assert len(model._decision_path_lengths) == 40
+    assert len(model._average_path_length_per_tree) == 40
+    assert len(model.estimators_samples_) == 40
+    assert not model.warm_start
+
+
+def test_kept_trees_keep_their_samples(data):
+    model = fitted(data)
+    before = model.estimators_samples_
+    kept = model.estimators_[10:]
+
+    slide_forest(model, data, 10, 1)
+
+    assert model.estimators_[:30] == kept
+    for old, new in zip(before[10:], model.estimators_samples_[:30]):
+        np.testing.assert_array_equal(old, new)
+
+
+def test_new_trees_match_a_warm_start_fit(data):
+    model = fitted(data)
+    reference = fitted(data)
+    reference.set_params(warm_start=True, n_estimators=50, random_state=7)
+    reference.fit(data)
+
+    slide_forest(model, data, 10, 7)
+
+    for ours, theirs in zip(model.estimators_[-10:], reference.estimators_[-10:]):
+        np.testing.assert_array_equal(ours.tree_.threshold, theirs.tree_.threshold)
+    for ours, theirs in zip(model.estimators_samples_[-10:], reference.estimators_samples_[-10:]):
+        np.testing.assert_array_equal(ours, theirs)
+
+
+def test_offset_follows_contamination(data):
+    model = fitted(data)
+    slide_forest(model, data, 10, 1)
+
+    flagged = (model.decision_function(data) < 0).mean()
+    assert flagged == pytest.approx(0.05, abs=0.01)
+
+
+def test_cannot_replace_more_than_the_window(data):
+    model = fitted(data, n_estimators=5)
+    slide_forest(model, data, 20, 1)
+
+    assert len(model.estimators_) == 5
+    assert len(model._seeds) == 5
+
+
+def test_uncalibrated_slide_keeps_the_offset(data):
+    model = fitted(data)
+    offset = model.offset_
+    slide_forest(model, data * 0.5, 10, 1, calibrate=False)
+
+    assert model.offset_ == offset
+
+
+def test_training_scale_brings_totals_to_the_scaler_mean():
+    X = np.array([[10.0, 2.0, 0.5], [30.0, 6.0, -0.5]])
+    scaler = StandardScaler().fit(X * 3)
+
+    scaled = training_scale(X.copy(), scaler, ["total_emails", "usb_insertions", "C"])
+
+    np.testing.assert_allclose(scaled[:, :2], X[:, :2] * 3)
+    np.testing.assert_array_equal(scaled[:, 2], X[:, 2])
@@ -0,0 +1,95 @@
+import pytest
+from metrics import SECONDS_BUCKETS, Registry, collect, parse, render
+
+SAMPLES = {
+    ("insider_days_total", (("job", "engine"),)): 12.0,
+    ("insider_alerts_total", (("job", "monitor"), ("status", "new"))): 3.0,
+    ("insider_alerts_total", (("job", "monitor"), ("status", "escalated"))): 1.0,
+    ("insider_threshold", (("job", "retrain"),)): -0.0123456789,
+    ("insider_model_info", (("job", "retrain"), ("version", 'we"ird\\ver\nsion'))): 1.0,
+    ("insider_score_seconds_bucket", (("job", "dashboard"), ("le", "0.5"))): 2.0,
+    ("insider_score_seconds_bucket", (("job", "dashboard"), ("le", "+Inf"))): 3.0,
+    ("insider_score_seconds_sum", (("job", "dashboard"),)): 1.75,
+    ("insider_score_seconds_count", (("job", "dashboard"),)): 3.0,
+    ("custom_untyped", ()): 2.0 ** 60,
+}
+
+
+def test_parse_inverts_render():
+    assert parse(render(SAMPLES)) == SAMPLES
+
+
+def test_render_is_stable():
+    text = render(SAMPLES)
+    assert render(parse(text)) == text
+
+
+def test_render_layout():
+    lines = render(SAMPLES).splitlines()
+
+    assert "# TYPE insider_alerts_total counter" in lines
+    assert "# TYPE insider_score_seconds histogram" in lines
+    assert "# TYPE custom_untyped untyped" in lines
+    assert 'insider_days_total{job="engine"} 12' in lines
+    assert 'insider_model_info{job="retrain",version="we\\"ird\\\\ver\\nsion"} 1' in lines
+    # Buckets in le order with +Inf last, then _count and _sum
+    histogram = [line for line in lines if line.startswith("insider_score_seconds")]
+    assert histogram == [
+        'insider_score_seconds_bucket{job="dashboard",le="0.5"} 2',
+        'insider_score_seconds_bucket{job="dashboard",le="+Inf"} 3',
+        'insider_score_seconds_count{job="dashboard"} 3',
+        'insider_score_seconds_sum{job="dashboard"} 1.75',
+    ]
+
+
+def test_parse_skips_comments_and_garbage():
+    text = "# HELP x y\n# TYPE x counter\nnot a sample line\nx 4\n"
+    assert parse(text) == {("x", ()): 4.0}
+
+
+def test_counters_accumulate_across_flushes(tmp_path):
+    first = Registry("job_a", directory=str(tmp_path))
+    first.inc("insider_days_total")
+    first.observe("insider_day_seconds", 0.2)
+    first.flush()
+
+    # A second process appending to the same job file
+    second = Registry("job_a", directory=str(tmp_path))
+    second.inc("insider_days_total", 2)
+    second.observe("insider_day_seconds", 50)
+    second.set("insider_threshold", -0.5)
+    second.flush()
+
+    samples = parse((tmp_path / "job_a.prom").read_text())
+    job = (("job", "job_a"),)
+    assert samples[("insider_days_total", job)] == 3
+    assert samples[("insider_day_seconds_count", job)] == 2
+    assert samples[("insider_day_seconds_sum", job)] == pytest.approx(50.2)
+    assert samples[("insider_day_seconds_bucket", job + (("le", "0.25"),))] == 1
+    assert samples[("insider_day_seconds_bucket", job + (("le", "+Inf"),))] == 2
+    assert samples[("insider_threshold", job)] == -0.5
+    assert len([key for key in samples if key[0] == "insider_day_seconds_bucket"]) == len(SECONDS_BUCKETS) + 1
+
+
+def test_info_replaces_the_previous_labels(tmp_path):
+    registry = Registry("job_b", directory=str(tmp_path))
+    registry.info("insider_model_info", version="v1")
+    registry.flush()
+    registry.info("insider_model_info", version="v2")
+    registry.flush()
+
+    samples = parse((tmp_path / "job_b.prom").read_text())
+    assert [dict(labels)["version"] for name, labels in samples if name == "insider_model_info"] == ["v2"]
+
+
+def test_collect_merges_job_files(tmp_path):
+    for job in ("one", "two"):
+        registry = Registry(job, directory=str(tmp_path))
+        registry.inc("insider_days_total")
+        registry.flush()
+
+    samples = parse(collect(str(tmp_path)))
+    assert samples == {
+        ("insider_days_total", (("job", "one"),)): 1,
+        ("insider_days_total", (("job", "two"),)): 1,
+    }
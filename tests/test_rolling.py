@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rolling import ROLLING_BASE, ROLLING_COLUMNS, WINDOW, RollingWindow
+
+
+def history(days, seed=0):
+    # [(users, values)], with users joining part-way and some days missing
+    rng = np.random.default_rng(seed)
+    everyone = np.array([f"U{i}" for i in range(6)], dtype=object)
+    out = []
+    for day in range(days):
+        present = everyone[: 3 + min(day // 10, 3)]
+        present = present[rng.random(len(present)) > 0.2]
+        out.append((present, rng.integers(0, 20, (len(present), len(ROLLING_BASE))).astype(np.float64)))
+    return out
+
+
+def expected(days, users):
+    # Brute force over a dense (days × users × base) history
+    dense = np.zeros((len(days), len(users), len(ROLLING_BASE)))
+    index = pd.Index(users)
+    for d, (present, values) in enumerate(days):
+        dense[d, index.get_indexer(present)] = values
+
+    n = len(days)
+    sum_7 = dense[max(n - 7, 0):].sum(axis=0)
+    mean_30 = dense[max(n - 30, 0):].sum(axis=0) / min(n, 30)
+    delta = dense[-1] - (dense[-2] if n > 1 else 0)
+    return np.hstack([sum_7, mean_30, delta])
+
+
+@pytest.mark.parametrize("n_days", [1, 5, WINDOW, WINDOW + 1, 2 * WINDOW + 7])
+def test_matches_brute_force_across_wraparound(n_days):
+    days = history(n_days)
+    rolling = RollingWindow()
+    for d, (users, values) in enumerate(days):
+        rolling.update(users, values, key=f"day:{d}")
+
+    users = np.array([f"U{i}" for i in range(6)], dtype=object)
+    np.testing.assert_allclose(rolling.features(users), expected(days, users))
+
+
+def test_head_wraps_and_filled_caps():
+    rolling = RollingWindow()
+    for users, values in history(WINDOW + 3):
+        rolling.update(users, values)
+
+    assert rolling.head == 2
+    assert rolling.filled == WINDOW
+
+
+def test_same_key_is_applied_once():
+    days = history(3)
+    rolling = RollingWindow()
+    for d, (users, values) in enumerate(days):
+        assert rolling.update(users, values, key=f"day:{d}")
+    assert not rolling.update(*days[-1], key="day:2")
+
+    users = np.array([f"U{i}" for i in range(6)], dtype=object)
+    np.testing.assert_allclose(rolling.features(users), expected(days, users))
+
+
+def test_unknown_users_get_zeros():
+    rolling = RollingWindow()
+    rolling.update(np.array(["U0"], dtype=object), np.ones((1, len(ROLLING_BASE))))
+
+    out = rolling.features(np.array(["U0", "nobody"], dtype=object))
+
+    assert out.shape == (2, len(ROLLING_COLUMNS))
+    assert (out[1] == 0).all()
+
+
+def test_fill_writes_only_rolling_columns():
+    rolling = RollingWindow()
+    users = np.array(["U0", "U1"], dtype=object)
+    rolling.update(users, np.arange(2 * len(ROLLING_BASE), dtype=np.float64).reshape(2, -1))
+    columns = ["usb_insertions", "usb_insertions_sum_7d", "N"]
+    X = np.full((2, 3), -1.0)
+
+    rolling.fill(users, X, columns)
+
+    np.testing.assert_array_equal(X[:, [0, 2]], -1.0)
+    np.testing.assert_array_equal(X[:, 1], [0, len(ROLLING_BASE)])
+
+
+def test_save_load_round_trip_after_wraparound(tmp_path):
+    days = history(WINDOW + 12)
+    rolling = RollingWindow()
+    for d, (users, values) in enumerate(days):
+        rolling.update(users, values, key=f"day:{d}")
+    rolling.save(tmp_path / "rolling_state.npz")
+
+    loaded = RollingWindow.load(tmp_path / "rolling_state.npz")
+    assert loaded.last_key == f"day:{WINDOW + 11}"
+
+    more = history(4, seed=1)
+    for users, values in more:
+        rolling.update(users, values)
+        loaded.update(users, values)
+
+    users = np.array([f"U{i}" for i in range(6)], dtype=object)
+    np.testing.assert_allclose(loaded.features(users), rolling.features(users))
+    np.testing.assert_allclose(loaded.features(users), expected(days + more, users))
+
+
+def test_load_missing_file(tmp_path):
+    assert RollingWindow.load(tmp_path / "rolling_state.npz") is None
@@ -0,0 +1,122 @@
+import os
+import pandas as pd
+import pytest
+import schemas
+from schemas import SchemaError, quarantine_path, read_email, read_psychometric, read_usb
+
+EMAIL_HEADER = "user,total_emails,external_emails,attachments_sent,bcc_in_email,avg_email_size\n"
+
+
+@pytest.fixture(params=["pyarrow", "c"])
+def workdir(request, tmp_path, monkeypatch):
+    # Both parsers, from a month folder's parent like the scripts run
+    if request.param == "pyarrow" and schemas.pyarrow is None:
+        pytest.skip("pyarrow not installed")
+    monkeypatch.setattr(schemas, "ENGINE", request.param)
+    monkeypatch.setattr(schemas, "QUARANTINE_DIR", "quarantine")
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("apr_2026_email")
+    return tmp_path
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def test_bad_rows_are_quarantined_with_reasons(workdir):
+    path = write("apr_2026_email/email_3.csv", EMAIL_HEADER + "\n".join([
+        "u1,5,1,0,0,120.5",
+        ",5,1,0,0,10",          # missing user
+        "u2,5,,0,0,10",         # missing value
+        "u3,five,1,0,0,10",     # malformed value
+        "u4,5,1,-1,0,10",       # negative
+        "u5,5.5,1,0,0,10",      # non-integer count
+        "u6,2,3,0,0,10",        # more external than total
+        "u1,9,1,0,0,10",        # duplicate of a valid row
+        "u7,0,0,0,0,0",
+    ]) + "\n")
+
+    df = read_email(path)
+
+    assert list(df["user"]) == ["u1", "u7"]
+    assert df["total_emails"].tolist() == [5, 0]
+    assert df["total_emails"].dtype == "int64" and df["avg_email_size"].dtype == "float64"
+    assert df.attrs["quarantined"] == 7
+
+    target = quarantine_path(path)
+    assert target == os.path.join("quarantine", "apr_2026_email_email_3.csv")
+    rejected = pd.read_csv(target, keep_default_na=False)
+    assert rejected["reason"].tolist() == [
+        "missing user", "missing or malformed value", "missing or malformed value", "negative value",
+        "non-integer count", "external_emails > total_emails", "duplicate user",
+    ]
+
+
+def test_duplicate_keeps_the_first_valid_row(workdir):
+    path = write("apr_2026_email/email_1.csv", EMAIL_HEADER + "u1,5,9,0,0,1\nu1,5,1,0,0,1\nu1,6,1,0,0,1\n")
+
+    df = read_email(path)
+
+    assert df["total_emails"].tolist() == [5]
+    assert df["external_emails"].tolist() == [1]
+    assert df.attrs["quarantined"] == 2
+
+
+def test_quarantine_is_rewritten_on_each_read(workdir):
+    path = write("apr_2026_email/email_2.csv", EMAIL_HEADER + "u1,5,1,0,0,1\nu2,-1,0,0,0,1\n")
+    read_email(path)
+    read_email(path)
+
+    assert len(pd.read_csv(quarantine_path(path))) == 1
+
+
+def test_clean_file_writes_no_quarantine(workdir):
+    path = write("apr_2026_email/email_4.csv", EMAIL_HEADER + "u1,5,1,0,0,1\n")
+
+    assert read_email(path).attrs["quarantined"] == 0
+    assert not os.path.exists("quarantine")
+
+
+def test_headers_are_stripped_and_extra_columns_dropped(workdir):
+    path = write("apr_2026_email/usbfile_1.csv",
+                 " user , usb_insertions,files_accessed,sensitive_files_accessed,extra\nu1,1,2,1,x\n")
+
+    df = read_usb(path)
+
+    assert list(df.columns) == list(schemas.USB_SCHEMA)
+    assert df.iloc[0].tolist() == ["u1", 1, 2, 1]
+
+
+def test_empty_or_missing_file_is_an_empty_typed_frame(workdir):
+    for path in [write("apr_2026_email/email_5.csv", ""), "apr_2026_email/email_6.csv"]:
+        df = read_email(path)
+        assert len(df) == 0
+        assert list(df.columns) == list(schemas.EMAIL_SCHEMA)
+        assert df.attrs["quarantined"] == 0
+
+
+def test_missing_column_fails_the_file(workdir):
+    path = write("apr_2026_email/email_7.csv", "user,total_emails\nu1,1\n")
+
+    with pytest.raises(SchemaError, match="missing columns"):
+        read_email(path)
+
+
+def test_psychometric_keys_on_user_id(workdir):
+    path = write("psychometric.csv", "employee_name,user_id,O,C,E,A,N\nAnn,u1,1,2,3,4,5\nBob,,1,2,3,4,5\n")
+
+    df = read_psychometric(path)
+
+    assert df["user_id"].tolist() == ["u1"]
+    assert quarantine_path(path) == os.path.join("quarantine", f"{os.path.basename(workdir)}_psychometric.csv")
+
+
+def test_quarantine_names_keep_tenant_roots_apart(workdir):
+    os.makedirs(os.path.join("tenants", "acme", "apr_2026_email"))
+
+    assert quarantine_path(os.path.join("tenants", "acme", "apr_2026_email", "email_1.csv")) == \
+        os.path.join("quarantine", "tenants_acme_apr_2026_email_email_1.csv")
+    assert quarantine_path(os.path.join(os.pardir, "elsewhere", "email_1.csv")) == \
+        os.path.join("quarantine", "elsewhere_email_1.csv")
@@ -0,0 +1,74 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import pytest
+from score_api import BatchScorer, ScoreServer
+from scoring import ScoringBackend
+
+
+@pytest.fixture
+def port(root):
+    # ScoreServer.handle on an ephemeral port, its loop on a thread
+    api = ScoreServer(BatchScorer(ScoringBackend(root=str(root))))
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(api.handle, "127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+
+
+def post(port, payload):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    connection.request("POST", "/score", json.dumps(payload), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    status, body = response.status, json.loads(response.read())
+    connection.close()
+    return status, body
+
+
+def raw(port, data):
+    with socket.create_connection(("127.0.0.1", port), timeout=30) as sock:
+        sock.sendall(data)
+        return sock.makefile("rb").readline()
+
+
+def test_scores_rows(port):
+    rows = [{"user": "LT0000001", "total_emails": 40, "usb_insertions": 2},
+            {"user": "LT0000002", "total_emails": 900, "external_emails": 700, "usb_insertions": 60}]
+    status, body = post(port, {"rows": rows, "drivers": 2})
+
+    assert status == 200
+    assert body["users"] == 2
+    assert [row["user"] for row in body["rows"]] == ["LT0000001", "LT0000002"]
+    assert body["rows"][1]["anomaly_score"] < body["rows"][0]["anomaly_score"]
+    assert len(body["rows"][0]["drivers"]) == 2
+
+
+def test_unknown_user_is_scored_from_its_rows(port):
+    status, body = post(port, {"columns": {"user": ["nobody"], "total_emails": [10]}})
+
+    assert status == 200
+    assert body["columns"]["user"] == ["nobody"]
+    assert len(body["columns"]["anomaly_score"]) == 1
+
+
+def test_bad_payload_is_a_400(port):
+    assert post(port, {"rows": [{"total_emails": 3}]})[0] == 400
+    assert post(port, {"users": []})[0] == 400
+
+
+@pytest.mark.parametrize("request_bytes", [
+    b"GARBAGE\r\n\r\n",
+    b"POST /score\r\n\r\n",
+    b"POST /score HTTP/1.1\r\nno colon here\r\n\r\n",
+    b"POST /score HTTP/1.1\r\nContent-Length: lots\r\n\r\n",
+])
+def test_malformed_request_is_a_400(port, request_bytes):
+    assert raw(port, request_bytes).startswith(b"HTTP/1.1 400 Bad Request")
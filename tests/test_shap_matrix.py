@@ -0,0 +1,77 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from pipeline import explain, log_explanations, score_frame
+from rules import RuleEngine
+from schemas import read_daily
+from scoring import ScoringBackend, day_files, month_folders
+from shap_matrix import CACHE_DIR, ShapMatrix, day_snapshot, store_shap_rows
+from shap_store import model_version
+
+
+def test_stored_rows_are_keyed_by_day_and_row(tmp_path):
+    X = np.random.default_rng(0).normal(size=(3, 4))
+    values = np.arange(12, dtype=np.float64).reshape(3, 4)
+    store_shap_rows(values, X, ["u0", "u1", "u2"], list("abcd"), "v1", "mar_2026_Day2", tmp_path)
+
+    matrix = ShapMatrix.open("v1", tmp_path, snapshot="mar_2026_Day2")
+    np.testing.assert_array_equal(matrix.lookup("u1", X[1]), values[1])
+    assert matrix.lookup("u1", X[1] + 1) is None
+    assert matrix.lookup("u9") is None
+    assert ShapMatrix.open("v1", tmp_path, snapshot="mar_2026_Day3") is None
+    assert ShapMatrix.open("v2", tmp_path, snapshot="mar_2026_Day2") is None
+
+
+def test_storing_rows_keeps_other_users(tmp_path):
+    X = np.random.default_rng(0).normal(size=(3, 4))
+    store_shap_rows(np.zeros((2, 4)), X[:2], ["u0", "u1"], list("abcd"), "v1", "d", tmp_path)
+    store_shap_rows(np.ones((2, 4)), X[1:], ["u1", "u2"], list("abcd"), "v1", "d", tmp_path)
+
+    matrix = ShapMatrix.open("v1", tmp_path, snapshot="d")
+    assert sorted(matrix.users) == ["u0", "u1", "u2"]
+    np.testing.assert_array_equal(matrix.lookup("u0", X[0]), np.zeros(4))
+    np.testing.assert_array_equal(matrix.lookup("u1", X[1]), np.ones(4))
+
+
+def test_dashboard_lookup_hits_the_row_the_engine_stored(root, monkeypatch):
+    folder = month_folders(str(root))[0]
+    email, usb = zip(*(read_daily(*day_files(folder, day)) for day in (1, 2)))
+    bundle = (
+        joblib.load(root / "baseline_model.pkl"), joblib.load(root / "baseline_scaler.pkl"),
+        joblib.load(root / "baseline_features.pkl"), np.load(root / "relative_threshold.npy")
+    )
+
+    # engine.py's day 2
+    final_df, X_scaled, scores, thresholds = score_frame(
+        bundle, None, RuleEngine(root=str(root)),
+        pd.concat(email, ignore_index=True), pd.concat(usb, ignore_index=True), email[1], usb[1]
+    )
+    final_df["alert_status"] = "new"
+    changed = final_df.index[scores <= thresholds]
+    explained, shap_values = explain(bundle[0], X_scaled, changed, "exact")
+    assert len(explained) > 0
+    log_explanations(
+        "jan_2026", 2, final_df, len(changed), changed, explained, shap_values, bundle[2], thresholds,
+        model_version(str(root / "baseline_model.pkl")), "exact",
+        log_dir=str(root / "logs"), X_scaled=X_scaled, cache_dir=str(root / CACHE_DIR)
+    )
+
+    # The Flagged tab on the same day, without a TreeExplainer
+    backend = ScoringBackend(root=str(root))
+    result = backend.score_day(folder, 2)
+    monkeypatch.setattr(backend, "explainer", None)
+    for i, idx in enumerate(explained):
+        row = result.final_df.index[result.final_df["user"] == final_df.loc[idx, "user"]][0]
+        np.testing.assert_array_equal(backend.explain(result, row), shap_values[i])
+
+
+def test_dashboard_miss_is_stored_for_the_next_session(root):
+    folder = month_folders(str(root))[0]
+    backend = ScoringBackend(root=str(root))
+    result = backend.score_day(folder, 1)
+
+    values = backend.explain(result, 0)
+
+    matrix = ShapMatrix.open(result.version, os.path.join(root, CACHE_DIR), snapshot=day_snapshot("jan_2026", 1))
+    np.testing.assert_array_equal(matrix.lookup(result.final_df["user"].iat[0], result.X_scaled[0]), values)
@@ -0,0 +1,181 @@
+import argparse
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import IsolationForest
+from features import load_cumulative_matrix
+from incremental_model import alert_agreement
+
+# =====================================================
+# SEARCH SPACE
+# =====================================================
+
+# Same weights as make_model.py; features missing from the matrix are skipped
+WEIGHT_SETS = {
+    "none": {},
+    "make_model": {
+        "sensitive_files_accessed": 0.18,
+        "external_emails": 0.15,
+        "attachments_sent": 0.15,
+        "bcc_in_email": 0.12,
+        "usb_insertions": 0.06,
+        "files_accessed": 0.06,
+        "avg_email_size": 0.03,
+        "total_emails": 0.01,
+        "N": 0.07,
+        "C": 0.04,
+        "A": 0.02,
+        "O": 0.01,
+        "E": 0.01
+    }
+}
+
+# Production setting in make_model_repeated.py
+REFERENCE = {
+    "n_estimators": 200,
+    "max_samples": "auto",
+    "max_features": 1.0,
+    "weights": "none"
+}
+
+THRESHOLD_PERCENTILE = 5
+MAX_COPIES = 4          # split-selection multiplier for the heaviest feature
+
+# =====================================================
+# HELPERS
+# =====================================================
+
+def parse_max_samples(value):
+    if value == "auto":
+        return value
+    if "." in value:
+        return float(value)
+    return int(value)
+
+
+def weighted_matrix(X, feature_columns, weight_set):
+    # Multiplying a column is undone by StandardScaler, and IsolationForest is
+    # scale-invariant anyway. A weight only changes the model through how often
+    # the feature is picked for a split, so repeat heavier columns instead.
+    X_scaled = StandardScaler().fit_transform(X)
+    weights = WEIGHT_SETS[weight_set]
+    if not weights:
+        return X_scaled
+
+    top = max(weights.get(col, 0) for col in feature_columns)
+    copies = [
+        max(1, int(round(MAX_COPIES * weights.get(col, 0) / top)))
+        for col in feature_columns
+    ]
+    return np.repeat(X_scaled, copies, axis=1)
+
+
+def fit_and_score(config, X_scaled, seed):
+    model = IsolationForest(
+        n_estimators=config["n_estimators"],
+        max_samples=config["max_samples"],
+        max_features=config["max_features"],
+        contamination=0.05,
+        random_state=seed,
+        n_jobs=1
+    )
+
+    start = time.perf_counter()
+    model.fit(X_scaled)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = model.decision_function(X_scaled)
+    score_time = time.perf_counter() - start
+
+    flags = scores <= np.percentile(scores, THRESHOLD_PERCENTILE)
+    return fit_time, score_time, flags
+
+
+def run_config(config, X, feature_columns, seeds):
+    X_scaled = weighted_matrix(X, feature_columns, config["weights"])
+
+    fit_times, score_times, flag_sets = [], [], []
+    for seed in seeds:
+        fit_time, score_time, flags = fit_and_score(config, X_scaled, seed)
+        fit_times.append(fit_time)
+        score_times.append(score_time)
+        flag_sets.append(flags)
+
+    # Seed stability: mean pairwise Jaccard of the alert sets
+    pairs = list(itertools.combinations(flag_sets, 2))
+    stability = np.mean([alert_agreement(a, b) for a, b in pairs]) if pairs else 1.0
+
+    return {
+        **config,
+        "fit_time_s": np.median(fit_times),
+        "users_per_s": len(X) / np.median(score_times),
+        "seed_stability": stability,
+        "flags": flag_sets[0]
+    }
+
+# =====================================================
+# MAIN
+# =====================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel IsolationForest hyperparameter sweep")
+    parser.add_argument("--n-estimators", nargs="+", type=int, default=[50, 100, 200, 300])
+    parser.add_argument("--max-samples", nargs="+", type=parse_max_samples, default=["auto", 512, 1.0])
+    parser.add_argument("--max-features", nargs="+", type=float, default=[0.5, 1.0])
+    parser.add_argument("--weights", nargs="+", choices=list(WEIGHT_SETS), default=list(WEIGHT_SETS))
+    parser.add_argument("--seeds", type=int, default=3, help="fits per configuration for stability")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep_results.csv")
+    parser.add_argument("--workspace", default=None,
+                        help="directory holding the cumulatives (default: $WORKSPACE or .)")
+    args = parser.parse_args()
+
+    _, X, feature_columns = load_cumulative_matrix(workspace=args.workspace)
+    if len(X) == 0:
+        # engine.py archives and empties the cumulatives at month end
+        raise SystemExit("❌ No cumulative data to sweep; point --workspace at a month's cumulatives "
+                         "(e.g. workspaces/<month> from the dashboard retrain)")
+    print(f"✅ Loaded {len(X)} users × {len(feature_columns)} features")
+
+    configs = [
+        {"n_estimators": n, "max_samples": s, "max_features": f, "weights": w}
+        for n, s, f, w in itertools.product(
+            args.n_estimators, args.max_samples, args.max_features, args.weights
+        )
+    ]
+    if REFERENCE not in configs:
+        configs.append(dict(REFERENCE))
+
+    seeds = [42 + i for i in range(args.seeds)]
+
+    print(f"🚀 Sweeping {len(configs)} configurations on {args.workers} workers")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(
+            run_config,
+            configs,
+            itertools.repeat(X),
+            itertools.repeat(feature_columns),
+            itertools.repeat(seeds)
+        ))
+
+    reference_flags = next(
+        r["flags"] for r in results
+        if all(r[k] == v for k, v in REFERENCE.items())
+    )
+
+    for r in results:
+        r["overlap_vs_reference"] = alert_agreement(r.pop("flags"), reference_flags)
+
+    results_df = pd.DataFrame(results).sort_values("fit_time_s")
+    results_df.to_csv(args.output, index=False)
+
+    print("\n==============================")
+    print(results_df.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print("==============================\n")
+    print(f"✅ Results saved to {args.output}")